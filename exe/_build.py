@@ -136,6 +136,7 @@ def build_executable():
         '--noconfirm',
         f'--icon={LOGO_PATH}',
         '--add-data', f'{LOGO_PATH};.',  # 将 logo.png 添加到根目录
+        '--collect-submodules', 'pptx2png',  # 子模块由 __init__ 按需导入，PyInstaller 无法自动发现
         '--optimize', '2',
         '--version-file', str(version_file),
         str(MAIN_SCRIPT)
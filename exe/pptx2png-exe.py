@@ -25,7 +25,7 @@ from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QPushButton, QLabel, QComboBox, QScrollArea, QFileDialog,
     QDialog, QGridLayout, QFrame, QLineEdit, QStackedWidget,
-    QRadioButton, QButtonGroup
+    QRadioButton, QButtonGroup, QCheckBox
 )
 from PyQt6.QtCore import Qt, QThread, pyqtSignal, QUrl
 from PyQt6.QtGui import QPixmap, QIcon, QColor, QDesktopServices, QPainter, QPainterPath
@@ -69,7 +69,8 @@ LANG_TEXTS: dict[str, dict[str, str]] = {
         'output_path_ph': '输出路径...',
         'language': '语言',
         'lang_zh': '中文',
-        'lang_en': 'English'
+        'lang_en': 'English',
+        'contact_sheet': '同时生成总览图'
     },
     'en': {
         'title': 'pptx2png',
@@ -106,7 +107,8 @@ LANG_TEXTS: dict[str, dict[str, str]] = {
         'output_path_ph': 'Output path...',
         'language': 'Language',
         'lang_zh': '中文',
-        'lang_en': 'English'
+        'lang_en': 'English',
+        'contact_sheet': 'Also save an overview image'
     }
 }
 
@@ -210,6 +212,26 @@ GLOBAL_STYLESHEET: str = f"""
     QRadioButton:hover {{
         color: {COLOR_PPT_ORANGE};
     }}
+
+    QCheckBox {{
+        spacing: 8px;
+        color: {COLOR_TEXT_MAIN};
+        background: transparent;
+    }}
+    QCheckBox::indicator {{
+        width: 14px;
+        height: 14px;
+        border-radius: 3px;
+        border: 2px solid {BORDER_COLOR};
+        background: white;
+    }}
+    QCheckBox::indicator:checked {{
+        border: 2px solid {COLOR_PPT_ORANGE};
+        background: {COLOR_PPT_ORANGE};
+    }}
+    QCheckBox:hover {{
+        color: {COLOR_PPT_ORANGE};
+    }}
     
     QScrollArea {{ 
         border: none; 
@@ -295,35 +317,6 @@ MODERN_COMBOBOX_STYLE: str = f"""
 """
 
 
-# ==================== 工具函数 ====================
-
-def merge_ranges(indices: list[int]) -> list[list[int]]:
-    r"""
-    将索引列表合并为连续范围列表
-    
-    :param indices: 索引列表, 如 [1, 2, 3, 5, 6, 8]
-    :return list[list[int]]: 范围列表, 如 [[1, 3], [5, 6], [8, 8]]
-    """
-    if not indices:
-        return []
-    
-    sorted_indices: list[int] = sorted(set(indices))
-    ranges: list[list[int]] = []
-    start: int = sorted_indices[0]
-    end: int = sorted_indices[0]
-    
-    for i in range(1, len(sorted_indices)):
-        if sorted_indices[i] == end + 1:
-            end = sorted_indices[i]
-        else:
-            ranges.append([start, end])
-            start = sorted_indices[i]
-            end = sorted_indices[i]
-    
-    ranges.append([start, end])
-    return ranges
-
-
 # ==================== 自定义对话框 ====================
 
 class CustomMessageDialog(QDialog):
@@ -629,7 +622,7 @@ class LoadThread(QThread):
 
 class ExportThread(QThread):
     r"""
-    导出图片的工作线程, 支持合并连续范围优化
+    导出图片的工作线程, 所有选中的幻灯片在一次打开中导出
     """
     
     progress: pyqtSignal = pyqtSignal(int, int)
@@ -640,7 +633,8 @@ class ExportThread(QThread):
         ppt_path: str,
         indices: list[int],
         out_dir: str,
-        scale: int
+        scale: int,
+        previews: list[tuple[int, str]] | None = None
     ) -> None:
         r"""
         初始化导出线程
@@ -649,12 +643,14 @@ class ExportThread(QThread):
         :param indices: 要导出的幻灯片索引列表
         :param out_dir: 输出目录
         :param scale: 导出倍率, 0表示使用显示倍率
+        :param previews: 可选, (幻灯片编号, 预览图路径) 列表, 用于生成总览图
         """
         super().__init__()
         self.ppt_path: str = ppt_path
         self.indices: list[int] = indices
         self.out_dir: str = out_dir
         self.scale: int = scale
+        self.previews: list[tuple[int, str]] | None = previews
 
     def run(self) -> None:
         r"""
@@ -666,24 +662,36 @@ class ExportThread(QThread):
                 raise ImportError("pptx2png library not found!")
 
             total: int = len(self.indices)
-            count: int = 0
-            
-            ranges: list[list[int]] = merge_ranges(self.indices)
+            done: list[int] = [0]
             lib_scale: int | None = self.scale if self.scale > 0 else None
             
-            for slide_range in ranges:
-                pptx2png.topng(
-                    pptx=self.ppt_path,
-                    output_dir=self.out_dir,
-                    slide_range=slide_range,
-                    scale=lib_scale
+            def on_slide(slide: int, status: str) -> None:
+                done[0] += 1
+                self.progress.emit(done[0], total)
+            
+            result: Any = pptx2png.topng(
+                pptx=self.ppt_path,
+                output_dir=self.out_dir,
+                slides=self.indices,
+                scale=lib_scale,
+                progress=on_slide
+            )
+            
+            if result is None or result.error:
+                raise RuntimeError(result.error if result else "Invalid export arguments")
+            if result.failed:
+                raise RuntimeError(
+                    "; ".join(f"{i}: {reason}" for i, reason in sorted(result.failed.items()))
                 )
-                
-                range_count: int = slide_range[1] - slide_range[0] + 1
-                count += range_count
-                self.progress.emit(count, total)
             
-            self.finished.emit(True, self.out_dir, count)
+            if self.previews:
+                # 复用加载时生成的预览图, 无需再次读取导出的大图
+                pptx2png.make_contact_sheet(
+                    self.previews,
+                    os.path.join(self.out_dir, "contact_sheet.png")
+                )
+            
+            self.finished.emit(True, self.out_dir, len(result.saved))
             
         except Exception as e:
             import traceback
@@ -1051,6 +1059,10 @@ class Sidebar(QWidget):
         self.combo_scale.setCurrentIndex(0)
         self.layout.addWidget(self.combo_scale)
         
+        self.chk_contact_sheet: QCheckBox = QCheckBox()
+        self.chk_contact_sheet.setCursor(Qt.CursorShape.PointingHandCursor)
+        self.layout.addWidget(self.chk_contact_sheet)
+        
         self.layout.addStretch()
     
     def _setup_action_section(self) -> None:
@@ -1104,6 +1116,7 @@ class Sidebar(QWidget):
         self.lbl_output.setText(t['output_to'])
         self.btn_browse.setText(t['browse'])
         self.lbl_scale.setText(t['scale'])
+        self.chk_contact_sheet.setText(t['contact_sheet'])
         self.btn_all.setText(t['select_all'])
         self.btn_none.setText(t['select_none'])
         self.entry_out_dir.setPlaceholderText(t['output_path_ph'])
@@ -1623,11 +1636,18 @@ class MainWindow(QMainWindow):
         self.sidebar.btn_export.setEnabled(False)
         self.sidebar.btn_export.setText(t['exporting'])
         
+        previews: list[tuple[int, str]] | None = None
+        if self.sidebar.chk_contact_sheet.isChecked():
+            previews = [
+                (c.info['index'], c.info['path']) for c in self.cards if c.info['selected']
+            ]
+        
         self.exporter = ExportThread(
             self.ppt_data['path'],
             indices,
             out_dir,
-            scale
+            scale,
+            previews
         )
         self.exporter.progress.connect(
             lambda c, tot: self.sidebar.btn_export.setText(f"{c} / {tot}")
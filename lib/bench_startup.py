@@ -0,0 +1,58 @@
+"""
+bench_startup.py
+
+Measures how long "import pptx2png" takes in a fresh interpreter, using
+python -X importtime, and checks that the import stays free of COM.
+
+Usage: python bench_startup.py [runs]
+"""
+
+import os
+import sys
+import subprocess
+
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+HERE = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ("win32com", "pythoncom", "pywintypes", "ctypes")
+
+PROBE = (
+    "import sys, pptx2png; "
+    "print(','.join(m for m in %r if m in sys.modules))" % (HEAVY_MODULES,)
+)
+
+
+def run_once():
+    env = dict(os.environ, PYTHONPATH=HERE + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == "pptx2png":
+            total_us = int(parts[1].strip())
+    return total_us, proc.stdout.strip()
+
+
+def main():
+    samples = []
+    loaded = ""
+    for _ in range(RUNS):
+        total_us, loaded = run_once()
+        samples.append(total_us)
+    samples.sort()
+    print("import pptx2png over %d runs:" % RUNS)
+    print("  median : %.2f ms" % (samples[len(samples) // 2] / 1000.0))
+    print("  min    : %.2f ms" % (samples[0] / 1000.0))
+    print("  max    : %.2f ms" % (samples[-1] / 1000.0))
+    if loaded:
+        print("FAIL: import pulled in %s" % loaded)
+        return 1
+    print("OK: no COM or ctypes modules loaded at import time")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,36 @@
 """__init__.py"""
 
-from .pptx2png import topng, whatis
+import importlib
 
-__all__ = ['topng', 'whatis']
\ No newline at end of file
+# Public names and the submodule that defines them. Submodules are imported
+# on first attribute access, so "import pptx2png" loads neither COM nor the
+# export machinery.
+_EXPORTS = {
+    'topng': '.pptx2png',
+    'whatis': '.pptx2png',
+    'ExportResult': '.pptx2png',
+    'read_manifest': '.manifest',
+    'RetryPolicy': '.retry',
+    'BackendUnavailableError': '.session',
+    'WorkerPool': '.workers',
+    'RenderCache': '.cache',
+    'CostModel': '.cost',
+    'make_contact_sheet': '.contact',
+    'make_animation': '.animate',
+    'slide_text': '.text',
+    'slide_shapes': '.shapes',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError("module 'pptx2png' has no attribute '%s'" % name)
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
\ No newline at end of file
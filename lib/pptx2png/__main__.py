@@ -0,0 +1,59 @@
+"""__main__.py"""
+
+import sys
+import argparse
+
+from .pptx2png import topng
+
+
+def main(argv=None):
+    """
+    Command line: python -m pptx2png deck.pptx [options]
+
+    Returns:
+        int: 0 if every slide was exported, 1 otherwise.
+    """
+    parser = argparse.ArgumentParser(prog="python -m pptx2png",
+                                     description="Convert PowerPoint slides to PNG images.")
+    parser.add_argument("pptx")
+    parser.add_argument("-o", "--output-dir", default="./output")
+    parser.add_argument("--slides", help='selection such as "1-5,8,section:Appendix"')
+    parser.add_argument("--skip-hidden", action="store_true")
+    parser.add_argument("--scale", type=int)
+    parser.add_argument("--resume", action="store_true",
+                        help="skip slides the manifest shows as already exported")
+    parser.add_argument("--dedupe", action="store_true", help="render identical slides once")
+    parser.add_argument("--pdf", nargs="?", const=True, metavar="PATH",
+                        help="also save a PDF in the same open")
+    parser.add_argument("--downsample", action="store_true",
+                        help="render from a copy with photos shrunk to the displayed size")
+    parser.add_argument("--lightweight-open", action="store_true",
+                        help="render from a copy without video, audio and OLE payloads")
+    parser.add_argument("--font-substitutions", metavar="JSON",
+                        help='font map file such as {"Helvetica": "Arial"}')
+    parser.add_argument("--notes-pages", action="store_true",
+                        help="also export Notes_N.png for every slide")
+    parser.add_argument("--handouts", type=int, choices=(3, 6),
+                        help="also write handout pages with 3 or 6 slides each")
+    parser.add_argument("--extract-text", action="store_true",
+                        help="also write Slide_N.text.json with titles, text and notes")
+    parser.add_argument("--shape-map", action="store_true",
+                        help="also write Slide_N.shapes.json with shape and link boxes in pixels")
+    parser.add_argument("--slide-timeout", type=float, metavar="SECONDS")
+    parser.add_argument("--profile", nargs="?", const=True, metavar="PATH",
+                        help="write a performance report (default: output_dir/profile.json)")
+    args = parser.parse_args(argv)
+
+    result = topng(args.pptx, output_dir=args.output_dir, slides=args.slides,
+                   skip_hidden=args.skip_hidden, scale=args.scale, resume=args.resume,
+                   dedupe=args.dedupe, pdf=args.pdf, slide_timeout=args.slide_timeout,
+                   profile=args.profile, downsample=args.downsample,
+                   lightweight_open=args.lightweight_open,
+                   font_substitutions=args.font_substitutions,
+                   notes_pages=args.notes_pages, handouts=args.handouts,
+                   extract_text=args.extract_text, shape_map=args.shape_map)
+    return 0 if result is not None and result.ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,413 @@
+"""animate.py"""
+
+import io
+import os
+import zlib
+import queue
+import shutil
+import struct
+import threading
+import subprocess
+
+from .imaging import load_pillow
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# Output extension -> encoder family
+FORMATS = {
+    ".png": "apng", ".apng": "apng",
+    ".gif": "gif", ".webp": "webp",
+    ".mp4": "video", ".mov": "video", ".mkv": "video", ".webm": "video",
+}
+
+DEFAULT_FRAME_DURATION = 2.0
+# Frames waiting for the encoder; rendering pauses when the encoder falls this far behind
+DEFAULT_BUFFER = 4
+# Frame period used for ffmpeg when the durations are not known up front
+DEFAULT_TICK_MS = 100
+
+_FFMPEG_ARGS = {
+    ".mp4": ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-movflags", "+faststart"],
+    ".mov": ["-c:v", "libx264", "-pix_fmt", "yuv420p"],
+    ".mkv": ["-c:v", "libx264", "-pix_fmt", "yuv420p"],
+    ".webm": ["-c:v", "libvpx-vp9", "-pix_fmt", "yuv420p"],
+    ".webp": ["-c:v", "libwebp_anim", "-quality", "90"],
+    ".gif": [],
+}
+
+
+def find_ffmpeg():
+    """Path of the ffmpeg executable (PPTX2PNG_FFMPEG or PATH), or None."""
+    return os.getenv("PPTX2PNG_FFMPEG") or shutil.which("ffmpeg")
+
+
+def _png_chunks(data):
+    """Yield (type, body) for every chunk of a PNG file."""
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError("Animation frames must be PNG images.")
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        yield kind, data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+
+
+def _chunk(kind, body):
+    return (struct.pack(">I", len(body)) + kind + body +
+            struct.pack(">I", zlib.crc32(kind + body) & 0xFFFFFFFF))
+
+
+def _delay(ms):
+    """APNG frame delay as a (numerator, denominator) pair of 16-bit values."""
+    ms = max(0, int(round(ms)))
+    if ms % 1000 == 0 and ms // 1000 <= 0xFFFF:
+        return ms // 1000, 1
+    if ms <= 0xFFFF:
+        return ms, 1000
+    return min(0xFFFF, int(round(ms / 100.0))), 10
+
+
+class ApngEncoder(object):
+    """
+    Animated PNG built directly from the PNG files of the frames.
+
+    Nothing is decoded: the compressed image data of each frame is copied
+    into the animation as-is (IDAT chunks re-labelled as fdAT), so adding a
+    frame costs about as much as copying the file. All frames must share
+    the size and pixel format of the first one, which holds for the slides
+    of one export.
+
+    Args:
+        path (str): Output file.
+        loop (int): Number of plays; 0 loops forever.
+    """
+
+    def __init__(self, path, loop=0):
+        self.path = path
+        self.loop = loop
+        self.frames = 0
+        self._file = None
+        self._header = None
+        self._sequence = 0
+        self._actl_offset = None
+
+    def add(self, data, duration_ms):
+        chunks = list(_png_chunks(data))
+        header = chunks[0][1]
+        palette = [body for kind, body in chunks if kind in (b"PLTE", b"tRNS")]
+        if self._file is None:
+            self._start(chunks, header, palette)
+        elif (header, palette) != self._header:
+            raise ValueError("All frames of an APNG need the same size and pixel format.")
+        width, height = struct.unpack(">II", header[:8])
+        numerator, denominator = _delay(duration_ms)
+        self._write(b"fcTL", struct.pack(">IIIIIHHBB", self._next(), width, height, 0, 0,
+                                         numerator, denominator, 0, 0))
+        for kind, body in chunks:
+            if kind != b"IDAT":
+                continue
+            if self.frames == 0:
+                # The first frame doubles as the static image for viewers without APNG support
+                self._write(b"IDAT", body)
+            else:
+                self._write(b"fdAT", struct.pack(">I", self._next()) + body)
+        self.frames += 1
+
+    def _start(self, chunks, header, palette):
+        self._header = (header, palette)
+        self._file = open(self.path, "wb")
+        self._file.write(PNG_SIGNATURE)
+        self._write(b"IHDR", header)
+        # Frame count is patched in close(), once it is known
+        self._actl_offset = self._file.tell()
+        self._write(b"acTL", struct.pack(">II", 0, self.loop))
+        for kind, body in chunks[1:]:
+            if kind in (b"IDAT", b"IEND"):
+                break
+            if kind not in (b"acTL", b"fcTL"):
+                # Colour information: PLTE, tRNS, gAMA, sRGB, iCCP, pHYs...
+                self._write(kind, body)
+
+    def _next(self):
+        self._sequence += 1
+        return self._sequence - 1
+
+    def _write(self, kind, body):
+        self._file.write(_chunk(kind, body))
+
+    def close(self):
+        if self._file is None:
+            raise ValueError("An animation needs at least one frame.")
+        self._write(b"IEND", b"")
+        self._file.seek(self._actl_offset)
+        self._write(b"acTL", struct.pack(">II", self.frames, self.loop))
+        self._file.close()
+        self._file = None
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class FfmpegEncoder(object):
+    """
+    Any format ffmpeg can write (MP4, WebM, GIF, WebP), fed through a pipe.
+
+    The PNG frames are piped to ffmpeg unchanged (image2pipe) at a fixed frame
+    rate of one frame per tick, and a frame is repeated to cover its
+    duration. When the tick is the greatest common divisor of all slide
+    durations, that is usually one frame per slide.
+
+    Args:
+        path (str): Output file; the extension selects the codec.
+        loop (int): Number of plays for GIF/WebP; 0 loops forever.
+        tick_ms (int): Frame period in milliseconds.
+        ffmpeg (str): Optional. Executable. Default: find_ffmpeg().
+    """
+
+    def __init__(self, path, loop=0, tick_ms=DEFAULT_TICK_MS, ffmpeg=None):
+        executable = ffmpeg or find_ffmpeg()
+        if not executable:
+            raise RuntimeError("ffmpeg was not found. Install it and add it to PATH, "
+                               "set PPTX2PNG_FFMPEG, or use an .apng output.")
+        extension = os.path.splitext(path)[1].lower()
+        self.path = path
+        self.tick_ms = max(1, int(tick_ms))
+        self.frames = 0
+        args = [executable, "-hide_banner", "-loglevel", "error", "-y",
+                "-f", "image2pipe", "-c:v", "png", "-framerate", "1000/%d" % self.tick_ms,
+                "-i", "-"]
+        args += _FFMPEG_ARGS.get(extension, [])
+        if extension in (".mp4", ".mov", ".mkv", ".webm"):
+            # yuv420p needs even dimensions
+            args += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2"]
+        if extension in (".gif", ".webp"):
+            args += ["-loop", str(loop)]
+        self._process = subprocess.Popen(args + [path], stdin=subprocess.PIPE,
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def add(self, data, duration_ms):
+        repeats = max(1, int(round(duration_ms / float(self.tick_ms))))
+        try:
+            for _ in range(repeats):
+                self._process.stdin.write(data)
+        except (BrokenPipeError, OSError):
+            self._fail()
+        self.frames += 1
+
+    def close(self):
+        try:
+            self._process.stdin.close()
+        except OSError:
+            pass
+        errors = self._process.stderr.read()
+        if self._process.wait() != 0:
+            raise RuntimeError("ffmpeg failed: %s" % errors.decode("utf-8", "replace").strip())
+
+    def abort(self):
+        if self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+
+    def _fail(self):
+        self._process.kill()
+        errors = self._process.stderr.read()
+        raise RuntimeError("ffmpeg stopped: %s" % errors.decode("utf-8", "replace").strip())
+
+
+class PillowEncoder(object):
+    """
+    GIF or WebP animation through Pillow, used when ffmpeg is not available.
+
+    Pillow pulls the frames one by one while it encodes. WebP keeps only the
+    encoded frames; GIF keeps every palettized frame until the end, so prefer
+    ffmpeg or APNG for long decks at high resolution.
+
+    Args:
+        path (str): Output file (.gif or .webp).
+        loop (int): Number of plays; 0 loops forever.
+    """
+
+    def __init__(self, path, loop=0):
+        self._Image = load_pillow()
+        self.path = path
+        self.loop = loop
+        self.frames = 0
+
+    def run(self, frames):
+        """Encode frames, an iterator of (png_bytes, duration_ms) pairs."""
+        durations = []
+
+        def images():
+            for data, duration_ms in frames:
+                image = self._Image.open(io.BytesIO(data))
+                image.load()
+                # Pillow reads duration[n] only after frame n has been pulled
+                durations.append(int(round(duration_ms)))
+                self.frames += 1
+                yield image.convert("RGBA")
+
+        stream = images()
+        first = next(stream, None)
+        if first is None:
+            raise ValueError("An animation needs at least one frame.")
+        first.save(self.path, save_all=True, append_images=stream, duration=durations,
+                   loop=self.loop, disposal=1)
+
+
+class AnimationWriter(object):
+    """
+    Streams frames into an animation while the slides are still rendering.
+
+    Frames go through a bounded queue to an encoder thread, so encoding
+    overlaps with rendering and at most `buffer` frames wait in memory. The
+    encoder is chosen from the file extension: native APNG for .png/.apng,
+    ffmpeg (or Pillow, if ffmpeg is missing) for .gif/.webp, and ffmpeg for
+    .mp4/.mov/.mkv/.webm.
+
+    Args:
+        path (str): Output file.
+        loop (int): Number of plays; 0 loops forever (ignored by video formats).
+        tick_ms (int): Frame period for ffmpeg; pass the greatest common divisor
+                       of the frame durations to avoid duplicate frames.
+        buffer (int): Maximum frames waiting for the encoder.
+    """
+
+    def __init__(self, path, loop=0, tick_ms=DEFAULT_TICK_MS, buffer=DEFAULT_BUFFER):
+        extension = os.path.splitext(path)[1].lower()
+        kind = FORMATS.get(extension)
+        if kind is None:
+            raise ValueError("Unsupported animation format '%s', use one of: %s." % (
+                extension, ", ".join(sorted(FORMATS))))
+        if kind == "apng":
+            self._encoder = ApngEncoder(path, loop)
+        elif kind == "video" or find_ffmpeg():
+            self._encoder = FfmpegEncoder(path, loop, tick_ms)
+        else:
+            self._encoder = PillowEncoder(path, loop)
+        self.path = path
+        self._queue = queue.Queue(maxsize=max(1, buffer))
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="pptx2png-animation")
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def frames(self):
+        return self._encoder.frames
+
+    def add(self, data, duration):
+        """
+        Queue one frame. Blocks while the buffer is full.
+
+        Args:
+            data (bytes): PNG file contents.
+            duration (float): Seconds to show the frame.
+        """
+        self._check()
+        self._queue.put((data, duration * 1000.0))
+
+    def _frames(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            yield item
+
+    def _run(self):
+        try:
+            if isinstance(self._encoder, PillowEncoder):
+                self._encoder.run(self._frames())
+            else:
+                for data, duration_ms in self._frames():
+                    self._encoder.add(data, duration_ms)
+                self._encoder.close()
+        except Exception as e:
+            self._error = e
+            if hasattr(self._encoder, "abort"):
+                self._encoder.abort()
+            # Keep draining so that producers never block on a dead encoder
+            for _ in self._frames():
+                pass
+
+    def _check(self):
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """Flush the queue and finish the file. Raises the encoder's error, if any."""
+        self._queue.put(None)
+        self._thread.join()
+        self._check()
+
+
+def frame_durations(spec, indices):
+    """
+    Seconds per slide from a duration option.
+
+    Args:
+        spec: A number for every slide, a dict of slide number -> seconds
+              (missing slides get the default), a list aligned with indices,
+              or None for the default.
+        indices (list): Slide numbers in output order.
+
+    Returns:
+        dict: Slide number -> seconds.
+    """
+    if spec is None:
+        return dict((i, DEFAULT_FRAME_DURATION) for i in indices)
+    if isinstance(spec, (int, float)):
+        return dict((i, float(spec)) for i in indices)
+    if isinstance(spec, dict):
+        return dict((i, float(spec.get(i, DEFAULT_FRAME_DURATION))) for i in indices)
+    spec = list(spec)
+    if len(spec) != len(indices):
+        raise ValueError("Expected %d frame durations, got %d." % (len(indices), len(spec)))
+    return dict((i, float(d)) for i, d in zip(indices, spec))
+
+
+def tick_for(durations):
+    """Largest frame period (ms) that divides every duration."""
+    tick = 0
+    for seconds in durations:
+        tick = _gcd(tick, max(1, int(round(seconds * 1000))))
+    return tick or DEFAULT_TICK_MS
+
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
+
+
+def make_animation(images, path, durations=None, loop=0):
+    """
+    Assemble existing PNG files into an animation.
+
+    Args:
+        images (list): PNG paths in order.
+        path (str): Output file; see AnimationWriter for the formats.
+        durations: Seconds per frame, as for frame_durations() (list aligned with images).
+        loop (int): Number of plays; 0 loops forever.
+
+    Returns:
+        str: The output path.
+    """
+    numbers = list(range(1, len(images) + 1))
+    seconds = frame_durations(durations, numbers)
+    partial = path + ".partial" + os.path.splitext(path)[1]
+    writer = AnimationWriter(partial, loop, tick_for(seconds.values()))
+    try:
+        try:
+            for n, image_path in zip(numbers, images):
+                with open(image_path, "rb") as f:
+                    writer.add(f.read(), seconds[n])
+        finally:
+            writer.close()
+    except Exception:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    os.replace(partial, path)
+    return path
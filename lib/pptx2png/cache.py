@@ -0,0 +1,167 @@
+"""cache.py"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+from .filelock import FileLock
+
+# Bump when the rendering pipeline changes in a way that invalidates old entries
+CACHE_VERSION = 3
+
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+def render_key(fingerprint, width, height, filter_name="PNG", options=None):
+    """
+    Cache key of one render: slide content plus everything that shapes the output.
+
+    Args:
+        fingerprint (str): Slide fingerprint from ooxml.slide_fingerprints(). It
+                           carries the day for slides with a date field, so
+                           their renders are not served on another day.
+        width (int): Output width in pixels.
+        height (int): Output height in pixels.
+        filter_name (str): Export format.
+        options (dict): Optional. Job options that change the rendered pixels
+                        without changing the deck, such as a font substitution
+                        map or a pre-flight copy. Must be JSON-serializable.
+                        Empty values are ignored.
+
+    Returns:
+        str: Hex digest.
+
+    Raises:
+        ValueError: If the slide has no fingerprint, e.g. because it shows the
+                    time of day; such slides must always be rendered.
+    """
+    if not fingerprint:
+        raise ValueError("Slides without a fingerprint cannot be cached.")
+    seed = "v%d|%s|%dx%d|%s" % (CACHE_VERSION, fingerprint, width, height, filter_name.upper())
+    options = dict((k, v) for k, v in (options or {}).items() if v)
+    if options:
+        seed += "|" + json.dumps(options, sort_keys=True, ensure_ascii=True)
+    return hashlib.sha256(seed.encode("ascii")).hexdigest()
+
+
+class RenderCache(object):
+    """
+    On-disk store of rendered slides, shared between decks and processes.
+
+    Entries are keyed on normalized slide content (see render_key()), so a
+    title slide rendered for one deck is reused for any other deck built from
+    the same template, at the same size and format. Entries are written to a
+    temporary file and renamed into place, so readers never see partial
+    files. A hit refreshes the entry's mtime, which drives LRU eviction once
+    the store grows past max_bytes. Entries older than ttl are dropped.
+
+    Args:
+        root (str): Cache directory. Created if missing.
+        max_bytes (int): Optional. Size cap. Default 2 GiB; None disables the cap.
+        ttl (float): Optional. Seconds an entry stays valid after its last use.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES, ttl=None):
+        self.root = os.path.abspath(root)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._objects = os.path.join(self.root, "objects")
+        self._tmp = os.path.join(self.root, "tmp")
+        for path in (self._objects, self._tmp):
+            if not os.path.isdir(path):
+                os.makedirs(path, exist_ok=True)
+        self._size_estimate = None
+
+    def _path(self, key):
+        return os.path.join(self._objects, key[:2], key + ".png")
+
+    def get(self, key, target_path):
+        """
+        Copy a cached render to target_path.
+
+        Returns:
+            bool: True on a hit, False if the entry is missing or expired.
+        """
+        path = self._path(key)
+        try:
+            if self.ttl and time.time() - os.path.getmtime(path) > self.ttl:
+                self.misses += 1
+                return False
+            # Copy rather than link, so that later edits of an output never reach the cache
+            shutil.copyfile(path, target_path)
+            os.utime(path, None)
+        except OSError:
+            # Missing, or evicted by another process in the meantime
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def put(self, key, source_path):
+        """Store a finished render under key."""
+        path = self._path(key)
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self._tmp, suffix=".png")
+        os.close(fd)
+        try:
+            shutil.copyfile(source_path, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        if self.max_bytes:
+            if self._size_estimate is None:
+                self._size_estimate = self.size()
+            else:
+                self._size_estimate += os.path.getsize(path)
+            if self._size_estimate > self.max_bytes:
+                self.evict()
+
+    def size(self):
+        """Total bytes currently stored."""
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """
+        Drop expired entries, then least recently used ones until under max_bytes.
+
+        Runs under a lock so that concurrent workers do not evict twice.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        removed = 0
+        with FileLock(os.path.join(self.root, "evict")):
+            now = time.time()
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            for path, size, mtime in entries:
+                expired = self.ttl and now - mtime > self.ttl
+                if not expired and (not self.max_bytes or total <= self.max_bytes):
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            self._size_estimate = total
+        return removed
+
+    def _entries(self):
+        for folder, _, names in os.walk(self._objects):
+            for name in names:
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
@@ -0,0 +1,270 @@
+"""contact.py"""
+
+import os
+import zlib
+import struct
+
+from .imaging import load_pillow
+
+CONTACT_SHEET_NAME = "contact_sheet.png"
+
+DEFAULT_COLUMNS = 3
+DEFAULT_THUMB_WIDTH = 320
+DEFAULT_PADDING = 16
+LABEL_HEIGHT = 22
+
+BACKGROUND = (243, 243, 243)
+PLACEHOLDER = (220, 220, 220)
+LABEL_COLOR = (45, 45, 45)
+
+# Compressed bytes collected before an IDAT chunk is written
+_IDAT_SIZE = 1 << 16
+
+
+def _chunk(kind, data):
+    return (struct.pack(">I", len(data)) + kind + data +
+            struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+
+class PngStreamWriter(object):
+    """
+    Writes an 8-bit RGB PNG whose size is known up front, a band of rows at a time.
+
+    Pillow can only save an image it holds completely in memory; this writer
+    keeps only the zlib state and the pending compressed bytes, so a very
+    tall image costs no more memory than one band of it.
+
+    Args:
+        path (str): Output file.
+        width (int): Image width in pixels.
+        height (int): Image height in pixels.
+    """
+
+    def __init__(self, path, width, height):
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._stride = width * 3
+        self._zlib = zlib.compressobj(6)
+        self._pending = []
+        self._pending_size = 0
+        self._file = open(path, "wb")
+        self._file.write(b"\x89PNG\r\n\x1a\n")
+        self._file.write(_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+
+    def write_rows(self, data):
+        """
+        Append rows of raw RGB pixels.
+
+        Args:
+            data (bytes): A whole number of rows, width * 3 bytes each.
+        """
+        rows = len(data) // self._stride
+        if rows * self._stride != len(data):
+            raise ValueError("Row data is not a multiple of the image width.")
+        if self.rows_written + rows > self.height:
+            raise ValueError("More rows than the image height.")
+        self._feed(_with_filter_bytes(data, rows, self._stride))
+        self.rows_written += rows
+
+    def _feed(self, raw):
+        compressed = self._zlib.compress(raw)
+        if compressed:
+            self._pending.append(compressed)
+            self._pending_size += len(compressed)
+        if self._pending_size >= _IDAT_SIZE:
+            self._flush_idat()
+
+    def _flush_idat(self):
+        if self._pending:
+            self._file.write(_chunk(b"IDAT", b"".join(self._pending)))
+        self._pending = []
+        self._pending_size = 0
+
+    def close(self):
+        """Finish the image. Raises ValueError if rows are missing."""
+        if self._file is None:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError("Image has %d of %d rows." % (self.rows_written, self.height))
+            self._pending.append(self._zlib.flush())
+            self._pending_size += len(self._pending[-1])
+            self._flush_idat()
+            self._file.write(_chunk(b"IEND", b""))
+        finally:
+            self._file.close()
+            self._file = None
+
+
+def _with_filter_bytes(data, rows, stride):
+    """Prefix every scanline with PNG filter type 0 (None)."""
+    try:
+        import numpy
+    except ImportError:
+        return b"".join(b"\x00" + data[r * stride:(r + 1) * stride] for r in range(rows))
+    # One vectorized copy instead of a Python loop over the rows
+    out = numpy.zeros((rows, stride + 1), dtype=numpy.uint8)
+    out[:, 1:] = numpy.frombuffer(data, dtype=numpy.uint8).reshape(rows, stride)
+    return out.tobytes()
+
+
+class ContactSheet(object):
+    """
+    Overview grid of slide thumbnails, written row by row as slides arrive.
+
+    The number of cells and the slide aspect ratio are known before
+    rendering starts, so the final image size is fixed up front. Cells must
+    be added in order; whenever a row is complete it is compressed and
+    written out, so memory stays at one row of thumbnails even for decks
+    with hundreds of slides.
+
+    Args:
+        path (str): Output PNG file.
+        count (int): Number of cells.
+        slide_width (int): Slide width (any unit), for the aspect ratio.
+        slide_height (int): Slide height, same unit.
+        columns (int): Thumbnails per row. Default 3, like the GUI grid.
+        thumb_width (int): Thumbnail width in pixels.
+        padding (int): Gap around and between cells in pixels.
+        labels (bool): Draw "Slide N" under every thumbnail.
+    """
+
+    def __init__(self, path, count, slide_width, slide_height, columns=DEFAULT_COLUMNS,
+                 thumb_width=DEFAULT_THUMB_WIDTH, padding=DEFAULT_PADDING, labels=True):
+        self._Image = load_pillow()
+        from PIL import ImageDraw
+        self._ImageDraw = ImageDraw
+
+        self.path = path
+        self.count = count
+        self.columns = max(1, min(columns, count or 1))
+        self.thumb_w = thumb_width
+        self.thumb_h = max(1, int(round(thumb_width * float(slide_height) / slide_width)))
+        self.padding = padding
+        self.label_h = LABEL_HEIGHT if labels else 0
+        self.rows = (count + self.columns - 1) // self.columns if count else 1
+
+        self.cell_h = self.thumb_h + self.label_h
+        self.width = self.columns * self.thumb_w + (self.columns + 1) * padding
+        self.height = self.rows * (self.cell_h + padding) + padding
+        self.added = 0
+        self._strip = None
+        self._writer = PngStreamWriter(path, self.width, self.height)
+        self._write_blank(padding)
+
+    def add(self, label, image_path=None):
+        """
+        Place the next thumbnail.
+
+        Args:
+            label: Text under the cell, e.g. the slide number.
+            image_path (str): Image to show. None leaves an empty placeholder,
+                              for example for a slide that failed to render.
+        """
+        if self.added >= self.count:
+            raise ValueError("Contact sheet already has %d cells." % self.count)
+        column = self.added % self.columns
+        if column == 0:
+            self._strip = self._Image.new("RGB", (self.width, self.cell_h + self.padding),
+                                          BACKGROUND)
+        x = self.padding + column * (self.thumb_w + self.padding)
+        if image_path:
+            thumb = self._thumbnail(image_path)
+            self._strip.paste(thumb, (x + (self.thumb_w - thumb.size[0]) // 2,
+                                      (self.thumb_h - thumb.size[1]) // 2))
+        else:
+            self._strip.paste(PLACEHOLDER, (x, 0, x + self.thumb_w, self.thumb_h))
+        if self.label_h:
+            draw = self._ImageDraw.Draw(self._strip)
+            text = label if isinstance(label, str) else "Slide %s" % label
+            left, top, right, bottom = draw.textbbox((0, 0), text)
+            draw.text((x + (self.thumb_w - (right - left)) // 2,
+                       self.thumb_h + (self.label_h - (bottom - top)) // 2 - top),
+                      text, fill=LABEL_COLOR)
+        self.added += 1
+        if column == self.columns - 1:
+            self._flush_strip()
+
+    def _thumbnail(self, image_path):
+        with self._Image.open(image_path) as img:
+            # JPEG previews decode directly at a reduced size
+            img.draft("RGB", (self.thumb_w, self.thumb_h))
+            # reducing_gap lets Pillow shrink by an integer factor before the final resample
+            img.thumbnail((self.thumb_w, self.thumb_h), self._Image.BICUBIC, reducing_gap=2.0)
+            return img.convert("RGB")
+
+    def _flush_strip(self):
+        if self._strip is not None:
+            self._writer.write_rows(self._strip.tobytes())
+            self._strip = None
+
+    def _write_blank(self, rows):
+        if rows:
+            self._writer.write_rows(bytes(bytearray(BACKGROUND)) * (self.width * rows))
+
+    def close(self):
+        """Fill any missing cells with placeholders and finish the file."""
+        if self._writer is None:
+            return
+        while self.added < self.count:
+            self.add("", None)
+        self._flush_strip()
+        if self.count == 0:
+            self._write_blank(self.height - self._writer.rows_written)
+        self._writer.close()
+        self._writer = None
+
+    def abort(self):
+        """Stop writing and delete the partial file."""
+        if self._writer is not None:
+            try:
+                self._writer._file.close()
+            finally:
+                self._writer = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def make_contact_sheet(images, path, columns=DEFAULT_COLUMNS, thumb_width=DEFAULT_THUMB_WIDTH,
+                       padding=DEFAULT_PADDING, labels=True):
+    """
+    Build an overview grid from images that already exist, e.g. GUI previews.
+
+    Args:
+        images (list): Image paths, or (label, path) pairs, in grid order.
+        path (str): Output PNG file.
+        columns (int): Thumbnails per row.
+        thumb_width (int): Thumbnail width in pixels.
+        padding (int): Gap around and between cells in pixels.
+        labels (bool): Draw a label under every thumbnail (default: "Slide N"
+                       for plain paths, N counting from 1).
+
+    Returns:
+        str: The output path.
+    """
+    Image = load_pillow()
+    items = [item if isinstance(item, tuple) else (n, item)
+             for n, item in enumerate(images, 1)]
+    if items:
+        with Image.open(items[0][1]) as first:
+            slide_width, slide_height = first.size
+    else:
+        slide_width, slide_height = 16, 9
+    # Written beside the target and renamed, so readers never see a partial sheet
+    partial = path + ".partial"
+    with ContactSheet(partial, len(items), slide_width, slide_height, columns, thumb_width,
+                      padding, labels) as sheet:
+        for label, image_path in items:
+            sheet.add(label, image_path)
+    os.replace(partial, path)
+    return path
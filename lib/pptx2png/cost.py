@@ -0,0 +1,227 @@
+"""cost.py"""
+
+import os
+import json
+import heapq
+
+from .ooxml import slide_complexity
+from .filelock import FileLock
+
+DEFAULT_COST_PATH = os.getenv(
+    "PPTX2PNG_COST", os.path.join(os.path.expanduser("~"), ".pptx2png", "cost.json"))
+
+# Model inputs: a slide_complexity() key and the unit it is counted in
+FEATURES = (
+    ("shapes", 1.0),
+    ("groups", 1.0),
+    ("pictures", 1.0),
+    ("tables", 1.0),
+    ("effects", 1.0),
+    ("charts", 1.0),
+    ("smartart", 1.0),
+    ("media", 1.0),
+    ("ole", 1.0),
+    ("image_bytes", 1e6),    # per MB of images to decode
+    ("text_chars", 1e3),     # per 1000 characters to lay out
+)
+
+# Seconds per unit before any calibration, from exports of typical decks at 1080p.
+# Only the ratios matter for sharding; calibration fixes the absolute scale.
+DEFAULT_WEIGHTS = {
+    "base": 0.15,
+    "shapes": 0.004,
+    "groups": 0.01,
+    "pictures": 0.03,
+    "tables": 0.05,
+    "effects": 0.02,
+    "charts": 0.25,
+    "smartart": 0.2,
+    "media": 0.1,
+    "ole": 0.3,
+    "image_bytes": 0.08,
+    "text_chars": 0.02,
+}
+
+# Measured slides kept for calibration; the oldest are dropped first
+MAX_SAMPLES = 5000
+# Samples needed before the fitted weights replace the defaults
+MIN_SAMPLES = 30
+# Pulls the fit towards the default weights when the samples do not vary enough
+RIDGE = 1.0
+
+
+class CostModel(object):
+    """
+    Predicts the render time of a slide from its static complexity.
+
+    Starts from DEFAULT_WEIGHTS and is calibrated with measured render times:
+    every observed (complexity, seconds) pair is kept in a JSON file, and the
+    weights are refitted by ridge regression towards the defaults.
+
+    Args:
+        path (str): Calibration file. Default: DEFAULT_COST_PATH. None for an
+                    in-memory model that is never saved.
+    """
+
+    def __init__(self, path=DEFAULT_COST_PATH):
+        self.path = os.path.abspath(path) if path else None
+        self.weights = dict(DEFAULT_WEIGHTS)
+        self.samples = []
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                self.samples = data.get("samples", [])[-MAX_SAMPLES:]
+                self.weights.update(data.get("weights", {}))
+            except (ValueError, OSError) as e:
+                print("Warning: Ignoring unreadable cost model '%s' (%s)." % (self.path, e))
+
+    @staticmethod
+    def features(stats):
+        """Model inputs of one slide, in FEATURES order."""
+        return [stats.get(key, 0) / unit for key, unit in FEATURES]
+
+    def estimate(self, stats):
+        """
+        Predicted render time of one slide.
+
+        Args:
+            stats (dict): One slide of slide_complexity().
+
+        Returns:
+            float: Seconds, never below a small positive floor.
+        """
+        seconds = self.weights["base"]
+        for (key, _), value in zip(FEATURES, self.features(stats)):
+            seconds += self.weights[key] * value
+        return max(seconds, 0.01)
+
+    def estimate_deck(self, pptx_path, indices=None):
+        """
+        Predicted render time of every slide of a deck.
+
+        Args:
+            pptx_path (str): Path to the .pptx file.
+            indices (list): Optional. Slide numbers. Default is all.
+
+        Returns:
+            dict: Slide number -> seconds.
+        """
+        slides = slide_complexity(pptx_path, indices)["slides"]
+        return dict((i, self.estimate(stats)) for i, stats in slides.items())
+
+    def observe(self, stats, seconds):
+        """Record a measured render time. Call fit() or save() to use it."""
+        self.samples.append(self.features(stats) + [float(seconds)])
+        del self.samples[:-MAX_SAMPLES]
+
+    def observe_deck(self, pptx_path, render_times):
+        """
+        Record the measured times of one export.
+
+        Args:
+            pptx_path (str): The exported deck.
+            render_times (dict): Slide number -> seconds, e.g. ExportResult.render_times.
+        """
+        if not render_times:
+            return
+        slides = slide_complexity(pptx_path, sorted(render_times))["slides"]
+        for i, stats in slides.items():
+            self.observe(stats, render_times[i])
+
+    def fit(self):
+        """
+        Refit the weights to the recorded samples.
+
+        Returns:
+            bool: False if there are fewer than MIN_SAMPLES samples.
+        """
+        if len(self.samples) < MIN_SAMPLES:
+            return False
+        names = ["base"] + [key for key, _ in FEATURES]
+        prior = [DEFAULT_WEIGHTS[name] for name in names]
+        size = len(names)
+        # Normal equations (X'X + rI) w = X'y + r*prior, with a leading 1 for the base cost
+        lhs = [[RIDGE if r == c else 0.0 for c in range(size)] for r in range(size)]
+        rhs = [RIDGE * p for p in prior]
+        for sample in self.samples:
+            row = [1.0] + sample[:-1]
+            y = sample[-1]
+            for r in range(size):
+                if row[r]:
+                    rhs[r] += row[r] * y
+                    for c in range(size):
+                        lhs[r][c] += row[r] * row[c]
+        solution = _solve(lhs, rhs)
+        if solution is None:
+            return False
+        # A negative cost has no meaning; clamp rather than let it cancel other terms
+        self.weights = dict((name, max(0.0, w)) for name, w in zip(names, solution))
+        return True
+
+    def save(self):
+        """Refit and write the calibration file, merging samples saved meanwhile by others."""
+        if not self.path:
+            return
+        folder = os.path.dirname(self.path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        with FileLock(self.path):
+            on_disk = CostModel(self.path).samples
+            # Keep the other writers' samples and append the ones this model added
+            known = set(map(tuple, on_disk))
+            self.samples = (on_disk + [s for s in self.samples if tuple(s) not in known])
+            del self.samples[:-MAX_SAMPLES]
+            self.fit()
+            partial = self.path + ".partial"
+            with open(partial, "w", encoding="utf-8") as f:
+                json.dump({"weights": self.weights, "samples": self.samples}, f)
+            os.replace(partial, self.path)
+
+
+def _solve(matrix, vector):
+    """Gaussian elimination with partial pivoting. None if the system is singular."""
+    size = len(vector)
+    a = [row[:] + [vector[r]] for r, row in enumerate(matrix)]
+    for col in range(size):
+        pivot = max(range(col, size), key=lambda r: abs(a[r][col]))
+        if abs(a[pivot][col]) < 1e-12:
+            return None
+        a[col], a[pivot] = a[pivot], a[col]
+        for r in range(col + 1, size):
+            factor = a[r][col] / a[col][col]
+            if factor:
+                for c in range(col, size + 1):
+                    a[r][c] -= factor * a[col][c]
+    x = [0.0] * size
+    for r in range(size - 1, -1, -1):
+        x[r] = (a[r][size] - sum(a[r][c] * x[c] for c in range(r + 1, size))) / a[r][r]
+    return x
+
+
+def balanced_shards(costs, count):
+    """
+    Split slides into at most count shards of about equal total cost.
+
+    Longest job first: the most expensive slides are placed first, each on
+    the shard with the least work so far, so one heavy slide cannot end up
+    behind a queue of others on the same worker.
+
+    Args:
+        costs (dict): Slide number -> predicted seconds.
+        count (int): Number of shards wanted.
+
+    Returns:
+        list: Sorted slide number lists, heaviest shard first, e.g. [[1, 7], [2, 3, 4]].
+    """
+    count = max(1, min(count, len(costs)))
+    heap = [(0.0, n) for n in range(count)]
+    shards = [[] for _ in range(count)]
+    load = [0.0] * count
+    for i in sorted(costs, key=lambda i: (-costs[i], i)):
+        total, n = heapq.heappop(heap)
+        shards[n].append(i)
+        load[n] = total + costs[i]
+        heapq.heappush(heap, (load[n], n))
+    order = sorted(range(count), key=lambda n: -load[n])
+    return [sorted(shards[n]) for n in order if shards[n]]
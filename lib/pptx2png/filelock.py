@@ -0,0 +1,59 @@
+"""filelock.py"""
+
+import os
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import fcntl
+
+
+class FileLock(object):
+    """
+    Exclusive lock between processes, held on a companion '.lock' file.
+
+    Used wherever several worker processes write the same file, such as a
+    shared manifest.
+
+    Args:
+        path (str): Path of the file to protect. The lock file is path + '.lock'.
+    """
+
+    def __init__(self, path):
+        self.lock_path = path + ".lock"
+        self._fd = None
+
+    def acquire(self):
+        self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        if msvcrt:
+            # LK_LOCK retries for about 10 seconds before raising, so loop until it succeeds
+            while True:
+                try:
+                    os.lseek(self._fd, 0, os.SEEK_SET)
+                    msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        else:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if msvcrt:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.release()
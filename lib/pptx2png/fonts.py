@@ -0,0 +1,298 @@
+"""fonts.py"""
+
+import os
+import re
+import sys
+import json
+import struct
+import zipfile
+
+from .ooxml import PRESENTATION_PART, read_rels
+
+DEFAULT_FONT_CACHE = os.getenv(
+    "PPTX2PNG_FONT_CACHE", os.path.join(os.path.expanduser("~"), ".pptx2png", "fonts.json"))
+
+_FONT_EXTENSIONS = (".ttf", ".otf", ".ttc", ".otc")
+
+# Text runs, bullets and symbols name their font in these elements. Theme
+# font references such as "+mn-lt" start with "+"; the per-script fallback
+# list of a theme (<a:font script=...>) is deliberately not matched.
+_TYPEFACE_RE = re.compile(br'<a:(?:latin|ea|cs|sym|buFont)\b[^>]*?\btypeface="([^"]*)"')
+_THEME_FONT_RE = re.compile(br"<a:(majorFont|minorFont)>(.*?)</a:\1>", re.S)
+_EMBEDDED_FONT_RE = re.compile(br"<p:embeddedFont>(.*?)</p:embeddedFont>", re.S)
+_EMBEDDED_FACE_RE = re.compile(br'<p:font\b[^>]*?\btypeface="([^"]*)"')
+_REL_ID_RE = re.compile(br'\br:id="([^"]*)"')
+
+# Name table IDs: font family, and the typographic family that groups more than four styles
+_FAMILY_NAME_IDS = (1, 16)
+
+
+def font_dirs():
+    """Folders searched for installed fonts on this platform."""
+    home = os.path.expanduser("~")
+    if sys.platform == "win32":
+        windir = os.getenv("WINDIR", r"C:\Windows")
+        dirs = [os.path.join(windir, "Fonts")]
+        if os.getenv("LOCALAPPDATA"):
+            # Fonts installed for the current user only
+            dirs.append(os.path.join(os.getenv("LOCALAPPDATA"), "Microsoft", "Windows", "Fonts"))
+        return dirs
+    if sys.platform == "darwin":
+        return ["/System/Library/Fonts", "/Library/Fonts", os.path.join(home, "Library", "Fonts")]
+    return ["/usr/share/fonts", "/usr/local/share/fonts", os.path.join(home, ".fonts"),
+            os.path.join(home, ".local", "share", "fonts")]
+
+
+def font_families(path):
+    """
+    Family names a font file declares in its 'name' table.
+
+    Only the table directory and the name table are read, so large CJK fonts
+    cost no more than small ones.
+
+    Args:
+        path (str): A .ttf, .otf or collection (.ttc/.otc) file.
+
+    Returns:
+        set: Family names, e.g. {"Segoe UI", "Segoe UI Semibold"}.
+    """
+    families = set()
+    with open(path, "rb") as f:
+        tag = f.read(4)
+        if tag == b"ttcf":
+            f.seek(8)
+            count = struct.unpack(">I", f.read(4))[0]
+            offsets = struct.unpack(">%dI" % count, f.read(4 * count))
+        else:
+            offsets = (0,)
+        for offset in offsets:
+            f.seek(offset + 4)
+            tables = struct.unpack(">H", f.read(2))[0]
+            f.seek(offset + 12)
+            directory = f.read(16 * tables)
+            for n in range(tables):
+                table_tag, _, table_offset, length = struct.unpack(
+                    ">4sIII", directory[16 * n:16 * n + 16])
+                if table_tag == b"name":
+                    f.seek(table_offset)
+                    families |= _parse_name_table(f.read(length))
+                    break
+    return families
+
+
+def _parse_name_table(table):
+    names = set()
+    _, count, storage = struct.unpack(">HHH", table[:6])
+    for n in range(count):
+        platform, encoding, _, name_id, length, offset = struct.unpack(
+            ">6H", table[6 + 12 * n:18 + 12 * n])
+        if name_id not in _FAMILY_NAME_IDS:
+            continue
+        raw = table[storage + offset:storage + offset + length]
+        if platform in (0, 3):
+            name = raw.decode("utf-16-be", "replace")
+        elif platform == 1 and encoding == 0:
+            name = raw.decode("mac_roman", "replace")
+        else:
+            continue
+        if name:
+            names.add(name)
+    return names
+
+
+class FontIndex(object):
+    """
+    Installed font families, cached on disk between jobs.
+
+    Reading the name table of every installed font takes a while on hosts
+    with thousands of fonts. The cache remembers the families of each file
+    with its size and mtime, so later jobs only read new or changed files.
+
+    Args:
+        path (str): Cache file. Default: DEFAULT_FONT_CACHE. None keeps the
+                    index in memory only.
+        dirs (list): Folders to scan. Default: font_dirs().
+    """
+
+    def __init__(self, path=DEFAULT_FONT_CACHE, dirs=None):
+        self.path = os.path.abspath(path) if path else None
+        self.dirs = dirs if dirs is not None else font_dirs()
+        self._files = {}
+        self._families = None
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._files = json.load(f).get("files", {})
+            except (ValueError, OSError):
+                self._files = {}
+
+    def refresh(self):
+        """Rescan the font folders, reading only files that changed, and save the cache."""
+        files = {}
+        changed = False
+        for folder in self.dirs:
+            for root, _, names in os.walk(folder):
+                for name in names:
+                    if not name.lower().endswith(_FONT_EXTENSIONS):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    cached = self._files.get(path)
+                    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime:
+                        files[path] = cached
+                        continue
+                    try:
+                        families = sorted(font_families(path))
+                    except (OSError, struct.error, IndexError):
+                        families = []
+                    files[path] = [stat.st_size, stat.st_mtime, families]
+                    changed = True
+        changed = changed or len(files) != len(self._files)
+        self._files = files
+        self._families = None
+        if changed and self.path:
+            self._save()
+        return self
+
+    def _save(self):
+        folder = os.path.dirname(self.path)
+        try:
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            partial = "%s.%d.partial" % (self.path, os.getpid())
+            with open(partial, "w", encoding="utf-8") as f:
+                json.dump({"files": self._files}, f)
+            os.replace(partial, self.path)
+        except OSError as e:
+            print("Warning: Could not save the font cache '%s' (%s)." % (self.path, e))
+
+    @property
+    def families(self):
+        """Lower-cased family name -> family name as the font spells it."""
+        if self._families is None:
+            self._families = {}
+            for _, _, names in self._files.values():
+                for name in names:
+                    self._families.setdefault(name.lower(), name)
+        return self._families
+
+    def has(self, family):
+        return family.lower() in self.families
+
+
+# One index per process, scanned on first use
+_installed = None
+
+
+def installed_fonts():
+    """The shared FontIndex of this process, refreshed once per process."""
+    global _installed
+    if _installed is None:
+        _installed = FontIndex().refresh()
+    return _installed
+
+
+def deck_fonts(pptx_path):
+    """
+    Fonts a deck refers to, read from the package.
+
+    Args:
+        pptx_path (str): Path to the .pptx file.
+
+    Returns:
+        dict: "theme": {"major": [...], "minor": [...]} latin/east-asian/complex
+              theme fonts; "used": sorted typefaces named anywhere in the deck,
+              theme fonts included; "embedded": {typeface: [font parts]} for
+              fonts stored in ppt/fonts.
+    """
+    theme = {"major": [], "minor": []}
+    used = set()
+    embedded = {}
+    with zipfile.ZipFile(pptx_path) as package:
+        for name in package.namelist():
+            if not (name.startswith("ppt/") and name.endswith(".xml")):
+                continue
+            data = package.read(name)
+            if name.startswith("ppt/theme/"):
+                for kind, block in _THEME_FONT_RE.findall(data):
+                    key = "major" if kind == b"majorFont" else "minor"
+                    for face in _TYPEFACE_RE.findall(block):
+                        face = face.decode("utf-8")
+                        if face and face not in theme[key]:
+                            theme[key].append(face)
+            used.update(face.decode("utf-8") for face in _TYPEFACE_RE.findall(data))
+
+        rels = read_rels(package, PRESENTATION_PART)
+        for block in _EMBEDDED_FONT_RE.findall(package.read(PRESENTATION_PART)):
+            face = _EMBEDDED_FACE_RE.search(block)
+            if face:
+                embedded[face.group(1).decode("utf-8")] = [
+                    rels[rid.decode("utf-8")][1] for rid in _REL_ID_RE.findall(block)
+                    if rid.decode("utf-8") in rels]
+    used = sorted(face for face in used if face and not face.startswith("+"))
+    return {"theme": theme, "used": used, "embedded": embedded}
+
+
+def load_substitutions(spec):
+    """
+    Font substitution map from a dict or a JSON file of {"Font": "Replacement"}.
+
+    Returns:
+        dict: The map. Empty for None.
+
+    Raises:
+        OSError: If the file cannot be read.
+        ValueError: If the file is not JSON, or the map is not font names to font names.
+    """
+    if not spec:
+        return {}
+    if isinstance(spec, dict):
+        substitutions = dict(spec)
+    else:
+        with open(spec, "r", encoding="utf-8") as f:
+            substitutions = json.load(f)
+    if not isinstance(substitutions, dict) or not all(
+            isinstance(k, str) and isinstance(v, str) and k and v
+            for k, v in substitutions.items()):
+        raise ValueError('Font substitutions must map font names to font names, '
+                         'e.g. {"Helvetica": "Arial"}.')
+    return substitutions
+
+
+def resolve_fonts(pptx_path, substitutions=None, index=None):
+    """
+    How every font of a deck will be rendered on this host.
+
+    Args:
+        pptx_path (str): Path to the .pptx file.
+        substitutions (dict|str): Optional. Substitution map, or a JSON file of one.
+        index (FontIndex): Optional. Default: installed_fonts().
+
+    Returns:
+        dict: Typeface -> ("installed" | "embedded" | "substituted" | "missing",
+              font that is used). "missing" fonts are replaced by PowerPoint's
+              own fallback, which differs between hosts. A substitution whose
+              replacement is neither installed nor embedded is not applied.
+    """
+    index = index or installed_fonts()
+    substitutions = load_substitutions(substitutions)
+    info = deck_fonts(pptx_path)
+    resolved = {}
+    for face in info["used"]:
+        replacement = substitutions.get(face)
+        if replacement is not None and not (index.has(replacement) or
+                                            replacement in info["embedded"]):
+            print("Warning: Substitute '%s' for font '%s' is not available." % (replacement, face))
+            replacement = None
+        if replacement is not None:
+            resolved[face] = ("substituted", replacement)
+        elif face in info["embedded"]:
+            resolved[face] = ("embedded", face)
+        elif index.has(face):
+            resolved[face] = ("installed", index.families[face.lower()])
+        else:
+            resolved[face] = ("missing", None)
+    return resolved
@@ -0,0 +1,103 @@
+"""handout.py"""
+
+import os
+
+from .imaging import load_pillow
+
+# Slides per page, as in PowerPoint's handout layouts
+HANDOUT_LAYOUTS = (3, 6)
+HANDOUT_NAME = "Handout_%d.png"
+
+# US Letter, portrait, at 150 dpi
+PAGE_SIZE = (1275, 1650)
+MARGIN = 90
+GAP = 45
+PAPER = (255, 255, 255)
+FRAME = (160, 160, 160)
+RULE = (190, 190, 190)
+TEXT = (90, 90, 90)
+
+
+def _cells(per_page, page_size):
+    """Slide boxes (x, y, w, h) of one page, in reading order."""
+    width, height = page_size
+    cell_w = (width - 2 * MARGIN - GAP) // 2
+    cell_h = (height - 2 * MARGIN - 2 * GAP) // 3
+    if per_page == 3:
+        # One column of slides on the left half, lines for notes on the right
+        return [(MARGIN, MARGIN + r * (cell_h + GAP), cell_w, cell_h) for r in range(3)]
+    # PowerPoint fills 6-slide handouts row by row
+    return [(MARGIN + c * (cell_w + GAP), MARGIN + r * (cell_h + GAP), cell_w, cell_h)
+            for r in range(3) for c in range(2)]
+
+
+def handout_pages(images, per_page=6, page_size=PAGE_SIZE):
+    """
+    Lay out slide images on handout pages.
+
+    Args:
+        images (list): Slide image paths, in order. None leaves a slot empty.
+        per_page (int): 3 (slides with lines for notes) or 6 (two columns).
+        page_size (tuple): Page size in pixels, portrait.
+
+    Yields:
+        PIL.Image.Image: One RGB image per page.
+    """
+    if per_page not in HANDOUT_LAYOUTS:
+        raise ValueError("Handouts have 3 or 6 slides per page, not %r." % per_page)
+    Image = load_pillow()
+    from PIL import ImageDraw
+
+    cells = _cells(per_page, page_size)
+    for start in range(0, len(images), per_page):
+        page = Image.new("RGB", page_size, PAPER)
+        draw = ImageDraw.Draw(page)
+        for (x, y, w, h), path in zip(cells, images[start:start + per_page]):
+            box = (x, y, w, h)
+            if path:
+                with Image.open(path) as img:
+                    img.draft("RGB", (w, h))
+                    img = img.convert("RGB")
+                    img.thumbnail((w, h), Image.LANCZOS, reducing_gap=2.0)
+                    # Centered in its cell, like PowerPoint does
+                    box = (x + (w - img.size[0]) // 2, y + (h - img.size[1]) // 2) + img.size
+                    page.paste(img, box[:2])
+            draw.rectangle((box[0] - 1, box[1] - 1, box[0] + box[2], box[1] + box[3]),
+                           outline=FRAME)
+            if per_page == 3:
+                left = x + w + GAP
+                right = page_size[0] - MARGIN
+                for n in range(1, 7):
+                    line_y = y + n * h // 7
+                    draw.line((left, line_y, right, line_y), fill=RULE)
+        number = str(start // per_page + 1)
+        left, top, right, bottom = draw.textbbox((0, 0), number)
+        draw.text((page_size[0] - MARGIN - (right - left),
+                   page_size[1] - MARGIN // 2 - (bottom - top)), number, fill=TEXT)
+        yield page
+
+
+def make_handouts(images, output_dir, per_page=6, page_size=PAGE_SIZE):
+    """
+    Write handout pages (Handout_1.png, ...) from slide images that already exist.
+
+    Each page is written beside its target and renamed, so readers never see
+    a partial page.
+
+    Args:
+        images (list): Slide image paths, in order.
+        output_dir (str): Folder for the pages.
+        per_page (int): 3 or 6 slides per page.
+        page_size (tuple): Page size in pixels, portrait. Default: Letter at 150 dpi.
+
+    Returns:
+        list: Paths of the written pages.
+    """
+    paths = []
+    for n, page in enumerate(handout_pages(images, per_page, page_size), 1):
+        path = os.path.join(output_dir, HANDOUT_NAME % n)
+        partial = path + ".partial"
+        page.save(partial, "PNG")
+        os.replace(partial, path)
+        paths.append(path)
+    return paths
@@ -0,0 +1,199 @@
+"""imaging.py"""
+
+import os
+import zlib
+import struct
+import filecmp
+
+# Width of the thumbnails used for the perceptual comparison
+COMPARE_WIDTH = 64
+
+
+def load_pillow():
+    """
+    Import Pillow on first use.
+
+    Raises:
+        ImportError: With an install hint, if Pillow is missing.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ImportError("Library 'Pillow' is required for this option. "
+                          "Please install it via: pip install pillow")
+    return Image
+
+
+def images_match(new_path, old_path, threshold=0):
+    """
+    Decide whether a new render can be dropped in favour of the existing file.
+
+    Byte-identical files always match, without decoding. Otherwise, with
+    threshold 0 the decoded pixels must be identical; with a threshold, both
+    images are reduced to small grayscale thumbnails and match when their
+    mean absolute difference, as a fraction of full scale, is at most
+    threshold (e.g. 0.002 ignores anti-aliasing noise and blinking cursors).
+
+    Args:
+        new_path (str): The fresh render.
+        old_path (str): The file it would replace.
+        threshold (float): Allowed mean difference, 0..1.
+
+    Returns:
+        bool: True if the old file can be kept.
+    """
+    if os.path.getsize(new_path) == os.path.getsize(old_path) and \
+            filecmp.cmp(new_path, old_path, shallow=False):
+        return True
+    try:
+        Image = load_pillow()
+    except ImportError:
+        if threshold:
+            raise
+        # Without Pillow only the byte comparison is possible
+        return False
+
+    from PIL import ImageChops, ImageStat
+
+    with Image.open(new_path) as new, Image.open(old_path) as old:
+        if new.size != old.size:
+            return False
+        if not threshold:
+            if new.mode != old.mode:
+                old = old.convert(new.mode)
+            return ImageChops.difference(new, old).getbbox() is None
+        height = max(1, int(round(COMPARE_WIDTH * new.size[1] / float(new.size[0]))))
+        small_new = new.convert("L").resize((COMPARE_WIDTH, height), Image.BOX)
+        small_old = old.convert("L").resize((COMPARE_WIDTH, height), Image.BOX)
+        diff = ImageStat.Stat(ImageChops.difference(small_new, small_old)).mean[0]
+        return diff / 255.0 <= threshold
+
+
+def dhash(image, size=8):
+    """
+    64-bit difference hash (dHash) of an image.
+
+    The image is reduced to a (size+1) x size grayscale grid and every bit
+    says whether a cell is brighter than its right neighbour. Re-encoding,
+    rescaling and small colour shifts leave the hash (nearly) unchanged.
+
+    Args:
+        image: A path or a PIL image.
+        size (int): Grid size; 8 gives a 64-bit hash.
+
+    Returns:
+        int: The hash as an unsigned integer.
+    """
+    Image = load_pillow()
+    if isinstance(image, str):
+        with Image.open(image) as img:
+            return dhash(img, size)
+    pixels = list(image.convert("L").resize((size + 1, size), Image.BOX).getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def images_to_pdf(image_paths, pdf_path, resolution=96.0):
+    """
+    Write images as the pages of a PDF, one image per page.
+
+    The pages are raster images, so text is not selectable. Pages are written
+    one at a time, so at most one page is held in memory: 8-bit RGB and
+    grayscale PNGs, which is what PowerPoint exports, are copied into the PDF
+    without decoding, since their compressed data is valid PDF Flate data;
+    other images are decoded with Pillow.
+
+    Args:
+        image_paths (list): Image files in page order.
+        pdf_path (str): Output file.
+        resolution (float): Pixels per inch, which sets the page size.
+    """
+    if not image_paths:
+        raise ValueError("A PDF needs at least one page.")
+    with open(pdf_path, "wb") as f:
+        writer = _PdfWriter(f)
+        for path in image_paths:
+            writer.add_page(_pdf_image(path), resolution)
+        writer.close()
+
+
+def _pdf_image(path):
+    """(width, height, color space, image dictionary entries, data) of one page image."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        width, height, depth, color, _, _, interlace = struct.unpack(">IIBBBBB", data[16:29])
+        if depth == 8 and color in (0, 2) and not interlace:
+            colors = 3 if color == 2 else 1
+            idat = []
+            pos = 8
+            while pos + 8 <= len(data):
+                length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+                if kind == b"IDAT":
+                    idat.append(data[pos + 8:pos + 8 + length])
+                pos += 12 + length
+            params = b"/DecodeParms << /Predictor 15 /Colors %d /BitsPerComponent 8 /Columns %d >>" % (
+                colors, width)
+            return width, height, colors, params, b"".join(idat)
+    Image = load_pillow()
+    with Image.open(path) as img:
+        rgb = img.convert("RGB")
+    return rgb.size[0], rgb.size[1], 3, b"", zlib.compress(rgb.tobytes(), 6)
+
+
+class _PdfWriter(object):
+    """Minimal PDF writer: one image per page, objects written as they come."""
+
+    def __init__(self, f):
+        self._file = f
+        # Object 1 is the catalog and 2 the page tree, both written last
+        self._offsets = {}
+        self._next_id = 3
+        self._pages = []
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _object(self, body, stream=None, object_id=None):
+        if object_id is None:
+            object_id = self._next_id
+            self._next_id += 1
+        self._offsets[object_id] = self._file.tell()
+        self._file.write(b"%d 0 obj\n" % object_id)
+        if stream is None:
+            self._file.write(body + b"\nendobj\n")
+        else:
+            self._file.write(body[:-2] + b" /Length %d >>\nstream\n" % len(stream))
+            self._file.write(stream)
+            self._file.write(b"\nendstream\nendobj\n")
+        return object_id
+
+    def add_page(self, image, resolution):
+        width, height, colors, params, data = image
+        space = b"/DeviceRGB" if colors == 3 else b"/DeviceGray"
+        image_id = self._object(
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s "
+            b"/BitsPerComponent 8 /Filter /FlateDecode %s >>" % (width, height, space, params),
+            data)
+        page_w = width * 72.0 / resolution
+        page_h = height * 72.0 / resolution
+        content_id = self._object(b"<< >>", b"q %.4f 0 0 %.4f 0 0 cm /Im0 Do Q" % (page_w, page_h))
+        self._pages.append(self._object(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.4f %.4f] "
+            b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>" % (
+                page_w, page_h, image_id, content_id)))
+
+    def close(self):
+        kids = b" ".join(b"%d 0 R" % page for page in self._pages)
+        self._object(b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._pages)),
+                     object_id=2)
+        self._object(b"<< /Type /Catalog /Pages 2 0 R >>", object_id=1)
+        xref = self._file.tell()
+        self._file.write(b"xref\n0 %d\n0000000000 65535 f \n" % self._next_id)
+        for object_id in range(1, self._next_id):
+            self._file.write(b"%010d 00000 n \n" % self._offsets[object_id])
+        self._file.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+            self._next_id, xref))
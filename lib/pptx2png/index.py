@@ -0,0 +1,150 @@
+"""index.py"""
+
+import os
+import time
+import sqlite3
+
+from .imaging import dhash
+
+DEFAULT_INDEX_PATH = os.getenv(
+    "PPTX2PNG_INDEX", os.path.join(os.path.expanduser("~"), ".pptx2png", "index.sqlite"))
+
+HASH_BITS = 64
+BAND_BITS = 8
+BANDS = HASH_BITS // BAND_BITS
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS slides (
+    file   TEXT PRIMARY KEY,
+    hash   INTEGER NOT NULL,
+    deck   TEXT,
+    slide  INTEGER,
+    added  REAL,
+    %s
+);
+%s
+""" % (
+    ",\n    ".join("b%d INTEGER NOT NULL" % n for n in range(BANDS)),
+    "\n".join("CREATE INDEX IF NOT EXISTS slides_b%d ON slides (b%d);" % (n, n)
+              for n in range(BANDS)),
+)
+
+
+def hamming(a, b):
+    """Number of differing bits between two hashes."""
+    return bin(a ^ b).count("1")
+
+
+def _bands(value):
+    mask = (1 << BAND_BITS) - 1
+    return [(value >> (n * BAND_BITS)) & mask for n in range(BANDS)]
+
+
+def _to_signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+class SlideIndex(object):
+    """
+    SQLite index of slide image hashes with a near-neighbour query.
+
+    The 64-bit hash is also stored as eight 8-bit bands with one index each.
+    Two hashes within Hamming distance 7 always share at least one band,
+    so such queries only look at the rows that match a band instead of
+    scanning the table. Larger distances fall back to a full scan.
+
+    Args:
+        path (str): Database file. Created if missing. Default: DEFAULT_INDEX_PATH.
+    """
+
+    def __init__(self, path=None):
+        self.path = os.path.abspath(path or DEFAULT_INDEX_PATH)
+        folder = os.path.dirname(self.path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+        # Several export workers may write at once; wait for the lock instead of failing
+        self._db = sqlite3.connect(self.path, timeout=30)
+        self._db.executescript(_SCHEMA)
+
+    def add(self, file, hash_value, deck=None, slide=None):
+        """Record (or replace) the hash of one exported image."""
+        columns = ["file", "hash", "deck", "slide", "added"] + ["b%d" % n for n in range(BANDS)]
+        values = [os.path.abspath(file), _to_signed(hash_value), deck, slide, time.time()]
+        values += _bands(hash_value)
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO slides (%s) VALUES (%s)" % (
+                    ", ".join(columns), ", ".join("?" * len(columns))),
+                values)
+
+    def add_image(self, file, deck=None, slide=None):
+        """Hash an image file and record it. Returns the hash."""
+        value = dhash(file)
+        self.add(file, value, deck, slide)
+        return value
+
+    def find_similar(self, image_or_hash, max_distance=6, limit=20):
+        """
+        Find indexed slides that look like an image.
+
+        Args:
+            image_or_hash: A path, a PIL image, or a hash from dhash().
+            max_distance (int): Largest Hamming distance to accept (0 = identical hash).
+            limit (int): Maximum number of matches.
+
+        Returns:
+            list: dicts with file, deck, slide, hash and distance, closest first.
+        """
+        target = image_or_hash if isinstance(image_or_hash, int) else dhash(image_or_hash)
+        if max_distance < BANDS:
+            clause = " OR ".join("b%d = ?" % n for n in range(BANDS))
+            rows = self._db.execute(
+                "SELECT file, deck, slide, hash FROM slides WHERE " + clause, _bands(target))
+        else:
+            rows = self._db.execute("SELECT file, deck, slide, hash FROM slides")
+        matches = []
+        for file, deck, slide, value in rows:
+            value = _to_unsigned(value)
+            distance = hamming(target, value)
+            if distance <= max_distance:
+                matches.append({"file": file, "deck": deck, "slide": slide,
+                                "hash": value, "distance": distance})
+        matches.sort(key=lambda m: (m["distance"], m["file"]))
+        return matches[:limit]
+
+    def remove_deck(self, deck):
+        """Forget every slide recorded for a deck."""
+        with self._db:
+            self._db.execute("DELETE FROM slides WHERE deck = ?", (deck,))
+
+    def count(self):
+        """Number of indexed images."""
+        return self._db.execute("SELECT COUNT(*) FROM slides").fetchone()[0]
+
+    def close(self):
+        self._db.close()
+
+
+def find_similar(image_or_hash, max_distance=6, limit=20, index_path=None):
+    """
+    Find slides similar to an image in the default (or given) index.
+
+    Args:
+        image_or_hash: A path, a PIL image, or a hash from dhash().
+        max_distance (int): Largest Hamming distance to accept.
+        limit (int): Maximum number of matches.
+        index_path (str): Optional. Index file. Default: DEFAULT_INDEX_PATH.
+
+    Returns:
+        list: Matches as returned by SlideIndex.find_similar().
+    """
+    index = SlideIndex(index_path)
+    try:
+        return index.find_similar(image_or_hash, max_distance, limit)
+    finally:
+        index.close()
@@ -0,0 +1,454 @@
+"""instrument.py"""
+
+import os
+import json
+import time
+import queue
+import threading
+
+# Histogram buckets for span durations, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+DEFAULT_OTLP_ENDPOINT = "http://127.0.0.1:4318/v1/traces"
+DEFAULT_PROMETHEUS_PORT = 9464
+
+
+class Span(object):
+    """
+    One timed step of a job.
+
+    Attributes:
+        name (str): Step name, e.g. 'open' or 'export'.
+        trace_id (str): 32 hex digits, shared by all spans of one topng() call.
+        span_id (str): 16 hex digits.
+        parent_id (str): span_id of the enclosing span, or None.
+        start_ns (int): Wall-clock start, nanoseconds since the epoch.
+        end_ns (int): Wall-clock end.
+        duration (float): Seconds, from a monotonic clock.
+        attributes (dict): Extra facts such as the slide number.
+        error (str): Set if the step raised.
+    """
+
+    def __init__(self, tracer, name, attributes, parent):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.start_ns = None
+        self.end_ns = None
+        self.duration = None
+        self.error = None
+        self._started = None
+
+    def set(self, key, value):
+        """Attach an attribute to the span."""
+        self.attributes[key] = value
+
+    def start(self):
+        """Begin timing; spans opened on this thread from now on become children."""
+        self.tracer._push(self)
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter()
+        return self
+
+    def end(self, error=None):
+        """Stop timing and export the span."""
+        self.duration = time.perf_counter() - self._started
+        self.end_ns = self.start_ns + int(self.duration * 1e9)
+        self.error = self.error or error
+        self.tracer._pop(self)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end("%s: %s" % (exc_type.__name__, exc) if exc_type is not None else None)
+        return False
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration": self.duration,
+            "attributes": dict(self.attributes),
+            "error": self.error,
+        }
+
+
+class _NoopSpan(object):
+    """Stand-in returned while instrumentation is off; entering it costs nothing."""
+
+    def set(self, key, value):
+        pass
+
+    def start(self):
+        return self
+
+    def end(self, error=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class NoopTracer(object):
+    """The default tracer: records nothing."""
+
+    enabled = False
+
+    def span(self, name, **attributes):
+        return _NOOP_SPAN
+
+    def count(self, name, value=1, **labels):
+        pass
+
+    def flush(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+
+class Tracer(object):
+    """
+    Records spans and counters and hands them to exporters.
+
+    Spans nest per thread: a span opened inside another becomes its child,
+    and all spans under one root share its trace id.
+
+    Args:
+        exporters (list): Objects with on_span(span) and on_count(name, value,
+                          labels) methods, and optionally flush() and
+                          shutdown(). See CallbackExporter, PrometheusExporter
+                          and OtlpExporter.
+    """
+
+    enabled = True
+
+    def __init__(self, exporters=()):
+        self.exporters = list(exporters)
+        self._local = threading.local()
+
+    def span(self, name, **attributes):
+        """Context manager timing one step; extra keywords become attributes."""
+        stack = self._stack()
+        return Span(self, name, attributes, stack[-1] if stack else None)
+
+    def count(self, name, value=1, **labels):
+        """Add value to a counter, e.g. count('slides', status='saved')."""
+        for exporter in self.exporters:
+            exporter.on_count(name, value, labels)
+
+    def flush(self):
+        for exporter in self.exporters:
+            if hasattr(exporter, "flush"):
+                exporter.flush()
+
+    def shutdown(self):
+        for exporter in self.exporters:
+            if hasattr(exporter, "shutdown"):
+                exporter.shutdown()
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _push(self, span):
+        self._stack().append(span)
+
+    def _pop(self, span):
+        stack = self._stack()
+        if span in stack:
+            # Normally the top; a span ended out of order must not stay on the stack
+            stack.remove(span)
+        for exporter in self.exporters:
+            exporter.on_span(span)
+
+
+_tracer = NoopTracer()
+
+
+def get_tracer():
+    """The process-wide tracer used when topng() is not given one."""
+    return _tracer
+
+
+def set_tracer(tracer):
+    """
+    Install a process-wide tracer. None switches instrumentation off again.
+
+    Returns:
+        The previous tracer.
+    """
+    global _tracer
+    previous = _tracer
+    _tracer = tracer if tracer is not None else NoopTracer()
+    return previous
+
+
+class CallbackExporter(object):
+    """
+    Passes every finished span and counter update to a function.
+
+    Args:
+        callback (callable): Called as callback(event) with a dict: span events
+                             come from Span.to_dict() plus "type": "span";
+                             counter events are {"type": "counter", "name",
+                             "value", "labels"}.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def on_span(self, span):
+        event = span.to_dict()
+        event["type"] = "span"
+        self.callback(event)
+
+    def on_count(self, name, value, labels):
+        self.callback({"type": "counter", "name": name, "value": value, "labels": labels})
+
+
+class PrometheusExporter(object):
+    """
+    Aggregates spans into duration histograms and keeps counter totals, in the
+    Prometheus text format.
+
+    Span durations become pptx2png_span_duration_seconds{span="..."};
+    counters become pptx2png_<name>_total. Call serve() to expose them on
+    http://host:port/metrics, or render() to get the text.
+
+    Args:
+        namespace (str): Metric name prefix.
+    """
+
+    def __init__(self, namespace="pptx2png"):
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._server = None
+
+    def on_span(self, span):
+        with self._lock:
+            entry = self._histograms.get(span.name)
+            if entry is None:
+                entry = self._histograms[span.name] = [[0] * len(BUCKETS), 0, 0.0]
+            buckets = entry[0]
+            for n, bound in enumerate(BUCKETS):
+                if span.duration <= bound:
+                    buckets[n] += 1
+            entry[1] += 1
+            entry[2] += span.duration
+
+    def on_count(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def render(self):
+        """Current metrics in the Prometheus text exposition format."""
+        lines = []
+        metric = "%s_span_duration_seconds" % self.namespace
+        with self._lock:
+            if self._histograms:
+                lines.append("# HELP %s Duration of pptx2png steps." % metric)
+                lines.append("# TYPE %s histogram" % metric)
+            for name in sorted(self._histograms):
+                buckets, count, total = self._histograms[name]
+                for bound, value in zip(BUCKETS, buckets):
+                    lines.append('%s_bucket{span="%s",le="%s"} %d' % (metric, name, bound, value))
+                lines.append('%s_bucket{span="%s",le="+Inf"} %d' % (metric, name, count))
+                lines.append('%s_sum{span="%s"} %.6f' % (metric, name, total))
+                lines.append('%s_count{span="%s"} %d' % (metric, name, count))
+            typed = set()
+            for (name, labels), value in sorted(self._counters.items()):
+                counter = "%s_%s_total" % (self.namespace, name)
+                if counter not in typed:
+                    typed.add(counter)
+                    lines.append("# TYPE %s counter" % counter)
+                label_text = ",".join('%s="%s"' % (k, _escape(v)) for k, v in labels)
+                lines.append("%s%s %s" % (counter, "{%s}" % label_text if label_text else "",
+                                          value))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=DEFAULT_PROMETHEUS_PORT, host="127.0.0.1"):
+        """
+        Serve the metrics at http://host:port/metrics from a background thread.
+
+        Returns:
+            int: The bound port (useful with port=0).
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        thread = threading.Thread(target=self._server.serve_forever, name="pptx2png-metrics")
+        thread.daemon = True
+        thread.start()
+        return self._server.server_address[1]
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class OtlpExporter(object):
+    """
+    Sends spans to an OpenTelemetry collector over OTLP/HTTP (JSON encoding).
+
+    Finished spans are queued and posted in batches from a background
+    thread, so a slow or missing collector never delays rendering. Counters
+    are not sent; use PrometheusExporter for those.
+
+    Args:
+        endpoint (str): Collector traces URL. Default http://127.0.0.1:4318/v1/traces.
+        service_name (str): Reported as the service.name resource attribute.
+        batch_size (int): Spans per request.
+        interval (float): Seconds between sends of a partial batch.
+    """
+
+    def __init__(self, endpoint=DEFAULT_OTLP_ENDPOINT, service_name="pptx2png",
+                 batch_size=256, interval=2.0):
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=batch_size * 16)
+        self._flushed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pptx2png-otlp")
+        self._thread.daemon = True
+        self._thread.start()
+        self._warned = False
+
+    def on_span(self, span):
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def on_count(self, name, value, labels):
+        pass
+
+    def flush(self, timeout=5.0):
+        """Send everything queued so far; waits up to timeout seconds."""
+        self._flushed.clear()
+        self._queue.put(_FLUSH)
+        self._flushed.wait(timeout)
+
+    def shutdown(self):
+        self.flush()
+        self._queue.put(None)
+        self._thread.join(5.0)
+
+    def _run(self):
+        batch = []
+        while True:
+            try:
+                item = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                item = _FLUSH
+            if item is not None and item is not _FLUSH:
+                batch.append(item)
+                if len(batch) < self.batch_size:
+                    continue
+            if batch:
+                self._send(batch)
+                batch = []
+            if item is _FLUSH:
+                self._flushed.set()
+            if item is None:
+                return
+
+    def _send(self, spans):
+        from urllib import request
+
+        body = json.dumps(self.payload(spans)).encode("utf-8")
+        req = request.Request(self.endpoint, data=body,
+                              headers={"Content-Type": "application/json"})
+        try:
+            request.urlopen(req, timeout=5).close()
+        except Exception as e:
+            self.dropped += len(spans)
+            if not self._warned:
+                self._warned = True
+                print("Warning: Could not send spans to '%s': %s" % (self.endpoint, e))
+
+    def payload(self, spans):
+        """OTLP/JSON ExportTraceServiceRequest for a list of spans."""
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", self.service_name)]},
+            "scopeSpans": [{
+                "scope": {"name": "pptx2png"},
+                "spans": [_otlp_span(span) for span in spans],
+            }],
+        }]}
+
+
+_FLUSH = object()
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        encoded = {"boolValue": value}
+    elif isinstance(value, int):
+        encoded = {"intValue": str(value)}
+    elif isinstance(value, float):
+        encoded = {"doubleValue": value}
+    else:
+        encoded = {"stringValue": str(value)}
+    return {"key": key, "value": encoded}
+
+
+def _otlp_span(span):
+    data = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [_otlp_attribute(k, v) for k, v in sorted(span.attributes.items())],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+    }
+    if span.parent_id:
+        data["parentSpanId"] = span.parent_id
+    return data
@@ -0,0 +1,190 @@
+"""manifest.py"""
+
+import os
+import json
+import time
+import shutil
+import struct
+import hashlib
+import tempfile
+
+from .filelock import FileLock
+
+MANIFEST_NAME = "manifest.ndjson"
+STAGING_PREFIX = ".pptx2png-staging-"
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def make_staging_dir(output_path):
+    """
+    Create a private staging directory inside the output directory.
+
+    Staging lives next to the final files so that the rename on completion
+    never crosses a filesystem boundary and stays atomic.
+
+    Args:
+        output_path (str): Absolute path of the output directory.
+
+    Returns:
+        str: Path of the new staging directory.
+    """
+    return tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=output_path)
+
+
+def remove_staging_dir(staging_path):
+    """Remove a staging directory and whatever a failed slide left in it."""
+    if staging_path and os.path.isdir(staging_path):
+        shutil.rmtree(staging_path, ignore_errors=True)
+
+
+def commit_file(staged_path, final_path):
+    """Atomically move a finished file from staging to its final name."""
+    os.replace(staged_path, final_path)
+
+
+def link_or_copy(source_path, target_path):
+    """
+    Materialize a duplicate output: hard link if the filesystem allows it, else copy.
+
+    Returns:
+        str: 'link' or 'copy'.
+    """
+    try:
+        os.link(source_path, target_path)
+        return "link"
+    except (OSError, AttributeError):
+        shutil.copyfile(source_path, target_path)
+        return "copy"
+
+
+def png_size(path):
+    """
+    Read the pixel size of a PNG file from its IHDR chunk.
+
+    Args:
+        path (str): Path to the PNG file.
+
+    Returns:
+        tuple: (width, height), or (0, 0) if the file is not a PNG.
+    """
+    with open(path, "rb") as f:
+        head = f.read(24)
+    if len(head) < 24 or head[:8] != PNG_SIGNATURE or head[12:16] != b"IHDR":
+        return 0, 0
+    return struct.unpack(">II", head[16:24])
+
+
+def file_sha256(path):
+    """Return the hex SHA-256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_record(slide_index, path, render_time, deck=None, alias_of=None, changed=True):
+    """
+    Build the manifest record of one exported slide.
+
+    Args:
+        slide_index (int): 1-based slide number.
+        path (str): Final path of the exported image.
+        render_time (float): Seconds spent rendering the slide.
+        deck (str): Optional. SHA-256 of the source .pptx, used by resume.
+        alias_of (str): Optional. File name of the identical slide this one was copied from.
+        changed (bool): Optional. False if the new render matched the existing file,
+                        which was kept as it was.
+
+    Returns:
+        dict: The manifest record.
+    """
+    width, height = png_size(path)
+    return {
+        "deck": deck,
+        "slide": slide_index,
+        "file": os.path.basename(path),
+        "size": os.path.getsize(path),
+        "sha256": file_sha256(path),
+        "width": width,
+        "height": height,
+        "render_time": round(render_time, 4),
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "alias_of": alias_of,
+        "changed": changed,
+    }
+
+
+def append_record(manifest_path, record):
+    """
+    Append one record to an NDJSON manifest and flush it to disk.
+
+    Each record is written as a single line, so a crash can at worst leave
+    a truncated last line, which read_manifest() skips. The append is done
+    under a FileLock so parallel shards can share one manifest.
+    """
+    line = json.dumps(record, ensure_ascii=False, sort_keys=True) + "\n"
+    with FileLock(manifest_path):
+        with open(manifest_path, "a", encoding="utf-8") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def read_manifest(manifest_path):
+    """
+    Read an NDJSON manifest written by topng().
+
+    Later records for the same file replace earlier ones, so the result
+    reflects the latest export of every slide.
+
+    Args:
+        manifest_path (str): Path to the manifest file.
+
+    Returns:
+        dict: Records keyed by file name. Empty if the manifest is missing.
+    """
+    records = {}
+    if not os.path.exists(manifest_path):
+        return records
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Truncated line from an interrupted run
+                continue
+            if isinstance(record, dict) and "file" in record:
+                records[record["file"]] = record
+    return records
+
+
+def verify_record(record, output_path, width, height, deck):
+    """
+    Check that a manifest record still describes a valid finished export.
+
+    The image must exist with the recorded size and hash, have the expected
+    pixel dimensions, and come from the same source deck.
+
+    Args:
+        record (dict): A record returned by read_manifest().
+        output_path (str): Directory holding the exported images.
+        width (int): Expected image width in pixels.
+        height (int): Expected image height in pixels.
+        deck (str): SHA-256 of the source .pptx.
+
+    Returns:
+        bool: True if the slide can be skipped on resume.
+    """
+    if record.get("deck") != deck:
+        return False
+    if record.get("width") != width or record.get("height") != height:
+        return False
+    path = os.path.join(output_path, record["file"])
+    if not os.path.isfile(path) or os.path.getsize(path) != record.get("size"):
+        return False
+    return file_sha256(path) == record.get("sha256")
@@ -0,0 +1,455 @@
+"""ooxml.py"""
+
+import re
+import time
+import hashlib
+import zipfile
+import posixpath
+import collections
+import xml.etree.ElementTree as ET
+
+PRESENTATION_PART = "ppt/presentation.xml"
+
+NS = {
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "p": "http://schemas.openxmlformats.org/presentationml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "p14": "http://schemas.microsoft.com/office/powerpoint/2010/main",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+    "mc": "http://schemas.openxmlformats.org/markup-compatibility/2006",
+}
+
+_SLIDE_ID_RE = re.compile(br"<p:sldId\b")
+_SLIDE_NUMBER_FIELD_RE = re.compile(br'<a:fld\b[^>]*type="slidenum"')
+# Date fields render the day of the export; datetime8 to datetime13 also show the time of day
+_DATE_FIELD_RE = re.compile(br'<a:fld\b[^>]*type="datetime\d*"')
+_TIME_FIELD_RE = re.compile(br'<a:fld\b[^>]*type="datetime(?:8|9|1[0-3])"')
+# Attribute values; those naming a relationship of the part are replaced when hashing
+_ATTR_VALUE_RE = re.compile(br'="([^"]*)"')
+_SLIDE_SIZE_RE = re.compile(br"<p:sldSz\b[^>]*>")
+_DEFAULT_TEXT_STYLE_RE = re.compile(br"<p:defaultTextStyle>.*?</p:defaultTextStyle>", re.S)
+
+# Relationships that do not change how a slide renders
+RENDER_IRRELEVANT_RELS = frozenset(["notesSlide", "comments", "commentAuthors", "tags"])
+# Relationships hashed by their type only: where a hyperlink jumps does not change the render
+_LINK_ONLY_RELS = frozenset(["slide"])
+
+# Slide XML elements counted by slide_complexity()
+_COMPLEXITY_RES = {
+    "shapes": re.compile(br"<p:(?:sp|pic|graphicFrame|cxnSp)\b"),
+    "groups": re.compile(br"<p:grpSp\b"),
+    "pictures": re.compile(br"<p:pic\b"),
+    "tables": re.compile(br"<a:tbl\b"),
+    # Shadows, glows, soft edges, blur, reflections and 3-D are expensive to render
+    "effects": re.compile(br"<a:(?:outerShdw|innerShdw|prstShdw|glow|softEdge|blur|reflection"
+                          br"|sp3d|scene3d)\b"),
+}
+_TEXT_RE = re.compile(br"<a:t>([^<]*)</a:t>")
+_MEDIA_RELS = frozenset(["video", "audio", "media"])
+
+
+def qn(tag):
+    """Expand a prefixed tag such as 'p:sldId' into ElementTree's '{uri}sldId' form."""
+    prefix, local = tag.split(":")
+    return "{%s}%s" % (NS[prefix], local)
+
+
+def content_children(element):
+    """
+    Children of an element as PowerPoint draws them.
+
+    An mc:AlternateContent stands for the content of its mc:Choice (its
+    mc:Fallback if it has no choice), so nothing is seen twice.
+    """
+    for child in element:
+        if child.tag == qn("mc:AlternateContent"):
+            branch = child.find(qn("mc:Choice"))
+            if branch is None:
+                branch = child.find(qn("mc:Fallback"))
+            if branch is not None:
+                for item in content_children(branch):
+                    yield item
+        else:
+            yield child
+
+
+# Shapes of a shape tree that are drawn; groups hold more of them
+SHAPE_TAGS = (qn("p:sp"), qn("p:pic"), qn("p:graphicFrame"), qn("p:cxnSp"))
+
+
+def iter_shapes(tree):
+    """Every shape below a shape tree or group in drawing order, with group contents flattened."""
+    for child in content_children(tree):
+        if child.tag == qn("p:grpSp"):
+            for shape in iter_shapes(child):
+                yield shape
+        elif child.tag in SHAPE_TAGS:
+            yield child
+
+
+def paragraphs(element):
+    """Text of every a:p under an element, runs joined, line breaks kept."""
+    lines = []
+    for paragraph in element.iter(qn("a:p")):
+        parts = []
+        for node in content_children(paragraph):
+            if node.tag in (qn("a:r"), qn("a:fld")):
+                t = node.find(qn("a:t"))
+                if t is not None and t.text:
+                    parts.append(t.text)
+            elif node.tag == qn("a:br"):
+                parts.append("\n")
+        text = "".join(parts).strip()
+        if text:
+            lines.append(text)
+    return lines
+
+
+def placeholder_type(shape):
+    """Placeholder type of a shape ('title', 'body', ...), or None if it is no placeholder."""
+    ph = shape.find(".//%s" % qn("p:ph"))
+    if ph is None:
+        return None
+    # A placeholder without a type is a body placeholder
+    return ph.get("type", "body")
+
+
+def rels_part(part):
+    """Name of the relationships part that belongs to a part."""
+    folder, name = posixpath.split(part)
+    return posixpath.join(folder, "_rels", name + ".rels")
+
+
+def resolve_target(source_part, target):
+    """Resolve a relationship target relative to the part that references it."""
+    if target.startswith("/"):
+        return target[1:]
+    return posixpath.normpath(posixpath.join(posixpath.dirname(source_part), target))
+
+
+def read_rels(package, part):
+    """
+    Read the relationships of a part.
+
+    Args:
+        package (zipfile.ZipFile): The opened .pptx.
+        part (str): Part name, e.g. 'ppt/slides/slide1.xml'.
+
+    Returns:
+        dict: rId -> (type, target). Internal targets are resolved to part
+              names; external ones (hyperlinks, linked media) are kept as-is
+              and their type is suffixed with '#external'.
+    """
+    name = rels_part(part)
+    if name not in package.NameToInfo:
+        return {}
+    rels = {}
+    for rel in ET.fromstring(package.read(name)).iter(qn("rel:Relationship")):
+        rel_type = rel.get("Type", "").rsplit("/", 1)[-1]
+        target = rel.get("Target", "")
+        if rel.get("TargetMode") == "External":
+            rels[rel.get("Id")] = (rel_type + "#external", target)
+        else:
+            rels[rel.get("Id")] = (rel_type, resolve_target(part, target))
+    return rels
+
+
+class SlideInfo(object):
+    """
+    Package-level facts about one slide.
+
+    Attributes:
+        index (int): 1-based position in the deck.
+        part (str): Part name of the slide XML.
+        slide_id (int): The p:sldId id, used by sections.
+        hidden (bool): True if the slide is hidden in the slide show.
+        section (str): Name of the section containing the slide, or None.
+    """
+
+    def __init__(self, index, part, slide_id, hidden=False, section=None):
+        self.index = index
+        self.part = part
+        self.slide_id = slide_id
+        self.hidden = hidden
+        self.section = section
+
+    def __repr__(self):
+        return "SlideInfo(%d, %r%s)" % (self.index, self.part, ", hidden" if self.hidden else "")
+
+
+class DeckInfo(object):
+    """
+    Slide order, hidden flags, sections and slide size of a deck.
+
+    Attributes:
+        slides (list): SlideInfo objects in deck order.
+        sections (OrderedDict): Section name -> list of slide numbers.
+        slide_size (tuple): (cx, cy) in EMU.
+    """
+
+    def __init__(self, slides, sections, slide_size):
+        self.slides = slides
+        self.sections = sections
+        self.slide_size = slide_size
+
+    def slide(self, index):
+        return self.slides[index - 1]
+
+
+def _root_attributes(package, part):
+    """Attributes of a part's root element, without parsing the rest of it."""
+    with package.open(part) as f:
+        for _, element in ET.iterparse(f, events=("start",)):
+            return dict(element.attrib)
+    return {}
+
+
+def read_deck(pptx_path):
+    """
+    Read slide order, hidden slides and sections straight from the package.
+
+    This is cheap compared to opening the deck in PowerPoint, and lets a
+    selection be resolved once before rendering starts.
+
+    Args:
+        pptx_path (str): Path to the .pptx file.
+
+    Returns:
+        DeckInfo: The deck metadata.
+    """
+    with zipfile.ZipFile(pptx_path) as package:
+        root = ET.fromstring(package.read(PRESENTATION_PART))
+        rels = read_rels(package, PRESENTATION_PART)
+
+        slides = []
+        by_id = {}
+        for sld_id in root.iter(qn("p:sldId")):
+            part = rels[sld_id.get(qn("r:id"))][1]
+            hidden = _root_attributes(package, part).get("show") in ("0", "false")
+            info = SlideInfo(len(slides) + 1, part, int(sld_id.get("id")), hidden)
+            slides.append(info)
+            by_id[info.slide_id] = info
+
+        sections = collections.OrderedDict()
+        for section in root.iter(qn("p14:section")):
+            name = section.get("name")
+            indices = sections.setdefault(name, [])
+            for ref in section.iter(qn("p14:sldId")):
+                info = by_id.get(int(ref.get("id")))
+                if info:
+                    info.section = name
+                    indices.append(info.index)
+
+        size = root.find(qn("p:sldSz"))
+        slide_size = (int(size.get("cx")), int(size.get("cy"))) if size is not None else (0, 0)
+    return DeckInfo(slides, sections, slide_size)
+
+
+def slide_count(pptx_path):
+    """
+    Count the slides of a .pptx straight from its package, without PowerPoint.
+
+    Args:
+        pptx_path (str): Path to the .pptx file.
+
+    Returns:
+        int: Number of slides in the presentation.
+    """
+    with zipfile.ZipFile(pptx_path) as package:
+        return len(_SLIDE_ID_RE.findall(package.read(PRESENTATION_PART)))
+
+
+def slide_complexity(pptx_path, indices=None):
+    """
+    Static facts that predict how long slides take to render.
+
+    Counts come from the slide XML and its own relationships only; layouts
+    and masters are shared by many slides and are not included.
+
+    Args:
+        pptx_path (str): Path to the .pptx file.
+        indices (list): Optional. Slide numbers to inspect. Default is all.
+
+    Returns:
+        dict: {"deck": {...}, "slides": {slide number: {...}}}. Deck keys:
+              slides, slide_size (EMU), embedded_fonts, font_bytes, media_bytes.
+              Slide keys: shapes, groups, pictures, tables, effects, text_chars,
+              charts, smartart, media, ole, image_bytes, media_bytes, xml_bytes.
+    """
+    deck = read_deck(pptx_path)
+    wanted = indices if indices is not None else range(1, len(deck.slides) + 1)
+    slides = {}
+    with zipfile.ZipFile(pptx_path) as package:
+        def size(part):
+            info = package.NameToInfo.get(part)
+            return info.file_size if info else 0
+
+        for index in wanted:
+            part = deck.slide(index).part
+            data = package.read(part)
+            stats = dict((key, len(regex.findall(data))) for key, regex in _COMPLEXITY_RES.items())
+            stats["text_chars"] = sum(len(text) for text in _TEXT_RE.findall(data))
+            stats["xml_bytes"] = len(data)
+            stats.update(charts=0, smartart=0, media=0, ole=0, image_bytes=0, media_bytes=0)
+            for rel_type, target in read_rels(package, part).values():
+                if rel_type == "chart":
+                    stats["charts"] += 1
+                elif rel_type == "diagramData":
+                    stats["smartart"] += 1
+                elif rel_type in _MEDIA_RELS:
+                    stats["media"] += 1
+                    stats["media_bytes"] += size(target)
+                elif rel_type in ("oleObject", "package"):
+                    stats["ole"] += 1
+                elif rel_type == "image":
+                    stats["image_bytes"] += size(target)
+            slides[index] = stats
+
+        fonts = [target for rel_type, target in read_rels(package, PRESENTATION_PART).values()
+                 if rel_type == "font"]
+        info = {
+            "slides": len(deck.slides),
+            "slide_size": list(deck.slide_size),
+            "embedded_fonts": len(fonts),
+            "font_bytes": sum(size(part) for part in fonts),
+            "media_bytes": sum(i.file_size for i in package.infolist()
+                               if i.filename.startswith("ppt/media/")),
+        }
+    return {"deck": info, "slides": slides}
+
+
+class _PartHasher(object):
+    """
+    Hashes parts together with everything they reference, memoized per package.
+
+    Digests are independent of the containing file: inside XML parts every
+    attribute naming a relationship of the part (r:embed="rId7", but also ids
+    such as "R1a2b" that other producers write) is replaced by the digest of
+    its target, in document order, so the same slide gets the same digest in
+    any deck, whatever its part names and relationship ids. Layouts, masters,
+    themes and media shared by many slides are only read once.
+    """
+
+    def __init__(self, package):
+        self.package = package
+        self._digests = {}
+
+    def digest(self, part):
+        return self._digest(part, set())[0]
+
+    def _digest(self, part, active):
+        """
+        Returns:
+            tuple: (digest, closed). A reference back to a part still being
+                   hashed, or to a missing part, hashes as a fixed token, so
+                   the digest does not depend on part names. closed is False
+                   when such a back reference was met: the digest then depends
+                   on where the walk started and is not memoized.
+        """
+        if part in self._digests:
+            return self._digests[part], True
+        if part in active:
+            return "cycle", False
+        if part not in self.package.NameToInfo:
+            return "missing", True
+        active.add(part)
+
+        closed = True
+        refs = {}
+        for rel_id, (rel_type, target) in read_rels(self.package, part).items():
+            if rel_type in RENDER_IRRELEVANT_RELS:
+                continue
+            if rel_type == "slideLayout" and "/slideMasters/" in "/" + part:
+                # A master lists all of its layouts; only the slide's own layout matters
+                continue
+            if rel_type.endswith("#external"):
+                refs[rel_id] = "%s|%s" % (rel_type, target)
+            elif rel_type in _LINK_ONLY_RELS:
+                refs[rel_id] = rel_type
+            else:
+                digest, target_closed = self._digest(target, active)
+                closed = closed and target_closed
+                refs[rel_id] = "%s|%s" % (rel_type, digest)
+
+        h = hashlib.sha256()
+        used = set()
+        if part.endswith(".xml") or part.endswith(".vml"):
+            def replace(match):
+                rel_id = match.group(1).decode("utf-8", "replace")
+                if rel_id not in refs:
+                    return match.group(0)
+                used.add(rel_id)
+                return b'="@' + refs[rel_id].encode("utf-8") + b'"'
+            h.update(_ATTR_VALUE_RE.sub(replace, self.package.read(part)))
+        else:
+            with self.package.open(part) as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+        # Relationships the XML does not name, such as a slide's layout; their order means nothing
+        for ref in sorted(ref for rel_id, ref in refs.items() if rel_id not in used):
+            h.update(b"|" + ref.encode("utf-8"))
+
+        active.discard(part)
+        if closed:
+            self._digests[part] = h.hexdigest()
+        return h.hexdigest(), closed
+
+    def deck_context(self):
+        """
+        Digest of the presentation-wide settings that affect every slide's render:
+        slide size, default text style and embedded fonts.
+        """
+        data = self.package.read(PRESENTATION_PART)
+        h = hashlib.sha256()
+        for pattern in (_SLIDE_SIZE_RE, _DEFAULT_TEXT_STYLE_RE):
+            match = pattern.search(data)
+            h.update(match.group(0) if match else b"-")
+        fonts = []
+        for rel_type, target in read_rels(self.package, PRESENTATION_PART).values():
+            if rel_type == "font":
+                fonts.append(self.digest(target))
+        for digest in sorted(fonts):
+            h.update(digest.encode("ascii"))
+        return h.hexdigest()
+
+
+def slide_fingerprints(pptx_path, indices=None):
+    """
+    Content fingerprints of slides, for finding slides that render identically.
+
+    Two slides get the same fingerprint when their XML and every part they
+    reference (layout, master, theme, media, charts) are identical, and their
+    decks share slide size, default text style and embedded fonts. The
+    fingerprint does not depend on the file the slide lives in, so it can key
+    a render cache shared between decks. Notes and comments are ignored.
+    Slides showing a slide-number field also hash their position, and slides
+    showing a date field the day, since their renders differ. Slides showing
+    the time of day never render the same twice and get no fingerprint.
+
+    Args:
+        pptx_path (str): Path to the .pptx file.
+        indices (list): Optional. Slide numbers to fingerprint. Default is all.
+
+    Returns:
+        dict: Slide number -> hex digest, or None for slides that must always be rendered.
+    """
+    deck = read_deck(pptx_path)
+    wanted = indices if indices is not None else range(1, len(deck.slides) + 1)
+    fingerprints = {}
+    with zipfile.ZipFile(pptx_path) as package:
+        hasher = _PartHasher(package)
+        context = hasher.deck_context()
+        today = time.strftime("%Y-%m-%d")
+        for index in wanted:
+            part = deck.slide(index).part
+            data = package.read(part)
+            if _TIME_FIELD_RE.search(data):
+                fingerprints[index] = None
+                continue
+            seed = "%s|%s" % (context, hasher.digest(part))
+            if _SLIDE_NUMBER_FIELD_RE.search(data):
+                seed += "|%d" % index
+            if _DATE_FIELD_RE.search(data):
+                seed += "|%s" % today
+            fingerprints[index] = hashlib.sha256(seed.encode("ascii")).hexdigest()
+    return fingerprints
@@ -1,15 +1,158 @@
 import os
-import sys
-import ctypes
+import time
+import zipfile
 
-# Try to import win32com, prompt user if missing
-try:
-    import win32com.client
-except ImportError:
-    print("Error: Library 'pywin32' is required. Please install it via: pip install pywin32")
-    sys.exit(1)
+# Modules behind an option (cache, animation, contact sheet, Pillow, ...) are
+# imported where the option is handled, so a plain export loads none of them.
+from . import manifest as _manifest
+from . import instrument as _instrument
+from .ooxml import read_deck, slide_fingerprints
+from .retry import RetryPolicy, NO_RETRY
+from .selection import resolve_selection, format_ranges
+from .session import (
+    PowerPointSession, GuardedSession, RenderTimeout, BackendUnavailableError, load_backend
+)
 
-def topng(pptx, output_dir="./output", slide_range=None, scale=None):
+
+class ExportResult(object):
+    """
+    Outcome of a topng() run.
+
+    Attributes:
+        output_dir (str): Absolute output directory.
+        saved (list): Slide numbers exported in this run.
+        skipped (list): Slide numbers skipped because they were already done.
+        failed (dict): Slide number -> reason, for slides that could not be exported.
+        duplicates (dict): Slide number -> slide it was copied from instead of rendered.
+        cached (list): Slide numbers taken from the render cache instead of rendered.
+        unchanged (list): Slide numbers whose existing image was kept because the new
+                          render matched it.
+        hashes (dict): Slide number -> 64-bit perceptual hash (dHash), when indexing.
+        fonts (dict): Typeface -> (status, font used), when fonts were checked. See
+                      fonts.resolve_fonts().
+        render_times (dict): Slide number -> seconds PowerPoint took to export it, for
+                             slides that were rendered (not copied or cached).
+        contact_sheet (str): Path of the overview image, when one was written.
+        animation (str): Path of the animation, when one was written.
+        animation_error (str): Why the animation was abandoned. The slide images
+                               are exported regardless.
+        pdf (str): Path of the PDF, when one was written.
+        notes_pages (list): Slide numbers whose notes page was exported.
+        notes_failed (dict): Slide number -> error message, for notes pages.
+        handouts (list): Paths of the handout pages.
+        text (dict): Slide number -> {"title", "text", "notes", "alt_text"}, when
+                     text was extracted.
+        shapes (dict): Slide number -> {"size", "shapes", "links"}, when shape maps
+                       were written.
+        profile (dict): Performance report, when profiling was requested.
+        retries (dict): Number of retried calls, as {"open": n, "slide": n, "pdf": n}.
+        restarts (int): Number of times the renderer was restarted.
+        error (str): Set when the whole job was aborted.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.saved = []
+        self.skipped = []
+        self.failed = {}
+        self.duplicates = {}
+        self.cached = []
+        self.unchanged = []
+        self.hashes = {}
+        self.fonts = {}
+        self.render_times = {}
+        self.contact_sheet = None
+        self.animation = None
+        self.animation_error = None
+        self.pdf = None
+        self.notes_pages = []
+        self.notes_failed = {}
+        self.handouts = []
+        self.text = {}
+        self.shapes = {}
+        self.profile = None
+        self.retries = {"open": 0, "slide": 0, "pdf": 0}
+        self.restarts = 0
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.error is None and not self.failed and not self.notes_failed
+
+    def merge(self, other):
+        """Fold the result of another run (for example a parallel shard) into this one."""
+        if other is None:
+            self.error = self.error or "A shard was rejected, see the log for details."
+            return
+        self.saved = sorted(self.saved + other.saved)
+        self.skipped = sorted(self.skipped + other.skipped)
+        self.failed.update(other.failed)
+        self.duplicates.update(other.duplicates)
+        self.cached = sorted(self.cached + other.cached)
+        self.unchanged = sorted(self.unchanged + other.unchanged)
+        self.hashes.update(other.hashes)
+        self.fonts.update(other.fonts)
+        self.render_times.update(other.render_times)
+        self.contact_sheet = self.contact_sheet or other.contact_sheet
+        self.animation = self.animation or other.animation
+        self.animation_error = self.animation_error or other.animation_error
+        self.pdf = self.pdf or other.pdf
+        self.notes_pages = sorted(self.notes_pages + other.notes_pages)
+        self.notes_failed.update(other.notes_failed)
+        self.handouts = self.handouts or other.handouts
+        self.text.update(other.text)
+        self.shapes.update(other.shapes)
+        self.profile = self.profile or other.profile
+        for key, value in other.retries.items():
+            self.retries[key] = self.retries.get(key, 0) + value
+        self.restarts += other.restarts
+        self.error = self.error or other.error
+
+    def to_dict(self):
+        """Plain-JSON form of the result."""
+        profile = None
+        if self.profile:
+            from .profile import json_ready
+            profile = json_ready(self.profile)
+        return {
+            "output_dir": self.output_dir,
+            "saved": list(self.saved),
+            "skipped": list(self.skipped),
+            "failed": dict((str(k), v) for k, v in self.failed.items()),
+            "duplicates": dict((str(k), v) for k, v in self.duplicates.items()),
+            "cached": list(self.cached),
+            "unchanged": list(self.unchanged),
+            "hashes": dict((str(k), "%016x" % v) for k, v in self.hashes.items()),
+            "fonts": dict((k, list(v)) for k, v in self.fonts.items()),
+            "render_times": dict((str(k), round(v, 4)) for k, v in self.render_times.items()),
+            "contact_sheet": self.contact_sheet,
+            "animation": self.animation,
+            "animation_error": self.animation_error,
+            "pdf": self.pdf,
+            "notes_pages": list(self.notes_pages),
+            "notes_failed": dict((str(k), v) for k, v in self.notes_failed.items()),
+            "handouts": list(self.handouts),
+            "text": dict((str(k), v) for k, v in self.text.items()),
+            "shapes": dict((str(k), v) for k, v in self.shapes.items()),
+            "profile": profile,
+            "retries": dict(self.retries),
+            "restarts": self.restarts,
+            "error": self.error,
+        }
+
+    def __repr__(self):
+        return "ExportResult(saved=%d, skipped=%d, failed=%d, retries=%d, error=%r)" % (
+            len(self.saved), len(self.skipped), len(self.failed),
+            sum(self.retries.values()), self.error)
+
+
+def topng(pptx, output_dir="./output", slide_range=None, scale=None, manifest=False,
+          resume=False, open_timeout=None, slide_timeout=None, total_timeout=None,
+          retry=None, progress=None, slides=None, skip_hidden=False, dedupe=False,
+          cache=None, skip_unchanged=False, phash_index=None, contact_sheet=None,
+          animation=None, frame_duration=None, pdf=None, pdf_mode="native", tracer=None,
+          profile=False, downsample=False, lightweight_open=False, font_substitutions=None,
+          notes_pages=False, handouts=None, extract_text=False, shape_map=False):
     """
     Convert PowerPoint slides to PNG images.
 
@@ -21,8 +164,142 @@ def topng(pptx, output_dir="./output", slide_range=None, scale=None):
         scale (int): Optional. Resolution scale.
                      If None or 0, it adapts to the screen's long edge resolution.
                      If specified (e.g., 1, 2), it scales relative to original slide points.
+        manifest (bool|str): Optional. Append an NDJSON record (file, size, sha256,
+                             width, height, render time) for every finished slide.
+                             True writes 'manifest.ndjson' into output_dir; a string
+                             is used as the manifest path.
+        resume (bool): Optional. Skip slides whose manifest record shows a verified,
+                       finished export of the same deck at the same size, and render
+                       only the rest. Implies manifest=True if no manifest is given.
+        open_timeout (float): Optional. Seconds allowed for opening the presentation.
+        slide_timeout (float): Optional. Seconds allowed for exporting one slide.
+        total_timeout (float): Optional. Seconds allowed for the whole job.
+        retry (RetryPolicy|int): Optional. Retry policy for transient COM errors such as
+                                 RPC_E_CALL_REJECTED ("server busy"). An int sets the
+                                 maximum attempts; 0 or False disables retries.
+                                 Default: RetryPolicy() (3 attempts, exponential backoff).
+        progress (callable): Optional. Called as progress(slide, status) after every slide,
+                             with status 'saved', 'skipped' or 'failed'.
+        slides (str|list): Optional. Slide selection, resolved once from the deck before
+                           rendering and exported in a single open. Either slide numbers
+                           (e.g. [1, 3, 8]) or a string such as "1-5,8,10-",
+                           "section:Appendix" or "1-20,!4". Overrides slide_range.
+        skip_hidden (bool): Optional. Leave out slides hidden in the slide show.
+        dedupe (bool): Optional. Hash every slide's XML together with its layout, master
+                       and media before rendering, render each distinct slide once and
+                       hard-link (or copy) the result to its duplicates.
+        cache (str|RenderCache): Optional. Render cache shared between decks and processes,
+                                 keyed on normalized slide content, size and format. A path
+                                 uses RenderCache(path) with its default 2 GiB LRU cap.
+        skip_unchanged (bool|float): Optional. Compare each new render with the existing
+                                     Slide_N.png and keep the old file (same bytes, same
+                                     mtime) if it matches. True requires identical pixels;
+                                     a float such as 0.002 allows that mean difference
+                                     (needs Pillow).
+        phash_index (bool|str|SlideIndex): Optional. Compute a 64-bit perceptual hash
+                                           (dHash) of every exported slide and record it
+                                           in a SQLite index for index.find_similar().
+                                           True uses the default index; a string is
+                                           the index path (needs Pillow).
+        contact_sheet (bool|str): Optional. Also write an overview image: a 3-column grid
+                                  of labelled thumbnails, filled in as slides finish
+                                  and written row by row. True writes
+                                  'contact_sheet.png' into output_dir; a string is
+                                  used as the path (needs Pillow).
+        animation (str): Optional. Also stream the slides, as they finish, into an
+                         animation at this path. The extension picks the format:
+                         .apng/.png (built natively, without decoding), .gif/.webp
+                         (ffmpeg, or Pillow without it), .mp4/.mov/.mkv/.webm (ffmpeg).
+                         Failed slides are left out.
+        frame_duration (float|dict|list): Optional. Seconds per slide in the animation:
+                                          one number, a dict of slide number -> seconds,
+                                          or a list aligned with the exported slides.
+                                          Default 2 seconds.
+        pdf (bool|str): Optional. Also write a PDF, using the presentation that is
+                        already open instead of opening it a second time. True
+                        writes '<deck name>.pdf' into output_dir; a string is used
+                        as the path.
+        pdf_mode (str): Optional. 'native' (default) saves the whole deck through
+                        PowerPoint's own PDF export, with selectable text. 'images'
+                        assembles the PDF from the exported slides, so it contains
+                        exactly the selected slides (needs Pillow).
+        tracer (instrument.Tracer): Optional. Receives a 'topng' span per call with
+                                    child spans for dispatch, open, page_setup, each
+                                    slide export, postprocess, write, pdf and close,
+                                    plus counters for slides, bytes and failures.
+                                    Default: instrument.get_tracer(), which records
+                                    nothing until instrument.set_tracer() is called.
+        profile (bool|str): Optional. Measure the run and write a report: time per
+                            phase, the slowest slides with their complexity (shapes,
+                            pictures and image bytes, charts, SmartArt, media,
+                            effects) and the output size of every slide. True
+                            writes 'profile.json' into output_dir; a string is used
+                            as the path. The summary is printed and also stored in
+                            result.profile.
+        downsample (bool): Optional. Render from a temporary copy of the deck whose
+                           photos are shrunk to the largest size they are shown at
+                           in the target resolution, decoded in parallel. Saves
+                           the decode time of high-megapixel images; the native
+                           PDF is also made from the copy (.pptx only, needs Pillow).
+        lightweight_open (bool): Optional. Render from a temporary copy of the deck in
+                                 which video and audio are pictures of their poster
+                                 frame and OLE objects pictures of their stored
+                                 preview, so PowerPoint does not load the embedded
+                                 files on open. Still images look the same; a native
+                                 PDF has no playable media (.pptx only).
+        font_substitutions (dict|str|bool): Optional. Check the deck's fonts against
+                                            the installed ones (indexed once and cached
+                                            in ~/.pptx2png/fonts.json) and replace fonts
+                                            in the open copy: {"Helvetica": "Arial"} or
+                                            a JSON file of such a map. Renders then match
+                                            between hosts instead of depending on each
+                                            one's fallback. True only reports missing
+                                            fonts. The result is in result.fonts.
+        notes_pages (bool): Optional. Also export the notes page of every selected slide
+                            (the slide above its speaker notes) as Notes_N.png, from
+                            the same open presentation. The long edge matches the
+                            slide images.
+        handouts (int): Optional. Also lay out the slide images on Letter-size handout
+                        pages, Handout_1.png, ...: 3 per page (with lines for notes)
+                        or 6 per page. Built from the renders, not rendered again
+                        (needs Pillow).
+        extract_text (bool): Optional. Also write Slide_N.text.json for every selected
+                             slide: title, body text (tables included), speaker
+                             notes and alt text. Read from the package on a
+                             background thread while PowerPoint renders, so the
+                             deck is not opened a second time (.pptx only). Also
+                             returned in result.text.
+        shape_map (bool): Optional. Also write Slide_N.shapes.json for every selected
+                          slide: the box of every visible shape and hyperlink in
+                          pixels of the slide image (target_w x target_h), for
+                          clickable overlays. Read from the package in the same
+                          background pass as extract_text (.pptx only). Also
+                          returned in result.shapes.
+
+    Each slide is first exported into a staging directory inside output_dir
+    and then atomically renamed, so an interrupted run never leaves a
+    half-written Slide_N.png behind.
+
+    When any timeout is set, a private PowerPoint instance is used and a
+    watchdog kills it if a call overruns. The slide is reported as failed,
+    the renderer is restarted and the remaining slides are still exported.
+    A slide that still fails after its retries is reported the same way.
+
+    Returns:
+        ExportResult: Saved, skipped and failed slides (None if the arguments are invalid).
+
+    Raises:
+        BackendUnavailableError: If pywin32 is not installed.
+        ImportError: If an option needs Pillow and it is not installed.
     """
     # 1. Path handling
+    tracer = tracer or _instrument.get_tracer()
+    profiler = None
+    if profile:
+        from . import profile as _profile
+        profiler = _profile.ProfileCollector()
+        exporters = tracer.exporters if isinstance(tracer, _instrument.Tracer) else []
+        tracer = _instrument.Tracer(list(exporters) + [profiler])
     pptx_path = os.path.abspath(pptx)
     output_path = os.path.abspath(output_dir)
 
@@ -37,6 +314,62 @@ def topng(pptx, output_dir="./output", slide_range=None, scale=None):
         print("Error: File '%s' not found." % pptx_path)
         return
 
+    # Fail before touching the filesystem if pywin32 (or a needed optional library) is missing
+    load_backend()
+    if (skip_unchanged and skip_unchanged is not True) or phash_index or contact_sheet \
+            or downsample:
+        _require_pillow()
+    if pdf and pdf_mode not in ("native", "images"):
+        print("Error: pdf_mode must be 'native' or 'images', not '%s'." % pdf_mode)
+        return
+    if pdf and pdf_mode == "images":
+        _require_pillow()
+    if handouts:
+        from .handout import HANDOUT_LAYOUTS, make_handouts
+        if handouts not in HANDOUT_LAYOUTS:
+            print("Error: handouts must be 3 or 6 slides per page, not %r." % handouts)
+            return
+        _require_pillow()
+    if animation:
+        from . import animate as _animate
+        kind = _animate.FORMATS.get(os.path.splitext(animation)[1].lower())
+        if kind is None:
+            print("Error: Unsupported animation format '%s'." % animation)
+            return
+        if kind != "apng" and not _animate.find_ffmpeg():
+            if kind == "video":
+                print("Error: Video output needs ffmpeg. Install it and add it to PATH, "
+                      "or set PPTX2PNG_FFMPEG.")
+                return
+            _require_pillow()
+
+    # Resolve the slide selection up front from the package metadata
+    selection = None
+    if slides is not None or skip_hidden:
+        try:
+            deck = read_deck(pptx_path)
+            selection = resolve_selection(slides, deck, skip_hidden)
+        except zipfile.BadZipFile:
+            print("Error: Slide selections need a .pptx file, '%s' is not one." % pptx_path)
+            return
+        except ValueError as e:
+            print("Error: %s" % e)
+            return
+
+    # A bad substitution map is an argument error, reported before PowerPoint starts
+    substitutions = None
+    if font_substitutions:
+        from .fonts import load_substitutions
+        try:
+            substitutions = load_substitutions(
+                None if font_substitutions is True else font_substitutions)
+        except OSError as e:
+            print("Error: Could not read the font substitutions '%s'. %s" % (font_substitutions, e))
+            return
+        except ValueError as e:
+            print("Error: Invalid font substitutions '%s'. %s" % (font_substitutions, e))
+            return
+
     if not os.path.exists(output_path):
         try:
             os.makedirs(output_path)
@@ -45,24 +378,75 @@ def topng(pptx, output_dir="./output", slide_range=None, scale=None):
             print("Error: Could not create output directory. %s" % e)
             return
 
+    manifest_path = None
+    if resume and not manifest:
+        manifest = True
+    if manifest:
+        if isinstance(manifest, str):
+            manifest_path = os.path.abspath(manifest)
+        else:
+            manifest_path = os.path.join(output_path, _manifest.MANIFEST_NAME)
+
     # 2. Initialize PowerPoint Application
-    powerpoint = None
-    presentation = None
+    # A private instance (DispatchEx) is only needed when the watchdog may have to kill it
+    isolated = bool(open_timeout or slide_timeout or total_timeout)
+    session = PowerPointSession(pptx_path, isolated=isolated)
+    # Ended in the finally block below; covers everything from COM start-up to close
+    job_span = tracer.span("topng", deck=os.path.basename(pptx_path)).start()
     try:
-        # Use DispatchEx to ensure a fresh instance if needed, or Dispatch for shared
-        powerpoint = win32com.client.Dispatch("PowerPoint.Application")
+        with tracer.span("dispatch", isolated=isolated):
+            session.start()
+    except BackendUnavailableError as e:
+        job_span.end(str(e))
+        raise
     except Exception as e:
         print("Error: Could not initialize PowerPoint. Make sure Microsoft PowerPoint is installed.")
         print("Details: %s" % e)
+        job_span.end(str(e))
         return
 
+    if retry is None:
+        policy = RetryPolicy()
+    elif isinstance(retry, RetryPolicy):
+        policy = retry
+    elif retry:
+        policy = RetryPolicy(max_attempts=retry)
+    else:
+        policy = NO_RETRY
+
+    result = ExportResult(output_path)
+    deadline = time.monotonic() + total_timeout if total_timeout else None
+    guarded = GuardedSession(session, policy, open_timeout, slide_timeout, deadline)
+    staging_path = None
+    render_size = None
+    preflight = None
+    side_channel = None
+    if extract_text or shape_map:
+        from concurrent.futures import ThreadPoolExecutor
+        # Reads the package next to PowerPoint, for extract_text and shape_map
+        side_channel = ThreadPoolExecutor(max_workers=1)
+    text_job = None
+    shapes_job = None
+    slide_index = None
+    sheet = None
+    writer = None
     try:
-        # 3. Open Presentation (WithWindow=False attempts background processing)
-        # Note: Some PPT versions force visibility despite this flag.
-        presentation = powerpoint.Presentations.Open(pptx_path, WithWindow=False)
+        if downsample or lightweight_open:
+            preflight, render_size = _make_preflight(pptx_path, scale, downsample,
+                                                     lightweight_open, tracer)
+            if preflight:
+                session.pptx_path = preflight.path
+
+        if substitutions is not None:
+            with tracer.span("fonts"):
+                _check_fonts(pptx_path, substitutions, session, result)
+
+        # 3. Open Presentation
+        with tracer.span("open"):
+            guarded.open()
 
         # 4. Determine Slide Range
-        total_slides = presentation.Slides.Count
+        total_slides = session.slide_count
         start_slide = 1
         end_slide = total_slides
 
@@ -77,76 +461,273 @@ def topng(pptx, output_dir="./output", slide_range=None, scale=None):
                 start_slide = s_req
                 end_slide = e_req
 
-        # 5. Calculate Target Resolution
-        slide_width = presentation.PageSetup.SlideWidth
-        slide_height = presentation.PageSetup.SlideHeight
-        
-        target_w = 0
-        target_h = 0
+        if selection is None:
+            # CRITICAL FIX: 'range' here now refers to the built-in function,
+            # because the argument was renamed to 'slide_range'
+            selection = list(range(start_slide, end_slide + 1))
+        else:
+            selection = [i for i in selection if i <= total_slides]
 
-        # Logic: If scale is not provided, use screen resolution (Long Edge) with a boost
-        if not scale:
-            try:
-                user32 = ctypes.windll.user32
-                screen_w = user32.GetSystemMetrics(0)
-                screen_h = user32.GetSystemMetrics(1)
+        # The side channel gets the same resolved list as the PNG export
+        if extract_text:
+            from .text import write_slide_text
+            text_job = side_channel.submit(write_slide_text, pptx_path, selection, output_path)
 
-                # Long edge of the screen
-                screen_long = max(screen_w, screen_h)
+        # 5. Calculate Target Resolution
+        with tracer.span("page_setup"):
+            slide_width, slide_height = session.slide_size
+        
+        if render_size:
+            target_w, target_h = render_size
+        else:
+            target_w, target_h = _target_size(slide_width, slide_height, scale)
 
-                boost = float(os.getenv("PPTX2PNG_SCREEN_SCALE", 2))
-                if boost <= 0:
-                    boost = 2
+        print("Processing '%s'..." % os.path.basename(pptx))
+        print("Target Size: %dx%d px" % (target_w, target_h))
+        print("Converting slides %s..." % (format_ranges(selection) or "(none)"))
 
-                target_long = int(screen_long * boost)
+        if shape_map:
+            # Needs the final size, so it starts once PowerPoint reported the slide size
+            from .shapes import write_shape_maps
+            shapes_job = side_channel.submit(write_shape_maps, pptx_path, selection,
+                                             target_w, target_h, output_path)
 
-                # Calculate aspect ratio of the slide
-                slide_ratio = slide_width / slide_height
+        # Options that change the pixels of a slide, so renders made with and
+        # without them never share cache entries. A failed pre-flight renders
+        # the original deck.
+        render_options = {
+            "font_substitutions": substitutions,
+            "downsample": bool(downsample and preflight),
+            "lightweight_open": bool(lightweight_open and preflight),
+        }
 
-                if slide_ratio >= 1:  # Landscape Slide
-                    target_w = target_long
-                    target_h = int(target_long / slide_ratio)
-                else:  # Portrait Slide
-                    target_h = target_long
-                    target_w = int(target_long * slide_ratio)
+        # 6. Iterate and Export (into staging, then atomic rename)
+        deck_hash = _manifest.file_sha256(pptx_path) if manifest_path else None
+        finished = {}
+        if resume:
+            for record in _manifest.read_manifest(manifest_path).values():
+                if _manifest.verify_record(record, output_path, target_w, target_h, deck_hash):
+                    finished[record["slide"]] = record
+            print("Resume: %d slide(s) already completed." % len(finished))
 
-                print(
-                    f"Mode: Auto-Resolution (Screen long edge {screen_long}px, "
-                    f"boost {boost}x -> target long {target_long}px)"
-                )
-            except Exception:
-                # Fallback if ctypes fails
-                target_w = int(slide_width * 2)
-                target_h = int(slide_height * 2)
-                print("Mode: Fallback Resolution (2x)")
-        else:
-            # Manual scale
-            target_w = int(slide_width * scale)
-            target_h = int(slide_height * scale)
-            print("Mode: Manual Scale (%dx)" % scale)
+        # Pre-pass: content fingerprint -> first slide exported with it
+        if cache is not None:
+            from .cache import RenderCache, render_key
+            if not isinstance(cache, RenderCache):
+                cache = RenderCache(cache)
+        fingerprints = {}
+        if dedupe or cache:
+            with tracer.span("fingerprint"):
+                fingerprints = slide_fingerprints(pptx_path, selection)
+        rendered = {}
+        if phash_index:
+            # Imported on demand: sqlite3 noticeably adds to startup
+            from .index import SlideIndex
+            from .imaging import dhash
+            if isinstance(phash_index, SlideIndex):
+                slide_index = phash_index
+            else:
+                slide_index = SlideIndex(None if phash_index is True else phash_index)
 
-        print("Processing '%s'..." % os.path.basename(pptx))
-        print("Target Size: %dx%d px" % (target_w, target_h))
-        print("Converting slides %d to %d..." % (start_slide, end_slide))
-
-        # 6. Iterate and Export
-        count = 0
-        # CRITICAL FIX: 'range' here now refers to the built-in function, 
-        # because the argument was renamed to 'slide_range'
-        for i in range(start_slide, end_slide + 1):
-            slide = presentation.Slides(i)
+        staging_path = _manifest.make_staging_dir(output_path)
+        if skip_unchanged:
+            from .imaging import images_match
+        if contact_sheet:
+            from .contact import ContactSheet, CONTACT_SHEET_NAME
+            sheet_path = contact_sheet if isinstance(contact_sheet, str) else \
+                os.path.join(output_path, CONTACT_SHEET_NAME)
+            sheet_path = os.path.abspath(sheet_path)
+            sheet = ContactSheet(os.path.join(staging_path, os.path.basename(sheet_path)),
+                                 len(selection), target_w, target_h)
+        if animation:
+            durations = _animate.frame_durations(frame_duration, selection)
+            try:
+                writer = _animate.AnimationWriter(
+                    os.path.join(staging_path, os.path.basename(animation)),
+                    tick_ms=_animate.tick_for(durations.values()))
+            except (OSError, ValueError) as e:
+                _abandon_animation(None, e, result)
+        for i in selection:
             # Filename format: Slide_1.png, Slide_2.png
             image_name = "Slide_%d.png" % i
+            fingerprint = fingerprints.get(i)
+            if i in finished:
+                if fingerprint:
+                    rendered.setdefault(fingerprint, i)
+                result.skipped.append(i)
+                tracer.count("slides", status="skipped")
+                if sheet:
+                    sheet.add(i, os.path.join(output_path, image_name))
+                if writer:
+                    writer = _add_frame(writer, os.path.join(output_path, image_name),
+                                        durations[i], result)
+                print("Skipped (already done): %s" % image_name)
+                _notify(progress, i, "skipped")
+                continue
+            if guarded.expired():
+                result.failed[i] = "total timeout"
+                tracer.count("slides", status="failed")
+                tracer.count("failures", reason="total timeout")
+                if sheet:
+                    sheet.add(i)
+                print("Failed: %s (total timeout reached)" % image_name)
+                _notify(progress, i, "failed")
+                continue
             image_path = os.path.join(output_path, image_name)
+            staged_path = os.path.join(staging_path, image_name)
 
-            # Export to PNG
-            slide.Export(image_path, "PNG", target_w, target_h)
-            count += 1
-            print("Saved: %s" % image_name)
+            source = rendered.get(fingerprint) if dedupe else None
+            source_name = "Slide_%d.png" % source if source else None
+            key = render_key(fingerprint, target_w, target_h, options=render_options) \
+                if cache and fingerprint else None
+            hit = False
+
+            # Export to PNG, guarded by the watchdog and the retry policy
+            started = time.perf_counter()
+            try:
+                if source:
+                    # Identical to a slide already exported: reuse its image
+                    _manifest.link_or_copy(os.path.join(output_path, source_name), staged_path)
+                elif key and cache.get(key, staged_path):
+                    hit = True
+                else:
+                    with tracer.span("export", slide=i):
+                        guarded.export_slide(i, staged_path, target_w, target_h, image_name)
+                    if key:
+                        cache.put(key, staged_path)
+            except Exception as e:
+                result.failed[i] = "timeout" if isinstance(e, RenderTimeout) else str(e)
+                print("Failed: %s (%s)" % (image_name, result.failed[i]))
+                tracer.count("slides", status="failed")
+                tracer.count("failures",
+                             reason="timeout" if isinstance(e, RenderTimeout) else "error")
+                if sheet:
+                    sheet.add(i)
+                if guarded.needs_restart and not guarded.expired():
+                    print("Restarting renderer...")
+                    guarded.restart()
+                _notify(progress, i, "failed")
+                continue
+            render_time = time.perf_counter() - started
+            if not source and not hit:
+                result.render_times[i] = render_time
+
+            with tracer.span("postprocess", slide=i):
+                if slide_index:
+                    # Hash while the render is still hot in the page cache; duplicates share it
+                    phash = result.hashes.get(source) if source else None
+                    result.hashes[i] = phash if phash is not None else dhash(staged_path)
+                if sheet:
+                    sheet.add(i, staged_path)
+                if writer:
+                    # Read while still in the page cache; encoding runs on a background thread
+                    writer = _add_frame(writer, staged_path, durations[i], result)
+
+                unchanged = bool(skip_unchanged) and os.path.exists(image_path) and \
+                    images_match(staged_path, image_path,
+                                 0 if skip_unchanged is True else skip_unchanged)
+            if tracer.enabled:
+                tracer.count("bytes", os.path.getsize(staged_path))
+
+            with tracer.span("write", slide=i):
+                if unchanged:
+                    # Leave the existing file untouched so downstream sync sees no change
+                    os.remove(staged_path)
+                else:
+                    _manifest.commit_file(staged_path, image_path)
+                if manifest_path:
+                    _manifest.append_record(
+                        manifest_path,
+                        _manifest.make_record(i, image_path, render_time, deck_hash, source_name,
+                                              changed=not unchanged)
+                    )
+                if slide_index:
+                    slide_index.add(image_path, result.hashes[i], pptx_path, i)
+            tracer.count("slides", status="saved")
+            result.saved.append(i)
+            if unchanged:
+                result.unchanged.append(i)
+            if source:
+                result.duplicates[i] = source
+                print("Saved: %s (duplicate of %s)" % (image_name, source_name))
+            else:
+                if fingerprint:
+                    rendered[fingerprint] = i
+                if hit:
+                    result.cached.append(i)
+                    print("Saved: %s (from cache)" % image_name)
+                else:
+                    print("Saved: %s" % image_name)
+            _notify(progress, i, "saved")
+
+            if guarded.needs_restart and not guarded.expired():
+                guarded.restart()
+
+        if notes_pages:
+            _export_notes_pages(session, guarded, selection, output_path, staging_path,
+                                max(target_w, target_h), result, tracer)
+
+        if sheet:
+            sheet.close()
+            _manifest.commit_file(sheet.path, sheet_path)
+            result.contact_sheet = sheet_path
+            print("Contact sheet: %s" % sheet_path)
+        if writer:
+            closing, writer = writer, None
+            try:
+                closing.close()
+            except Exception as e:
+                _abandon_animation(None, e, result)
+            else:
+                result.animation = os.path.abspath(animation)
+                _manifest.commit_file(closing.path, result.animation)
+                print("Animation: %s (%d frames)" % (result.animation, closing.frames))
+
+        if pdf:
+            with tracer.span("pdf", mode=pdf_mode):
+                _save_pdf(pdf, pdf_mode, pptx_path, output_path, staging_path, selection,
+                          guarded, slide_timeout, result)
+
+        if text_job:
+            try:
+                result.text = text_job.result()
+                print("Text: %d slide(s) extracted" % len(result.text))
+            except (zipfile.BadZipFile, KeyError, SyntaxError) as e:
+                # SyntaxError covers XML parse errors
+                print("Warning: Text not extracted from '%s' (%s)." % (pptx_path, e))
 
-        print("Done! %d images saved to '%s'." % (count, output_path))
+        if shapes_job:
+            try:
+                result.shapes = shapes_job.result()
+                print("Shape maps: %d slide(s)" % len(result.shapes))
+            except (zipfile.BadZipFile, KeyError, SyntaxError, TypeError, ValueError) as e:
+                print("Warning: Shape maps not written for '%s' (%s)." % (pptx_path, e))
+
+        if handouts:
+            with tracer.span("handouts"):
+                done = [i for i in selection if i in result.saved or i in result.skipped]
+                result.handouts = make_handouts(
+                    [os.path.join(output_path, "Slide_%d.png" % i) for i in done],
+                    output_path, handouts)
+            print("Handouts: %d page(s)" % len(result.handouts))
+
+        if result.skipped:
+            print("Done! %d images saved, %d already done, in '%s'." % (
+                len(result.saved), len(result.skipped), output_path))
+        else:
+            print("Done! %d images saved to '%s'." % (len(result.saved), output_path))
+        if result.duplicates:
+            print("Rendered %d distinct slides, %d duplicates reused." % (
+                len(result.saved) - len(result.duplicates), len(result.duplicates)))
+        if result.unchanged:
+            print("%d slide(s) unchanged, existing files kept." % len(result.unchanged))
+        if result.cached:
+            print("%d slide(s) taken from the render cache." % len(result.cached))
+        if result.failed:
+            print("Failed slides: %s" % ", ".join(str(i) for i in sorted(result.failed)))
 
     except Exception as e:
+        result.error = str(e)
         print("An error occurred during conversion: %s" % e)
         # Import traceback to print full stack trace for debugging
         import traceback
@@ -154,13 +735,234 @@ def topng(pptx, output_dir="./output", slide_range=None, scale=None):
         
     finally:
         # 7. Cleanup Resources
-        if presentation:
+        guarded.stop()
+        result.retries = dict(guarded.retries)
+        result.restarts = guarded.restarts
+        if sheet and result.contact_sheet is None:
+            sheet.abort()
+        if writer:
+            # Aborted job: stop the encoder, the partial file goes with the staging folder
             try:
-                presentation.Close()
+                writer.close()
             except Exception:
                 pass
-        # powerpoint.Quit() is intentionally omitted to avoid closing user's active windows
-        pass
+        _manifest.remove_staging_dir(staging_path)
+        if slide_index is not None and slide_index is not phash_index:
+            slide_index.close()
+        with tracer.span("close"):
+            session.close()
+        if preflight:
+            preflight.close()
+        if side_channel:
+            side_channel.shutdown(wait=True)
+        job_span.set("slides", len(result.saved))
+        job_span.end(result.error)
+
+    if profiler:
+        result.profile = _profile.build_report(profiler, pptx_path, result)
+        profile_path = os.path.abspath(profile) if isinstance(profile, str) else \
+            os.path.join(output_path, _profile.PROFILE_NAME)
+        _profile.write_report(result.profile, profile_path)
+        print(_profile.format_report(result.profile))
+        print("Profile saved to '%s'." % profile_path)
+
+    return result
+
+
+
+def _export_notes_pages(session, guarded, selection, output_path, staging_path, long_edge,
+                        result, tracer):
+    """Export Notes_N.png for the selected slides that were saved or already done."""
+    notes_w, notes_h = session.notes_size
+    # Notes pages are usually portrait; their long edge matches the slide images
+    scale = float(long_edge) / max(notes_w, notes_h)
+    width, height = int(notes_w * scale), int(notes_h * scale)
+    for i in selection:
+        if i in result.failed:
+            continue
+        image_name = "Notes_%d.png" % i
+        image_path = os.path.join(output_path, image_name)
+        if i in result.skipped and os.path.exists(image_path):
+            continue
+        if guarded.expired():
+            result.notes_failed[i] = "total timeout"
+            continue
+        staged_path = os.path.join(staging_path, image_name)
+        try:
+            with tracer.span("notes", slide=i):
+                guarded.export_notes_page(i, staged_path, width, height, image_name)
+        except Exception as e:
+            result.notes_failed[i] = "timeout" if isinstance(e, RenderTimeout) else str(e)
+            print("Failed: %s (%s)" % (image_name, result.notes_failed[i]))
+        else:
+            _manifest.commit_file(staged_path, image_path)
+            result.notes_pages.append(i)
+            print("Saved: %s" % image_name)
+        if guarded.needs_restart and not guarded.expired():
+            guarded.restart()
+
+
+def _make_preflight(pptx_path, scale, downsample, lightweight, tracer):
+    """
+    Pre-flight copy of the deck for topng(downsample=True or lightweight_open=True).
+
+    Returns:
+        tuple: (PreflightCopy or None, (target_w, target_h) or None). On failure
+               the original deck is rendered instead.
+    """
+    try:
+        slide_cx, slide_cy = read_deck(pptx_path).slide_size
+    except (zipfile.BadZipFile, KeyError) as e:
+        print("Warning: Pre-flight skipped, '%s' is not a .pptx file (%s)." % (pptx_path, e))
+        return None, None
+    # The target size must be known before opening, so it comes from the package
+    render_size = _target_size(slide_cx / 12700.0, slide_cy / 12700.0, scale)
+    try:
+        with tracer.span("preflight"):
+            from .preflight import PreflightCopy
+            copy = PreflightCopy(pptx_path, render_size if downsample else None, lightweight)
+    except (OSError, SyntaxError, ValueError, KeyError, zipfile.BadZipFile) as e:
+        print("Warning: Pre-flight failed, rendering the original deck (%s)." % e)
+        return None, render_size
+    print("Pre-flight: %s" % copy.describe())
+    return copy, render_size
+
+
+def _add_frame(writer, path, duration, result):
+    """
+    Queue one slide image on the animation writer.
+
+    Returns:
+        AnimationWriter: The writer, or None once the encoder failed and the
+                         animation was abandoned.
+    """
+    try:
+        with open(path, "rb") as f:
+            writer.add(f.read(), duration)
+        return writer
+    except Exception as e:
+        # The animation is a side output; an encoder error must not stop the export
+        _abandon_animation(writer, e, result)
+        return None
+
+
+def _abandon_animation(writer, error, result):
+    result.animation_error = str(error) or error.__class__.__name__
+    print("Warning: Animation abandoned, the slide images are still exported (%s)." %
+          result.animation_error)
+    if writer:
+        # Stops the encoder thread; the partial file goes with the staging folder
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+
+def _check_fonts(pptx_path, substitutions, session, result):
+    """Resolve the deck's fonts into result.fonts and queue the substitutions on the session."""
+    from .fonts import resolve_fonts
+    try:
+        result.fonts = resolve_fonts(pptx_path, substitutions)
+    except zipfile.BadZipFile:
+        print("Warning: Fonts not checked, '%s' is not a .pptx file." % pptx_path)
+        return
+    session.font_substitutions = dict((face, used) for face, (status, used)
+                                      in result.fonts.items() if status == "substituted")
+    for face, used in sorted(session.font_substitutions.items()):
+        print("Font: '%s' -> '%s'" % (face, used))
+    missing = sorted(face for face, (status, _) in result.fonts.items() if status == "missing")
+    if missing:
+        print("Warning: Fonts not installed, PowerPoint will substitute them: %s" %
+              ", ".join(missing))
+
+
+def _target_size(slide_width, slide_height, scale):
+    """Pixel size of the slide images, from the slide size in points and the scale option."""
+    # Logic: If scale is not provided, use screen resolution (Long Edge) with a boost
+    if not scale:
+        try:
+            import ctypes
+            user32 = ctypes.windll.user32
+            screen_w = user32.GetSystemMetrics(0)
+            screen_h = user32.GetSystemMetrics(1)
+
+            # Long edge of the screen
+            screen_long = max(screen_w, screen_h)
+
+            boost = float(os.getenv("PPTX2PNG_SCREEN_SCALE", 2))
+            if boost <= 0:
+                boost = 2
+
+            target_long = int(screen_long * boost)
+
+            # Calculate aspect ratio of the slide
+            slide_ratio = slide_width / slide_height
+
+            if slide_ratio >= 1:  # Landscape Slide
+                target_w = target_long
+                target_h = int(target_long / slide_ratio)
+            else:  # Portrait Slide
+                target_h = target_long
+                target_w = int(target_long * slide_ratio)
+
+            print(
+                f"Mode: Auto-Resolution (Screen long edge {screen_long}px, "
+                f"boost {boost}x -> target long {target_long}px)"
+            )
+        except Exception:
+            # Fallback if ctypes fails
+            target_w = int(slide_width * 2)
+            target_h = int(slide_height * 2)
+            print("Mode: Fallback Resolution (2x)")
+    else:
+        # Manual scale
+        target_w = int(slide_width * scale)
+        target_h = int(slide_height * scale)
+        print("Mode: Manual Scale (%dx)" % scale)
+    return target_w, target_h
+
+
+def _save_pdf(pdf, pdf_mode, pptx_path, output_path, staging_path, selection, guarded,
+              slide_timeout, result):
+    """Write the PDF of a topng() run. A failure is recorded in result.error."""
+    if isinstance(pdf, str):
+        pdf_path = os.path.abspath(pdf)
+    else:
+        pdf_path = os.path.join(output_path,
+                                os.path.splitext(os.path.basename(pptx_path))[0] + ".pdf")
+    staged_path = os.path.join(staging_path, os.path.basename(pdf_path))
+    try:
+        if guarded.expired():
+            raise RenderTimeout("total timeout reached")
+        if pdf_mode == "images":
+            from .imaging import images_to_pdf
+            done = [i for i in selection if i in result.saved or i in result.skipped]
+            images_to_pdf([os.path.join(output_path, "Slide_%d.png" % i) for i in done],
+                          staged_path)
+        else:
+            # Saving renders every slide again, so allow a slide's time for each of them
+            timeout = slide_timeout * guarded.session.slide_count if slide_timeout else None
+            guarded.save_pdf(staged_path, timeout)
+        _manifest.commit_file(staged_path, pdf_path)
+    except Exception as e:
+        result.error = "PDF export failed: %s" % ("timeout" if isinstance(e, RenderTimeout) else e)
+        print("Error: %s" % result.error)
+        return
+    result.pdf = pdf_path
+    print("Saved: %s" % pdf_path)
+
+
+def _require_pillow():
+    """Fail early, before PowerPoint starts, if an option needs Pillow and it is missing."""
+    from .imaging import load_pillow
+    load_pillow()
+
+
+def _notify(progress, slide, status):
+    """Report one finished slide to the caller's progress callback, if any."""
+    if progress:
+        progress(slide, status)
+
 
 def whatis():
     """Prints the library information."""
@@ -0,0 +1,286 @@
+"""preflight.py"""
+
+import io
+import os
+import shutil
+import zipfile
+import tempfile
+import posixpath
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from .imaging import load_pillow
+from .ooxml import qn, read_deck, read_rels
+from .rewrite import PackageEdit, RENDERED_FOLDERS, strip_media, flatten_ole
+
+# Formats that are re-encoded in place; EMF/WMF/SVG are vector and GIF may be animated
+_RESAMPLE_FORMATS = frozenset(["JPEG", "PNG"])
+
+# Pixels kept beyond the displayed size, so PowerPoint's own resampling has some margin
+HEADROOM = 1.25
+# Images are only rewritten if this shrinks them to at most this fraction of their width
+MIN_REDUCTION = 0.75
+JPEG_QUALITY = 90
+
+
+def _picture_extents(root):
+    """
+    Displayed size in EMU of every p:pic in a slide, layout or master.
+
+    Yields (rId, width, height, tiled) for pictures, and (rId, None, None,
+    tiled) for other image fills such as backgrounds, whose displayed size
+    is not worked out.
+    """
+    sized = set()
+
+    def walk(element, sx, sy):
+        for child in element:
+            if child.tag == qn("p:grpSp"):
+                xfrm = child.find("%s/%s" % (qn("p:grpSpPr"), qn("a:xfrm")))
+                gx, gy = sx, sy
+                if xfrm is not None:
+                    ext, ch_ext = xfrm.find(qn("a:ext")), xfrm.find(qn("a:chExt"))
+                    if ext is not None and ch_ext is not None:
+                        # A group stretches its children by ext / chExt
+                        gx *= float(ext.get("cx")) / max(1, int(ch_ext.get("cx")))
+                        gy *= float(ext.get("cy")) / max(1, int(ch_ext.get("cy")))
+                for item in walk(child, gx, gy):
+                    yield item
+            elif child.tag == qn("p:pic"):
+                blip_fill = child.find(qn("p:blipFill"))
+                blip = blip_fill.find(qn("a:blip")) if blip_fill is not None else None
+                ext = child.find("%s/%s/%s" % (qn("p:spPr"), qn("a:xfrm"), qn("a:ext")))
+                if blip is None or ext is None:
+                    continue
+                sized.add(blip)
+                width = float(ext.get("cx")) * sx
+                height = float(ext.get("cy")) * sy
+                crop = blip_fill.find(qn("a:srcRect"))
+                if crop is not None:
+                    # A cropped picture shows only part of the image, enlarged
+                    shown_x = 1 - (int(crop.get("l", 0)) + int(crop.get("r", 0))) / 100000.0
+                    shown_y = 1 - (int(crop.get("t", 0)) + int(crop.get("b", 0))) / 100000.0
+                    width /= max(shown_x, 0.01)
+                    height /= max(shown_y, 0.01)
+                tiled = blip_fill.find(qn("a:tile")) is not None
+                yield blip.get(qn("r:embed")), width, height, tiled
+            else:
+                for item in walk(child, sx, sy):
+                    yield item
+
+    for item in walk(root, 1.0, 1.0):
+        yield item
+    for blip_fill in root.iter(qn("a:blipFill")):
+        blip = blip_fill.find(qn("a:blip"))
+        if blip is not None and blip not in sized:
+            yield blip.get(qn("r:embed")), None, None, blip_fill.find(qn("a:tile")) is not None
+
+
+def image_limits(package, slide_size, target_w, target_h):
+    """
+    Largest size in pixels at which every image of a deck is shown.
+
+    Args:
+        package (zipfile.ZipFile): The opened .pptx.
+        slide_size (tuple): (cx, cy) of the slides in EMU, from DeckInfo.
+        target_w (int): Width of the slide images in pixels.
+        target_h (int): Height of the slide images in pixels.
+
+    Returns:
+        dict: Media part -> (width, height) in pixels. Images that are also
+              used outside slides, layouts and masters, or as tiled fills,
+              are not included and must be kept as they are.
+    """
+    slide_w, slide_h = slide_size
+    px_x = float(target_w) / slide_w
+    px_y = float(target_h) / slide_h
+    limits = {}
+    untouchable = set()
+    for name in package.namelist():
+        if not name.endswith(".rels"):
+            continue
+        folder, rels_name = posixpath.split(name)
+        part = posixpath.join(posixpath.dirname(folder), rels_name[:-len(".rels")])
+        rels = read_rels(package, part)
+        images = dict((rid, target) for rid, (rel_type, target) in rels.items()
+                      if rel_type == "image")
+        if not images:
+            continue
+        # Pictures used anywhere else (notes, charts, SmartArt drawings) are left untouched
+        if not part.startswith(RENDERED_FOLDERS) or part not in package.NameToInfo:
+            untouchable.update(images.values())
+            continue
+        for rid, width, height, tiled in _picture_extents(ET.fromstring(package.read(part))):
+            target = images.get(rid)
+            if target is None:
+                continue
+            if tiled:
+                # Tiles are drawn at the image's own pixel size
+                untouchable.add(target)
+                continue
+            if width is None:
+                # Backgrounds and shape fills: at most the whole slide
+                size = (target_w, target_h)
+            else:
+                size = (width * px_x, height * px_y)
+            old = limits.get(target, (0, 0))
+            limits[target] = (max(old[0], size[0]), max(old[1], size[1]))
+    return dict((part, size) for part, size in limits.items() if part not in untouchable)
+
+
+def _downsample(data, limit):
+    """
+    Re-encode one image at the size it is displayed at.
+
+    Returns:
+        bytes: The smaller image, or None if it should be kept as it is.
+    """
+    Image = load_pillow()
+    with Image.open(io.BytesIO(data)) as img:
+        if img.format not in _RESAMPLE_FORMATS or getattr(img, "n_frames", 1) > 1:
+            return None
+        fmt = img.format
+        factor = max(limit[0] * HEADROOM / img.size[0], limit[1] * HEADROOM / img.size[1])
+        if factor > MIN_REDUCTION:
+            return None
+        size = (max(1, int(round(img.size[0] * factor))), max(1, int(round(img.size[1] * factor))))
+        info = img.info
+        if fmt == "JPEG":
+            # Decode at a reduced scale straight from the DCT data
+            img.draft(img.mode, size)
+        if img.mode == "P":
+            img = img.convert("RGBA")
+        small = img.resize(size, Image.LANCZOS, reducing_gap=3.0)
+        out = io.BytesIO()
+        if fmt == "JPEG":
+            small.save(out, "JPEG", quality=JPEG_QUALITY, icc_profile=info.get("icc_profile"),
+                       exif=info.get("exif", b""))
+        else:
+            small.save(out, "PNG", icc_profile=info.get("icc_profile"))
+    data_out = out.getvalue()
+    return data_out if len(data_out) < len(data) else None
+
+
+def _downsample_part(pptx_path, part, limit):
+    with zipfile.ZipFile(pptx_path) as package:
+        data = package.read(part)
+    try:
+        return _downsample(data, limit)
+    except (OSError, ValueError, SyntaxError) as e:
+        # Unreadable or unusual images are kept as they are
+        print("Warning: Could not downsample '%s' (%s)." % (part, e))
+        return None
+
+
+def downsample_images(edit, target_w, target_h, pool):
+    """
+    Add the image downsampling to a PackageEdit.
+
+    Args:
+        edit (rewrite.PackageEdit): The edit to add to. Its stats get "images",
+                                    "image_bytes_before" and "image_bytes_after".
+        target_w (int): Width of the slide images in pixels.
+        target_h (int): Height of the slide images in pixels.
+        pool (concurrent.futures.Executor): Runs the decoding and re-encoding.
+    """
+    with zipfile.ZipFile(edit.pptx_path) as package:
+        limits = image_limits(package, read_deck(edit.pptx_path).slide_size, target_w, target_h)
+    for part, limit in limits.items():
+        future = pool.submit(_downsample_part, edit.pptx_path, part, limit)
+        edit.transform(part, _take_result(future, edit.stats))
+    return edit
+
+
+def _take_result(future, stats):
+    """Transform that swaps in a downsampled image once it is ready."""
+    def transform(data):
+        small = future.result()
+        if small is None:
+            return data
+        stats["images"] += 1
+        stats["image_bytes_before"] += len(data)
+        stats["image_bytes_after"] += len(small)
+        return small
+    return transform
+
+
+def preflight_deck(pptx_path, out_path, target_size=None, lightweight=False, workers=None):
+    """
+    Write a copy of a deck that PowerPoint opens and renders faster.
+
+    With target_size, every picture is scaled to the largest size it is
+    displayed at in a render of that size (with HEADROOM to spare), so
+    PowerPoint does not decode 30-megapixel photos for a 1920 px slide.
+    Images are decoded and re-encoded in parallel while the package is
+    streamed through rewrite.PackageEdit, which copies every other member
+    without recompressing it.
+
+    With lightweight, video and audio become pictures of their poster frame
+    and OLE objects pictures of their preview, and the payloads are left out.
+
+    Args:
+        pptx_path (str): Source .pptx.
+        out_path (str): Output .pptx.
+        target_size (tuple): Optional. (width, height) of the slide images in pixels.
+        lightweight (bool): Optional. Strip media and OLE payloads.
+        workers (int): Optional. Threads decoding images. Default: CPU count, at most 8.
+
+    Returns:
+        collections.Counter: What was changed: images, image_bytes_before,
+                             image_bytes_after, media_removed, ole_removed,
+                             bytes_removed.
+    """
+    edit = PackageEdit(pptx_path)
+    if lightweight:
+        strip_media(edit)
+        flatten_ole(edit)
+    if not target_size:
+        edit.apply(out_path)
+        return edit.stats
+    load_pillow()
+    with ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1)) as pool:
+        downsample_images(edit, target_size[0], target_size[1], pool)
+        edit.apply(out_path)
+    return edit.stats
+
+
+def downsample_deck(pptx_path, out_path, target_w, target_h, workers=None):
+    """Write a copy of a deck with its images shrunk to their displayed size. See preflight_deck()."""
+    return preflight_deck(pptx_path, out_path, (target_w, target_h), workers=workers)
+
+
+class PreflightCopy(object):
+    """
+    Temporary pre-flight copy of a deck, deleted on close(). See preflight_deck().
+
+    Args:
+        pptx_path (str): Source .pptx.
+        target_size (tuple): Optional. Downsample images for this render size.
+        lightweight (bool): Optional. Strip media and OLE payloads.
+    """
+
+    def __init__(self, pptx_path, target_size=None, lightweight=False):
+        self.folder = tempfile.mkdtemp(prefix="pptx2png-")
+        # Same file name, so PowerPoint's window title and PDF metadata do not change
+        self.path = os.path.join(self.folder, os.path.basename(pptx_path))
+        try:
+            self.stats = preflight_deck(pptx_path, self.path, target_size, lightweight)
+        except Exception:
+            self.close()
+            raise
+
+    def describe(self):
+        """One-line summary of the changes, for the log."""
+        stats = self.stats
+        parts = []
+        if stats["media_removed"] or stats["ole_removed"]:
+            parts.append("%d media and %d OLE payload(s) removed (%.1f MB)" % (
+                stats["media_removed"], stats["ole_removed"], stats["bytes_removed"] / 1e6))
+        if stats["images"]:
+            parts.append("%d image(s) downsampled, %.1f MB -> %.1f MB" % (
+                stats["images"], stats["image_bytes_before"] / 1e6,
+                stats["image_bytes_after"] / 1e6))
+        return ", ".join(parts) or "nothing to change"
+
+    def close(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
@@ -0,0 +1,142 @@
+"""profile.py"""
+
+import os
+import json
+import zipfile
+
+from .ooxml import slide_complexity
+
+PROFILE_NAME = "profile.json"
+
+# Slides listed in the printed report
+SLOWEST = 10
+
+# Per-slide steps, in pipeline order
+SLIDE_PHASES = ("export", "postprocess", "write", "notes")
+
+
+class ProfileCollector(object):
+    """Tracer exporter that keeps the spans of one topng() call for the report."""
+
+    def __init__(self):
+        self.spans = []
+
+    def on_span(self, span):
+        self.spans.append((span.name, span.duration, span.attributes.get("slide"), span.error))
+
+    def on_count(self, name, value, labels):
+        pass
+
+
+def build_report(collector, pptx_path, result):
+    """
+    Combine measured times, slide complexity and output sizes into a report.
+
+    Args:
+        collector (ProfileCollector): Spans of the run.
+        pptx_path (str): The deck.
+        result (ExportResult): The run's result.
+
+    Returns:
+        dict: JSON-ready report with deck, phases, slides and slowest keys.
+    """
+    wall = 0.0
+    phases = {}
+    slides = {}
+    for name, duration, slide, error in collector.spans:
+        if name == "topng":
+            wall = duration
+            continue
+        phase = phases.setdefault(name, {"total": 0.0, "count": 0, "max": 0.0})
+        phase["total"] += duration
+        phase["count"] += 1
+        phase["max"] = max(phase["max"], duration)
+        if slide is not None and name in SLIDE_PHASES:
+            entry = slides.setdefault(slide, {"total": 0.0})
+            entry[name] = entry.get(name, 0.0) + duration
+            entry["total"] += duration
+            if error:
+                entry["error"] = error
+    phases["other"] = {"total": max(0.0, wall - sum(p["total"] for p in phases.values())),
+                       "count": 1, "max": 0.0}
+
+    numbers = sorted(set(result.saved) | set(result.skipped) | set(result.failed) | set(slides))
+    for i in numbers:
+        entry = slides.setdefault(i, {"total": 0.0})
+        if i in result.failed:
+            entry["status"] = "failed"
+        elif i in result.skipped:
+            entry["status"] = "skipped"
+        else:
+            entry["status"] = "saved"
+        path = os.path.join(result.output_dir, "Slide_%d.png" % i)
+        entry["output_bytes"] = os.path.getsize(path) if os.path.exists(path) else None
+
+    deck = {"file": pptx_path, "wall_time": wall}
+    try:
+        complexity = slide_complexity(pptx_path, numbers)
+    except (zipfile.BadZipFile, KeyError, ValueError):
+        # Legacy .ppt or a damaged package: report the times only
+        complexity = None
+    if complexity:
+        deck.update(complexity["deck"])
+        for i, stats in complexity["slides"].items():
+            slides[i]["complexity"] = stats
+
+    slowest = sorted((i for i in slides if slides[i].get("export")),
+                     key=lambda i: slides[i]["export"], reverse=True)
+    return {
+        "deck": deck,
+        "phases": phases,
+        "slides": slides,
+        "slowest": slowest[:SLOWEST],
+    }
+
+
+def json_ready(report):
+    """Copy of a report with string slide keys, as JSON requires."""
+    data = dict(report)
+    data["slides"] = dict((str(i), entry) for i, entry in report["slides"].items())
+    return data
+
+
+def write_report(report, path):
+    """Save a report as JSON."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(json_ready(report), f, indent=2)
+
+
+def format_report(report):
+    """
+    Human-readable summary of a report: phase times and the slowest slides
+    with the facts that usually explain them.
+    """
+    deck = report["deck"]
+    wall = deck["wall_time"] or 1e-9
+    lines = ["Profile of '%s': %.2f s" % (os.path.basename(deck["file"]), deck["wall_time"])]
+    lines.append("  %-12s %10s %7s %6s %9s" % ("Phase", "Total", "Share", "Calls", "Max"))
+    phases = sorted(report["phases"].items(), key=lambda item: -item[1]["total"])
+    for name, phase in phases:
+        if not phase["total"] and name == "other":
+            continue
+        lines.append("  %-12s %8.2f s %6.1f%% %6d %7.2f s" % (
+            name, phase["total"], 100.0 * phase["total"] / wall, phase["count"], phase["max"]))
+    if deck.get("embedded_fonts"):
+        lines.append("  Embedded fonts: %d (%.1f MB)" % (deck["embedded_fonts"],
+                                                        deck["font_bytes"] / 1e6))
+
+    if report["slowest"]:
+        lines.append("Slowest slides:")
+        lines.append("  %5s %9s %6s %5s %8s %6s %8s %5s %7s %9s" % (
+            "Slide", "Export", "Shapes", "Pics", "Img MB", "Charts", "SmartArt", "Media",
+            "Effects", "Out KB"))
+    for i in report["slowest"]:
+        entry = report["slides"][i]
+        stats = entry.get("complexity", {})
+        lines.append("  %5d %7.2f s %6s %5s %8s %6s %8s %5s %7s %9s" % (
+            i, entry["export"], stats.get("shapes", "-"), stats.get("pictures", "-"),
+            "%.1f" % (stats["image_bytes"] / 1e6) if stats else "-",
+            stats.get("charts", "-"), stats.get("smartart", "-"), stats.get("media", "-"),
+            stats.get("effects", "-"),
+            "%d" % (entry["output_bytes"] // 1024) if entry.get("output_bytes") else "-"))
+    return "\n".join(lines)
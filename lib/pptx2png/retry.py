@@ -0,0 +1,96 @@
+"""retry.py"""
+
+import random
+
+# Error classes returned by classify()
+RETRY = "retry"        # The renderer is busy, try the same call again
+RESTART = "restart"    # The renderer is gone, restart it before trying again
+FATAL = "fatal"        # Retrying will not help
+
+# COM HRESULTs (signed, as pywin32 reports them)
+RPC_E_CALL_REJECTED = -2147418111            # 0x80010001
+RPC_E_SERVERCALL_RETRYLATER = -2147417846    # 0x8001010A
+RPC_E_SERVERFAULT = -2147417851              # 0x80010105
+RPC_E_DISCONNECTED = -2147417848             # 0x80010108
+RPC_S_SERVER_UNAVAILABLE = -2147023174       # 0x800706BA
+RPC_S_CALL_FAILED = -2147023170              # 0x800706BE
+CO_E_SERVER_EXEC_FAILURE = -2146959355       # 0x80080005
+
+BUSY_HRESULTS = frozenset([
+    RPC_E_CALL_REJECTED,
+    RPC_E_SERVERCALL_RETRYLATER,
+])
+DEAD_HRESULTS = frozenset([
+    RPC_E_SERVERFAULT,
+    RPC_E_DISCONNECTED,
+    RPC_S_SERVER_UNAVAILABLE,
+    RPC_S_CALL_FAILED,
+    CO_E_SERVER_EXEC_FAILURE,
+])
+
+
+def hresults(error):
+    """
+    Collect the HRESULT codes carried by a pywintypes.com_error.
+
+    Both the outer code and the scode of the exception info are returned,
+    because PowerPoint often wraps the interesting code in DISP_E_EXCEPTION.
+    """
+    codes = []
+    args = getattr(error, "args", ())
+    if args and isinstance(args[0], int):
+        codes.append(args[0])
+    if len(args) > 2 and isinstance(args[2], tuple) and len(args[2]) > 5:
+        if isinstance(args[2][5], int):
+            codes.append(args[2][5])
+    return codes
+
+
+def classify(error):
+    """
+    Decide whether a failed renderer call is worth retrying.
+
+    Args:
+        error (Exception): The exception raised by the COM call.
+
+    Returns:
+        str: RETRY, RESTART or FATAL.
+    """
+    codes = hresults(error)
+    if any(code in BUSY_HRESULTS for code in codes):
+        return RETRY
+    if any(code in DEAD_HRESULTS for code in codes):
+        return RESTART
+    return FATAL
+
+
+class RetryPolicy(object):
+    """
+    How often and how patiently transient renderer errors are retried.
+
+    Args:
+        max_attempts (int): Total attempts per call, including the first. 1 disables retries.
+        backoff (float): Delay in seconds before the first retry.
+        factor (float): Multiplier applied to the delay after every retry.
+        max_backoff (float): Upper bound for a single delay.
+        jitter (float): Random +/- fraction added to each delay.
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.5, factor=2.0, max_backoff=8.0, jitter=0.1):
+        self.max_attempts = max(1, int(max_attempts))
+        self.backoff = backoff
+        self.factor = factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+
+    def delay(self, attempt):
+        """Seconds to wait after the given failed attempt (1-based)."""
+        base = min(self.max_backoff, self.backoff * (self.factor ** (attempt - 1)))
+        return max(0.0, base * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def __repr__(self):
+        return "RetryPolicy(max_attempts=%d, backoff=%r, factor=%r, max_backoff=%r)" % (
+            self.max_attempts, self.backoff, self.factor, self.max_backoff)
+
+
+NO_RETRY = RetryPolicy(max_attempts=1)
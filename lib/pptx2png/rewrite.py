@@ -0,0 +1,531 @@
+"""rewrite.py"""
+
+import re
+import shutil
+import struct
+import zipfile
+import posixpath
+import collections
+
+from .ooxml import PRESENTATION_PART, read_deck, read_rels, rels_part, resolve_target
+
+CONTENT_TYPES_PART = "[Content_Types].xml"
+
+# Bytes moved at a time when copying a member without decompressing it
+_CHUNK = 1 << 20
+# Local file header: signature ... file name length, extra field length
+_LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+# General purpose flag: CRC and sizes follow the data instead of the header
+_DATA_DESCRIPTOR = 0x08
+
+_RELATIONSHIP_RE = re.compile(br"<Relationship\b[^>]*?/>|<Relationship\b.*?</Relationship>", re.S)
+_ATTR_RE = re.compile(br'\b(Id|Target|TargetMode)="([^"]*)"')
+_OVERRIDE_RE = re.compile(br'<Override\b[^>]*\bPartName="([^"]*)"[^>]*/>')
+
+# Parts drawn into slide images
+RENDERED_FOLDERS = ("ppt/slides/", "ppt/slideLayouts/", "ppt/slideMasters/")
+
+_REL_REF_RE = re.compile(br'\br:(?:embed|link|id)="([^"]*)"')
+# Any attribute in the relationships namespace, e.g. r:pict or r:dm besides the above
+_ANY_REL_REF_RE = re.compile(br'\br:\w+="([^"]*)"')
+_NS_DECL_RE = re.compile(br'\sxmlns:([\w.-]+)="([^"]*)"')
+# Start, end and empty-element tags, with their attributes
+_TAG_RE = re.compile(br'<(/?)[\w.:-]+((?:[^>"]|"[^"]*")*?)(/?)>')
+# Animations; they may target media or OLE shapes that an edit removed
+_TIMING_RE = re.compile(br'<p:timing\b[^>]*/>|<p:timing\b.*?</p:timing>', re.S)
+_EMPTY_EXT_LST_RE = re.compile(br'<p:extLst>\s*</p:extLst>')
+# Video and audio payloads of a picture: a:videoFile etc. and the p14:media extension
+_MEDIA_FILE_RE = re.compile(
+    br'<a:(videoFile|audioFile|quickTimeFile|wavAudioFile)\b[^>]*?(?:/>|>.*?</a:\1>)', re.S)
+_MEDIA_EXT_RE = re.compile(
+    br'<p:ext\b[^>]*\buri="\{DAA4B4D4-6D71-4841-9C94-3DE7FCFB9230\}"[^>]*>.*?</p:ext>', re.S)
+_FRAME_RE = re.compile(br'<p:graphicFrame\b.*?</p:graphicFrame>', re.S)
+_FRAME_OR_ALTERNATE_RE = re.compile(br'<p:graphicFrame\b|<mc:AlternateContent\b')
+_ALTERNATE_TAG_RE = re.compile(br'<mc:AlternateContent\b|</mc:AlternateContent>')
+
+
+def _copy_info(info):
+    """Fresh ZipInfo with the name, date, method and attributes of info."""
+    copy = zipfile.ZipInfo(info.filename, info.date_time)
+    copy.compress_type = info.compress_type
+    copy.external_attr = info.external_attr
+    copy.create_system = info.create_system
+    return copy
+
+
+def _can_copy_raw(target):
+    """Whether target has the ZipFile internals that _copy_raw() writes through."""
+    return (all(hasattr(target, name) for name in ("fp", "start_dir", "_didModify"))
+            and hasattr(zipfile.ZipInfo, "FileHeader"))
+
+
+def _copy_member(source, info, target):
+    """Copy a member through the public API, inflating and compressing it again."""
+    copy = _copy_info(info)
+    zip64 = info.file_size > zipfile.ZIP64_LIMIT
+    with source.open(info) as src, target.open(copy, "w", force_zip64=zip64) as dst:
+        shutil.copyfileobj(src, dst, _CHUNK)
+
+
+def _copy_raw(source, source_file, info, target):
+    """
+    Append a member to target as its compressed bytes, without inflating it.
+
+    zipfile has no public way to do this, so the member is written the way
+    ZipFile._open_to_write() does it, with the CRC and sizes known up front.
+    On a zipfile without those internals the member is copied with
+    _copy_member() instead.
+    """
+    if not _can_copy_raw(target):
+        _copy_member(source, info, target)
+        return
+    source_file.seek(info.header_offset)
+    header = _LOCAL_HEADER.unpack(source_file.read(_LOCAL_HEADER.size))
+    source_file.seek(header[-2] + header[-1], 1)
+
+    copy = _copy_info(info)
+    copy.flag_bits = info.flag_bits & ~_DATA_DESCRIPTOR
+    copy.CRC = info.CRC
+    copy.compress_size = info.compress_size
+    copy.file_size = info.file_size
+    zip64 = max(info.file_size, info.compress_size) > zipfile.ZIP64_LIMIT
+
+    target.fp.seek(target.start_dir)
+    copy.header_offset = target.fp.tell()
+    target._didModify = True
+    target.fp.write(copy.FileHeader(zip64))
+    remaining = info.compress_size
+    while remaining:
+        chunk = source_file.read(min(_CHUNK, remaining))
+        if not chunk:
+            raise zipfile.BadZipFile("Truncated member '%s'." % info.filename)
+        target.fp.write(chunk)
+        remaining -= len(chunk)
+    target.start_dir = target.fp.tell()
+    target.filelist.append(copy)
+    target.NameToInfo[copy.filename] = copy
+
+
+def remove_relationships(data, source_part, drop=(), ids=()):
+    """
+    Remove relationships from a .rels part, leaving the rest of it byte for byte.
+
+    Args:
+        data (bytes): The .rels XML.
+        source_part (str): The part the relationships belong to.
+        drop (set): Relationships whose internal target is one of these parts are removed.
+        ids (set): Relationship ids to remove.
+
+    Returns:
+        bytes: The edited XML.
+    """
+    def keep(match):
+        attrs = dict(_ATTR_RE.findall(match.group(0)))
+        rel_id = attrs.get(b"Id", b"").decode("utf-8")
+        if rel_id in ids:
+            return b""
+        if attrs.get(b"TargetMode") != b"External":
+            target = resolve_target(source_part, attrs.get(b"Target", b"").decode("utf-8"))
+            if target in drop:
+                return b""
+        return match.group(0)
+    return _RELATIONSHIP_RE.sub(keep, data)
+
+
+def _remove_overrides(data, drop):
+    return _OVERRIDE_RE.sub(
+        lambda m: b"" if m.group(1).decode("utf-8").lstrip("/") in drop else m.group(0), data)
+
+
+def rewrite_package(source_path, target_path, transforms=None, drop=()):
+    """
+    Copy a .pptx to a new file, changing only the parts that need it.
+
+    The source is streamed member by member in its original order. Members
+    that are not transformed are copied as their compressed bytes, without
+    being inflated and deflated again, so a deck with hundreds of MB of
+    media costs little more than a file copy.
+
+    Relationships pointing at dropped parts, the .rels of dropped parts
+    and their [Content_Types].xml overrides are removed as well. References
+    to the removed relationship ids inside other XML parts are the caller's
+    business, through transforms.
+
+    Args:
+        source_path (str): Source .pptx.
+        target_path (str): Output .pptx.
+        transforms (dict): Part name -> function(bytes) -> bytes. Returning the
+                           very object passed in keeps the original member.
+        drop (iterable): Part names to leave out.
+
+    Returns:
+        dict: Counts of "copied", "rewritten" and "dropped" members.
+    """
+    transforms = transforms or {}
+    drop = set(drop)
+    drop.update(rels_part(part) for part in list(drop))
+    stats = {"copied": 0, "rewritten": 0, "dropped": 0}
+    with zipfile.ZipFile(source_path) as source, open(source_path, "rb") as source_file, \
+            zipfile.ZipFile(target_path, "w", zipfile.ZIP_DEFLATED) as target:
+        for info in source.infolist():
+            name = info.filename
+            if name in drop:
+                stats["dropped"] += 1
+                continue
+            edit = transforms.get(name)
+            if drop and name.endswith(".rels"):
+                edit = _chain(edit, _rels_dropper(name, drop))
+            elif drop and name == CONTENT_TYPES_PART:
+                edit = _chain(edit, lambda data: _remove_overrides(data, drop))
+            if edit is None:
+                _copy_raw(source, source_file, info, target)
+                stats["copied"] += 1
+                continue
+            data = source.read(info)
+            new = edit(data)
+            if new is data:
+                # The raw copy is cheaper than compressing the same bytes again
+                _copy_raw(source, source_file, info, target)
+                stats["copied"] += 1
+            else:
+                # writestr() fills in the sizes of the ZipInfo it is given, so pass a copy
+                target.writestr(_copy_info(info), new)
+                stats["rewritten"] += 1
+    return stats
+
+
+def _rels_dropper(rels_name, drop):
+    source_part = _source_part(rels_name)
+
+    def edit(data):
+        new = remove_relationships(data, source_part, drop)
+        return data if new == data else new
+    return edit
+
+
+def _chain(first, second):
+    if first is None:
+        return second
+
+    def edit(data):
+        new = first(data)
+        result = second(new)
+        # Unchanged by both: keep the identity so the member is copied raw
+        return data if new is data and result == data else result
+    return edit
+
+
+class PackageEdit(object):
+    """
+    A set of part transforms and removals, applied in one streaming pass.
+
+    Edits such as strip_notes() and remove_slides() add to the same
+    PackageEdit, so several of them still cost a single copy of the deck.
+
+    Args:
+        pptx_path (str): The source .pptx.
+    """
+
+    def __init__(self, pptx_path):
+        self.pptx_path = pptx_path
+        self.transforms = {}
+        self.drop = set()
+        # Counters the edits add to, such as "media_removed"
+        self.stats = collections.Counter()
+
+    def transform(self, part, func):
+        """Add func(bytes) -> bytes for a part, after any already registered."""
+        self.transforms[part] = _chain(self.transforms.get(part), func)
+
+    def apply(self, target_path):
+        """Write the edited copy. Returns the counts of rewrite_package()."""
+        return rewrite_package(self.pptx_path, target_path, self.transforms, self.drop)
+
+
+def strip_notes(edit):
+    """
+    Leave out the speaker notes of every slide.
+
+    The notes master stays, since presentation.xml refers to it.
+
+    Args:
+        edit (PackageEdit): The edit to add to.
+    """
+    with zipfile.ZipFile(edit.pptx_path) as package:
+        edit.drop.update(name for name in package.namelist()
+                         if name.startswith("ppt/notesSlides/") and name.endswith(".xml"))
+    return edit
+
+
+def remove_slides(edit, indices):
+    """
+    Remove slides from the deck.
+
+    The slides leave the slide list, their sections and the package, along
+    with their notes. Hyperlinks on other slides that jump to a removed
+    slide are dropped.
+
+    Args:
+        edit (PackageEdit): The edit to add to.
+        indices (iterable): 1-based slide numbers.
+    """
+    deck = read_deck(edit.pptx_path)
+    removed = [deck.slide(i) for i in sorted(set(indices)) if 1 <= i <= len(deck.slides)]
+    if not removed:
+        return edit
+    parts = set(info.part for info in removed)
+    slide_ids = set(str(info.slide_id).encode("ascii") for info in removed)
+    with zipfile.ZipFile(edit.pptx_path) as package:
+        rel_ids = set(rid for rid, (rel_type, target) in read_rels(package, PRESENTATION_PART).items()
+                      if target in parts)
+        for info in removed:
+            for rel_type, target in read_rels(package, info.part).values():
+                if rel_type == "notesSlide":
+                    edit.drop.add(target)
+        # Slide-jump hyperlinks on the remaining slides
+        for info in deck.slides:
+            if info.part in parts:
+                continue
+            stale = set(rid for rid, (rel_type, target) in read_rels(package, info.part).items()
+                        if target in parts)
+            if stale:
+                edit.transform(info.part, _hyperlink_remover(stale))
+    edit.drop.update(parts)
+
+    # Slide list entries, and custom show entries, by relationship id
+    slide_ref_re = re.compile(br'<p:sld(?:Id)?\b[^>]*?\br:id="([^"]*)"[^>]*/>')
+    section_ref_re = re.compile(br'<p14:sldId\b[^>]*?\bid="(\d+)"[^>]*/>')
+    rel_id_values = set(rid.encode("utf-8") for rid in rel_ids)
+
+    def edit_presentation(data):
+        data = slide_ref_re.sub(
+            lambda m: b"" if m.group(1) in rel_id_values else m.group(0), data)
+        return section_ref_re.sub(lambda m: b"" if m.group(1) in slide_ids else m.group(0), data)
+    edit.transform(PRESENTATION_PART, edit_presentation)
+    return edit
+
+
+def remove_hidden_slides(edit):
+    """Remove every slide that is hidden in the slide show. See remove_slides()."""
+    deck = read_deck(edit.pptx_path)
+    return remove_slides(edit, [info.index for info in deck.slides if info.hidden])
+
+
+def _hyperlink_remover(rel_ids):
+    pattern = re.compile(br'<a:hlink(?:Click|Hover)\b[^>]*?\br:id="(%s)"[^>]*?(?:/>|>.*?</a:hlink'
+                         br'(?:Click|Hover)>)' % b"|".join(re.escape(r.encode("utf-8"))
+                                                             for r in sorted(rel_ids)), re.S)
+
+    def edit(data):
+        new = pattern.sub(b"", data)
+        return data if new == data else new
+    return edit
+
+
+def _source_part(rels_name):
+    """Part that a .rels part belongs to."""
+    folder, name = posixpath.split(rels_name)
+    return posixpath.join(posixpath.dirname(folder), name[:-len(".rels")])
+
+
+def _edit_rendered_parts(edit, rewrite_xml):
+    """
+    Run rewrite_xml over every slide, layout and master.
+
+    rewrite_xml(data) returns (new data, set of relationship ids it removed).
+    The removed relationships go from the .rels parts, and the parts they
+    pointed at are dropped unless something else still refers to them.
+
+    Returns:
+        set: The dropped parts.
+    """
+    def rewrite(data):
+        new, ids = rewrite_xml(data)
+        # A relationship stays while anything left in the part still refers to it
+        return new, set(ids) - set(rid.decode("utf-8") for rid in _ANY_REL_REF_RE.findall(new))
+
+    removed = {}
+    with zipfile.ZipFile(edit.pptx_path) as package:
+        for name in package.namelist():
+            if name.startswith(RENDERED_FOLDERS) and name.endswith(".xml"):
+                ids = rewrite(package.read(name))[1]
+                if ids:
+                    removed[name] = ids
+        if not removed:
+            return set()
+        for part, ids in removed.items():
+            edit.transform(part, lambda data: rewrite(data)[0])
+            edit.transform(rels_part(part),
+                           lambda data, part=part, ids=ids: remove_relationships(data, part, ids=ids))
+
+        references = collections.Counter()
+        unlinked = set()
+        for name in package.namelist():
+            if not name.endswith(".rels"):
+                continue
+            source = _source_part(name)
+            for rel_id, (rel_type, target) in read_rels(package, source).items():
+                if rel_type.endswith("#external"):
+                    continue
+                if rel_id in removed.get(source, ()):
+                    unlinked.add(target)
+                else:
+                    references[target] += 1
+        orphans = set(target for target in unlinked if not references[target])
+        edit.stats["bytes_removed"] += sum(package.getinfo(part).file_size for part in orphans
+                                           if part in package.NameToInfo)
+    edit.drop.update(orphans)
+    return orphans
+
+
+def strip_media(edit):
+    """
+    Turn video and audio into plain pictures of their poster frame.
+
+    PowerPoint loads every embedded media file when it opens a deck, although
+    a still export only shows the poster image. The payloads are dropped, as
+    are links to external media, and the slides' animations, which may
+    refer to the media. The poster picture keeps its place, size and effects.
+
+    Args:
+        edit (PackageEdit): The edit to add to.
+    """
+    def rewrite_xml(data):
+        ids = set()
+
+        def remove(match):
+            ids.update(rid.decode("utf-8") for rid in _REL_REF_RE.findall(match.group(0)))
+            return b""
+        data = _MEDIA_FILE_RE.sub(remove, data)
+        data = _MEDIA_EXT_RE.sub(remove, data)
+        if ids:
+            data = _TIMING_RE.sub(b"", _EMPTY_EXT_LST_RE.sub(b"", data))
+        return data, ids
+
+    orphans = _edit_rendered_parts(edit, rewrite_xml)
+    edit.stats["media_removed"] += len(orphans)
+    return edit
+
+
+def _namespaces_in_scope(xml):
+    """Prefix -> namespace of the declarations on the elements still open at the end of xml."""
+    stack = []
+    for tag in _TAG_RE.finditer(xml):
+        if tag.group(1):
+            if stack:
+                stack.pop()
+        elif not tag.group(3):
+            stack.append(_NS_DECL_RE.findall(tag.group(2)))
+    scope = {}
+    for declarations in stack:
+        scope.update(declarations)
+    return scope
+
+
+def _ole_preview(frame, outer):
+    """
+    A p:pic showing the preview image of an OLE object's graphic frame.
+
+    Args:
+        frame (bytes): The graphic frame, or the mc:AlternateContent around it.
+        outer (dict): Prefix -> namespace declared where the frame is, from
+                      _namespaces_in_scope().
+
+    Returns:
+        tuple: (p:pic XML, relationship ids of the object), or (None, None) if
+               the frame has no preview picture, as in pre-2010 files.
+    """
+    picture = re.search(br"<p:pic\b.*?</p:pic>", frame, re.S)
+    props = re.search(br"<p:cNvPr\b[^>]*?/>|<p:cNvPr\b.*?</p:cNvPr>", frame, re.S)
+    xfrm = re.search(br"<p:xfrm\b([^>]*)>(.*?)</p:xfrm>", frame, re.S)
+    if not (picture and props and xfrm):
+        return None, None
+    blip_fill = re.search(br"<p:blipFill\b.*?</p:blipFill>", picture.group(0), re.S)
+    if not blip_fill:
+        return None, None
+    ids = set(rid.decode("utf-8") for rid in re.findall(br'<p:oleObj\b[^>]*?\br:id="([^"]*)"', frame))
+    body = (b"<p:nvPicPr>" + props.group(0) + b"<p:cNvPicPr/><p:nvPr/></p:nvPicPr>" +
+            blip_fill.group(0) + b"<p:spPr><a:xfrm" + xfrm.group(1) + b">" + xfrm.group(2) +
+            b'</a:xfrm><a:prstGeom prst="rect"><a:avLst/></a:prstGeom></p:spPr>')
+    # Prefixes the picture uses that were declared between the frame and the preview,
+    # e.g. on mc:Fallback, and that the slide does not already declare the same way
+    start_tag = _TAG_RE.match(frame, picture.start())
+    scope = _namespaces_in_scope(frame[:start_tag.end()])
+    declarations = b"".join(b' xmlns:%s="%s"' % (prefix, uri) for prefix, uri in sorted(scope.items())
+                            if outer.get(prefix) != uri
+                            and re.search(br"[<\s/]" + re.escape(prefix) + b":", body))
+    return b"<p:pic" + declarations + b">" + body + b"</p:pic>", ids
+
+
+def _ole_frames(data):
+    """
+    Yield (start, end) of every graphic frame, or of every mc:AlternateContent
+    that wraps graphic frames, outermost first.
+
+    Since Office 2010 an OLE frame may come as an mc:Choice without a
+    preview and an mc:Fallback with one, both using the same relationship;
+    the whole block is one object.
+    """
+    pos = 0
+    while True:
+        match = _FRAME_OR_ALTERNATE_RE.search(data, pos)
+        if match is None:
+            return
+        if match.group(0).startswith(b"<p:graphicFrame"):
+            frame = _FRAME_RE.match(data, match.start())
+            if frame is None:
+                return
+            yield frame.start(), frame.end()
+            pos = frame.end()
+            continue
+        depth = 0
+        end = None
+        for tag in _ALTERNATE_TAG_RE.finditer(data, match.start()):
+            depth += -1 if tag.group(0).startswith(b"</") else 1
+            if depth == 0:
+                end = tag.end()
+                break
+        if end is None:
+            return
+        if b"<p:graphicFrame" in data[match.start():end]:
+            yield match.start(), end
+            pos = end
+        else:
+            pos = match.end()
+
+
+def flatten_ole(edit):
+    """
+    Replace embedded OLE objects (Excel sheets, Visio drawings, ...) by their preview.
+
+    Every OLE graphic frame becomes a picture of the preview image Office
+    stores with it, so PowerPoint does not load the embedded file when it
+    opens the deck. Objects without a stored preview are kept.
+
+    Args:
+        edit (PackageEdit): The edit to add to.
+    """
+    def rewrite_xml(data):
+        ids = set()
+        parts = []
+        pos = 0
+        for start, end in _ole_frames(data):
+            frame = data[start:end]
+            if b'presentationml/2006/ole"' not in frame:
+                continue
+            pic, object_ids = _ole_preview(frame, _namespaces_in_scope(data[:start]))
+            if pic is None:
+                continue
+            ids.update(object_ids)
+            parts.extend((data[pos:start], pic))
+            pos = end
+        if not parts:
+            return data, ids
+        data = b"".join(parts) + data[pos:]
+        if ids:
+            data = _TIMING_RE.sub(b"", data)
+        return data, ids
+
+    orphans = _edit_rendered_parts(edit, rewrite_xml)
+    edit.stats["ole_removed"] += len(orphans)
+    return edit
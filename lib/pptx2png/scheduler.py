@@ -0,0 +1,543 @@
+"""scheduler.py"""
+
+import os
+import sys
+import hmac
+import json
+import socket
+import struct
+import getpass
+import secrets
+import argparse
+import itertools
+import threading
+import collections
+import socketserver
+import queue
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 47811
+
+# Token of the single-user setup; readable by its owner only
+DEFAULT_TOKEN_PATH = os.getenv(
+    "PPTX2PNG_SCHEDULER_TOKEN",
+    os.path.join(os.path.expanduser("~"), ".pptx2png", "scheduler.token"))
+
+# Lower value runs first
+PRIORITIES = {"interactive": 0, "normal": 5, "bulk": 10}
+
+# topng() keyword arguments a client may send
+JOB_OPTIONS = (
+    "pptx", "output_dir", "slide_range", "scale", "manifest", "resume",
+    "open_timeout", "slide_timeout", "total_timeout", "retry", "slides", "skip_hidden",
+    "dedupe", "cache", "skip_unchanged", "phash_index",
+    "contact_sheet", "animation", "frame_duration", "pdf", "pdf_mode",
+    "profile", "downsample", "lightweight_open", "font_substitutions",
+    "notes_pages", "handouts", "extract_text", "shape_map",
+)
+
+# Options that name files; resolved on the client, since the daemon has its own working directory
+PATH_OPTIONS = ("output_dir", "manifest", "cache", "phash_index", "contact_sheet",
+                "animation", "pdf", "profile", "font_substitutions")
+
+
+class Job(object):
+    """
+    One submitted topng() call.
+
+    Events for the submitting client (queued, started, slide, finished) are
+    put on the events queue as plain dicts.
+    """
+
+    def __init__(self, job_id, tenant, priority, options):
+        self.job_id = job_id
+        self.tenant = tenant
+        self.priority = priority
+        self.options = options
+        self.state = "queued"
+        self.events = queue.Queue()
+
+    def emit(self, event, **fields):
+        fields["event"] = event
+        fields["job_id"] = self.job_id
+        self.events.put(fields)
+
+
+class FairQueue(object):
+    """
+    Job queue ordered by priority, then shared fairly between tenants.
+
+    Within one priority level, the tenant with the fewest running jobs goes
+    first; ties are broken by a per-tenant virtual clock (start-time fair
+    queuing), so a tenant that submits 500 jobs cannot starve one that
+    submits a single job afterwards.
+    """
+
+    def __init__(self):
+        self._levels = {}    # priority -> {tenant: deque of jobs}
+        self._running = collections.Counter()
+        self._pass = {}      # tenant -> virtual time of its next job
+        self._vtime = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, job):
+        with self._cond:
+            level = self._levels.setdefault(job.priority, collections.OrderedDict())
+            level.setdefault(job.tenant, collections.deque()).append(job)
+            self._cond.notify()
+
+    def get(self):
+        """Block until a job is available and return it, or None once closed."""
+        with self._cond:
+            while True:
+                if self._closed:
+                    return None
+                job = self._pick()
+                if job:
+                    self._running[job.tenant] += 1
+                    return job
+                self._cond.wait()
+
+    def done(self, job):
+        with self._cond:
+            self._running[job.tenant] -= 1
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def snapshot(self):
+        """Queued job count per priority and tenant, plus running counts."""
+        with self._cond:
+            queued = {}
+            for priority, tenants in self._levels.items():
+                for tenant, jobs in tenants.items():
+                    queued.setdefault(str(priority), {})[tenant] = len(jobs)
+            running = dict((t, n) for t, n in self._running.items() if n)
+            return {"queued": queued, "running": running}
+
+    def _pick(self):
+        for priority in sorted(self._levels):
+            tenants = self._levels[priority]
+            if not tenants:
+                continue
+            tenant = min(tenants, key=lambda t: (
+                self._running[t], max(self._pass.get(t, 0), self._vtime)))
+            start = max(self._pass.get(tenant, 0), self._vtime)
+            self._pass[tenant] = start + 1
+            self._vtime = start
+            jobs = tenants[tenant]
+            job = jobs.popleft()
+            if not jobs:
+                del tenants[tenant]
+            return job
+        return None
+
+
+def run_job(job):
+    """Default job runner: call topng() and stream per-slide progress."""
+    from .pptx2png import topng
+
+    options = dict(job.options)
+    options["progress"] = lambda slide, status: job.emit("slide", slide=slide, status=status)
+    result = topng(**options)
+    if result is None:
+        return {"error": "Invalid job, see the scheduler log for details."}
+    return result.to_dict()
+
+
+class Scheduler(object):
+    """
+    Runs submitted jobs on a fixed number of worker threads.
+
+    The worker count is the concurrency cap on renderer use: PowerPoint is
+    shared by every caller on the host, so it is usually kept at 1 or 2.
+
+    Args:
+        workers (int): Number of jobs rendered at the same time.
+        runner (callable): Called with a Job, returns the result dict. Default: run_job.
+    """
+
+    def __init__(self, workers=1, runner=None):
+        self.workers = max(1, int(workers))
+        self.runner = runner or run_job
+        self.queue = FairQueue()
+        self._ids = itertools.count(1)
+        self._threads = []
+
+    def start(self):
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work, name="pptx2png-worker-%d" % (n + 1))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self.queue.close()
+
+    def submit(self, tenant, priority, options):
+        """
+        Queue a job.
+
+        Args:
+            tenant (str): Name used for fair sharing, usually the user name.
+            priority (str|int): 'interactive', 'normal', 'bulk' or a number (lower runs
+                                first), clamped to the range of PRIORITIES so no job
+                                runs ahead of interactive ones.
+            options (dict): topng() keyword arguments, limited to JOB_OPTIONS.
+
+        Returns:
+            Job: The queued job.
+        """
+        unknown = set(options) - set(JOB_OPTIONS)
+        if unknown:
+            raise ValueError("Unsupported job option(s): %s" % ", ".join(sorted(unknown)))
+        if "pptx" not in options:
+            raise ValueError("Job option 'pptx' is required.")
+        if isinstance(priority, int) and not isinstance(priority, bool):
+            priority = min(max(priority, min(PRIORITIES.values())), max(PRIORITIES.values()))
+        elif isinstance(priority, str) and priority in PRIORITIES:
+            priority = PRIORITIES[priority]
+        else:
+            raise ValueError("Unknown priority '%s'." % (priority,))
+        job = Job(next(self._ids), tenant or "default", priority, options)
+        job.emit("queued", tenant=job.tenant, priority=priority)
+        self.queue.put(job)
+        return job
+
+    def _work(self):
+        # Each worker thread needs its own COM apartment
+        try:
+            import pythoncom
+            pythoncom.CoInitialize()
+        except ImportError:
+            pythoncom = None
+        try:
+            while True:
+                job = self.queue.get()
+                if job is None:
+                    return
+                job.state = "running"
+                job.emit("started")
+                try:
+                    result = self.runner(job)
+                except Exception as e:
+                    result = {"error": str(e)}
+                finally:
+                    self.queue.done(job)
+                job.state = "done"
+                job.emit("finished", result=result)
+        finally:
+            if pythoncom:
+                pythoncom.CoUninitialize()
+
+
+def load_tokens(path):
+    """
+    Tenants and their tokens, from a JSON file of {"tenant": "token"}.
+
+    Returns:
+        dict: Token -> tenant.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        tenants = json.load(f)
+    if not isinstance(tenants, dict) or not all(
+            isinstance(t, str) and isinstance(k, str) and k for t, k in tenants.items()):
+        raise ValueError("'%s' must map tenant names to tokens." % path)
+    return dict((token, tenant) for tenant, token in tenants.items())
+
+
+def ensure_token(path=DEFAULT_TOKEN_PATH):
+    """Token of the single-user setup, created with owner-only permissions if missing."""
+    token = read_token(path)
+    if token:
+        return token
+    folder = os.path.dirname(path)
+    if folder and not os.path.isdir(folder):
+        os.makedirs(folder)
+    token = secrets.token_hex(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    return token
+
+
+def read_token(path=DEFAULT_TOKEN_PATH):
+    """The token stored in a file, or None if there is none."""
+    try:
+        with open(path, "r") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def _peer_user(sock):
+    """User name of the process on the other end of a Unix socket, where the OS tells it."""
+    if not hasattr(socket, "SO_PEERCRED") or sock.family != getattr(socket, "AF_UNIX", None):
+        return None
+    try:
+        import pwd
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        return pwd.getpwuid(struct.unpack("3i", creds)[1]).pw_name
+    except (ImportError, OSError, KeyError):
+        return None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Newline-delimited JSON: one request line in, one or more event lines out."""
+
+    def handle(self):
+        scheduler = self.server.scheduler
+        peer = _peer_user(self.request)
+        try:
+            for line in self.rfile:
+                try:
+                    request = json.loads(line.decode("utf-8"))
+                    op = request.get("op")
+                    if op == "ping":
+                        self._send({"event": "pong"})
+                        continue
+                    user = peer or self._authenticate(request.get("token"))
+                    if user is None:
+                        self._send({"event": "error", "error": "Not authorized."})
+                        return
+                    if op == "submit":
+                        job = scheduler.submit(_tenant(user, request.get("tenant")),
+                                               request.get("priority", "normal"),
+                                               request.get("job", {}))
+                        self._stream(job, request.get("wait", True))
+                    elif op == "status":
+                        self._send(dict(scheduler.queue.snapshot(), event="status"))
+                    else:
+                        self._send({"event": "error", "error": "Unknown op '%s'." % op})
+                except (ValueError, TypeError, AttributeError) as e:
+                    self._send({"event": "error", "error": "Invalid request: %s" % e})
+        except OSError:
+            # The client went away; a submitted job still runs to completion
+            return
+
+    def _authenticate(self, token):
+        """Tenant that owns a token, or None. Every token is compared, in constant time."""
+        if not isinstance(token, str):
+            return None
+        user = None
+        for known, tenant in self.server.tokens.items():
+            if hmac.compare_digest(known.encode("utf-8"), token.encode("utf-8")):
+                user = tenant
+        return user
+
+    def _stream(self, job, wait):
+        while True:
+            event = job.events.get()
+            self._send(event)
+            if event["event"] == "finished" or (not wait and event["event"] == "queued"):
+                return
+
+    def _send(self, event):
+        self.wfile.write((json.dumps(event) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+
+def _tenant(user, requested):
+    """
+    Fair-share name of a job: the authenticated user, or a sub-tenant of it.
+
+    A service that submits for several of its own users may name them; it
+    can never take another user's share.
+    """
+    if not requested or requested == user:
+        return user
+    return "%s/%s" % (user, requested)
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+else:
+    _UnixServer = None
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, workers=1, metrics_port=None,
+          tokens=None):
+    """
+    Run the scheduler daemon until interrupted.
+
+    Every request but 'ping' must carry a token, and the tenant of a job is
+    the one its token belongs to, so clients cannot take each other's share.
+    On a Unix socket, where the OS reports the peer's user, that user is the
+    tenant and no token is needed. Jobs write output_dir, cache and profile
+    paths with the daemon's own rights, so give tokens only to users who may
+    write where the daemon can.
+
+    Args:
+        host (str): Address to listen on. Default is loopback only.
+        port (int): TCP port.
+        socket_path (str): Optional. Listen on this Unix socket instead of TCP.
+        workers (int): Concurrency cap on renderer use.
+        metrics_port (int): Optional. Serve Prometheus metrics of all jobs (step
+                            durations, slides, bytes, failures) on this port.
+        tokens (str): Optional. JSON file of {"tenant": "token"} for a shared
+                      host. Default: one token for the daemon's own user, kept
+                      in DEFAULT_TOKEN_PATH and created if missing.
+    """
+    if metrics_port:
+        from . import instrument
+        exporter = instrument.PrometheusExporter()
+        instrument.set_tracer(instrument.Tracer([exporter]))
+        exporter.serve(metrics_port, host)
+        print("Metrics on http://%s:%d/metrics" % (host, metrics_port))
+    if tokens:
+        known = load_tokens(tokens)
+        print("Tokens of %d tenant(s) loaded from '%s'" % (len(known), tokens))
+    else:
+        known = {ensure_token(): getpass.getuser()}
+        print("Token in '%s'" % DEFAULT_TOKEN_PATH)
+    scheduler = Scheduler(workers=workers)
+    scheduler.start()
+    if socket_path:
+        if _UnixServer is None:
+            raise OSError("Unix sockets are not available on this platform.")
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = _UnixServer(socket_path, _Handler)
+        where = socket_path
+    else:
+        server = _TCPServer((host, port), _Handler)
+        where = "%s:%d" % (host, port)
+    server.scheduler = scheduler
+    server.tokens = known
+    print("pptx2png scheduler listening on %s (%d worker(s))" % (where, scheduler.workers))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        scheduler.stop()
+
+
+def _request(request, host, port, socket_path):
+    if socket_path:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(socket_path)
+    else:
+        sock = socket.create_connection((host, port))
+    with sock:
+        sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile("rb") as f:
+            for line in f:
+                yield json.loads(line.decode("utf-8"))
+
+
+def submit(pptx, tenant=None, priority="normal", wait=True,
+           host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, token=None, **options):
+    """
+    Submit a topng() job to a running scheduler and stream its events.
+
+    Args:
+        pptx (str): Path to the .pptx file.
+        tenant (str): Optional. Sub-tenant of the token's owner, for services that
+                      submit for several users. Default: the token's owner.
+        priority (str|int): Optional. 'interactive', 'normal' (default) or 'bulk'.
+        wait (bool): Optional. Stream events until the job finishes. Default True.
+        token (str): Optional. Default: the token in DEFAULT_TOKEN_PATH.
+        **options: Further topng() arguments (output_dir, slide_range, scale, ...).
+
+    Yields:
+        dict: Events 'queued', 'started', 'slide' and 'finished' (with 'result').
+    """
+    options["pptx"] = os.path.abspath(pptx)
+    for name in PATH_OPTIONS:
+        if isinstance(options.get(name), str):
+            options[name] = os.path.abspath(options[name])
+    request = {
+        "op": "submit",
+        "token": token or read_token(),
+        "tenant": tenant,
+        "priority": priority,
+        "wait": wait,
+        "job": options,
+    }
+    for event in _request(request, host, port, socket_path):
+        yield event
+
+
+def status(host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, token=None):
+    """Return the queued and running job counts of a running scheduler."""
+    request = {"op": "status", "token": token or read_token()}
+    for event in _request(request, host, port, socket_path):
+        return event
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m pptx2png.scheduler",
+                                     description="Shared pptx2png conversion scheduler.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", dest="socket_path", help="Unix socket path instead of TCP")
+    parser.add_argument("--token", help="client token (default: read from %s)" % DEFAULT_TOKEN_PATH)
+    commands = parser.add_subparsers(dest="command")
+
+    p_serve = commands.add_parser("serve", help="run the scheduler daemon")
+    p_serve.add_argument("--workers", type=int, default=1)
+    p_serve.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port")
+    p_serve.add_argument("--tokens", metavar="JSON",
+                         help='tenant tokens for a shared host, {"tenant": "token"}')
+
+    p_submit = commands.add_parser("submit", help="submit a job and stream its events")
+    p_submit.add_argument("pptx")
+    p_submit.add_argument("--output-dir", default="./output")
+    p_submit.add_argument("--range", nargs=2, type=int, metavar=("START", "END"))
+    p_submit.add_argument("--slides", help='selection such as "1-5,8,section:Appendix"')
+    p_submit.add_argument("--skip-hidden", action="store_true")
+    p_submit.add_argument("--scale", type=int)
+    p_submit.add_argument("--pdf", nargs="?", const=True, metavar="PATH",
+                          help="also save a PDF in the same open (default: next to the slides)")
+    p_submit.add_argument("--profile", nargs="?", const=True, metavar="PATH",
+                          help="write a performance report of the job")
+    p_submit.add_argument("--tenant", help="sub-tenant of the token's owner")
+    p_submit.add_argument("--priority", default="normal")
+    p_submit.add_argument("--no-wait", action="store_true")
+
+    commands.add_parser("status", help="show queued and running jobs")
+
+    args = parser.parse_args(argv)
+    address = {"host": args.host, "port": args.port, "socket_path": args.socket_path}
+    if args.command == "serve":
+        serve(workers=args.workers, metrics_port=args.metrics_port, tokens=args.tokens, **address)
+    elif args.command == "submit":
+        options = {"output_dir": args.output_dir}
+        if args.range:
+            options["slide_range"] = args.range
+        if args.scale:
+            options["scale"] = args.scale
+        if args.slides:
+            options["slides"] = args.slides
+        if args.skip_hidden:
+            options["skip_hidden"] = True
+        if args.pdf:
+            options["pdf"] = args.pdf
+        if args.profile:
+            options["profile"] = args.profile
+        for event in submit(args.pptx, tenant=args.tenant, priority=args.priority,
+                            wait=not args.no_wait, token=args.token, **dict(address, **options)):
+            print(json.dumps(event))
+    elif args.command == "status":
+        print(json.dumps(status(token=args.token, **address)))
+    else:
+        parser.print_help()
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""selection.py"""
+
+import re
+
+_RANGE_RE = re.compile(r"^(\d*)\s*-\s*(\d*)$")
+
+
+def resolve_selection(spec, deck, skip_hidden=False):
+    """
+    Turn a slide selection into a sorted list of slide numbers.
+
+    Args:
+        spec: None or "all" for every slide; an iterable of slide numbers; or a
+              string of comma-separated terms:
+                  "3"             a single slide
+                  "1-5", "10-"    a range; open ends run to the first/last slide
+                  "section:Intro" every slide of a section
+                  "!4", "!2-3"    exclude slides matched by the term; a spec
+                                  of exclusions only starts from every slide
+        deck (DeckInfo): Metadata from ooxml.read_deck().
+        skip_hidden (bool): Drop slides that are hidden in the slide show.
+
+    Returns:
+        list: Slide numbers (1-based) in deck order. Numbers beyond the deck are ignored.
+
+    Raises:
+        ValueError: If a term cannot be parsed or names an unknown section.
+    """
+    total = len(deck.slides)
+    if spec is None or (isinstance(spec, str) and spec.strip().lower() in ("", "all", "*")):
+        chosen = set(range(1, total + 1))
+    elif isinstance(spec, str):
+        chosen = set()
+        excluded = set()
+        positive = False
+        for term in spec.split(","):
+            term = term.strip()
+            if not term:
+                continue
+            if term.startswith("!"):
+                excluded |= _term(term[1:].strip(), deck, total)
+            else:
+                positive = True
+                chosen |= _term(term, deck, total)
+        if not positive:
+            # "!2" means every slide but 2
+            chosen = set(range(1, total + 1))
+        chosen -= excluded
+    else:
+        try:
+            chosen = set(int(i) for i in spec)
+        except (TypeError, ValueError):
+            raise ValueError("Slide selection must be a string or a list of slide numbers.")
+
+    indices = sorted(i for i in chosen if 1 <= i <= total)
+    if skip_hidden:
+        indices = [i for i in indices if not deck.slide(i).hidden]
+    return indices
+
+
+def _term(term, deck, total):
+    if term.lower().startswith("section:"):
+        name = term.split(":", 1)[1].strip()
+        if name not in deck.sections:
+            raise ValueError("Unknown section '%s'." % name)
+        return set(deck.sections[name])
+    if term.isdigit():
+        return set([int(term)])
+    match = _RANGE_RE.match(term)
+    if not match or not (match.group(1) or match.group(2)):
+        raise ValueError("Invalid slide selection term '%s'." % term)
+    start = int(match.group(1)) if match.group(1) else 1
+    end = int(match.group(2)) if match.group(2) else total
+    # Clamped to the deck, so "1-1000000000" does not build a billion numbers
+    return set(range(max(1, start), min(end, total) + 1))
+
+
+def format_ranges(indices):
+    """
+    Summarize slide numbers for display, e.g. [1, 2, 3, 5] -> '1-3, 5'.
+
+    Args:
+        indices (list): Sorted slide numbers.
+
+    Returns:
+        str: Compact description of the numbers.
+    """
+    parts = []
+    for start, end in to_ranges(indices):
+        parts.append(str(start) if start == end else "%d-%d" % (start, end))
+    return ", ".join(parts)
+
+
+def to_ranges(indices):
+    """Merge slide numbers into contiguous [start, end] ranges."""
+    ranges = []
+    for i in sorted(set(indices)):
+        if ranges and i == ranges[-1][1] + 1:
+            ranges[-1][1] = i
+        else:
+            ranges.append([i, i])
+    return ranges
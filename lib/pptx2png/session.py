@@ -0,0 +1,356 @@
+"""session.py"""
+
+import os
+import csv
+import time
+import signal
+import threading
+import subprocess
+
+from . import retry as _retry
+
+
+class BackendUnavailableError(RuntimeError):
+    """Raised when the PowerPoint backend (pywin32 + PowerPoint) cannot be loaded."""
+
+
+class RenderTimeout(Exception):
+    """Raised when the watchdog had to kill a renderer call that took too long."""
+
+
+_win32com_client = None
+
+# PpSaveAsFileType.ppSaveAsPDF
+PP_SAVE_AS_PDF = 32
+
+
+def load_backend():
+    """
+    Import the COM client on first use and cache it.
+
+    Importing pptx2png stays free of COM start-up and works on hosts without
+    pywin32; only the first session actually pays for (or fails on) it.
+
+    Returns:
+        module: win32com.client.
+
+    Raises:
+        BackendUnavailableError: If pywin32 is not installed.
+    """
+    global _win32com_client
+    if _win32com_client is None:
+        try:
+            import win32com.client
+        except ImportError:
+            raise BackendUnavailableError(
+                "Library 'pywin32' is required. Please install it via: pip install pywin32")
+        _win32com_client = win32com.client
+    return _win32com_client
+
+
+class PowerPointSession(object):
+    """
+    One opened presentation in a PowerPoint instance.
+
+    By default the user's running PowerPoint is shared, as before. With
+    isolated=True a private instance is started through DispatchEx so that it
+    can be killed and restarted by the watchdog without touching the user's
+    open windows.
+
+    Capabilities:
+        can_save_pdf: The open deck can be written as a PDF (PowerPoint's own
+            vector output, text stays selectable) without reopening it.
+        can_rasterize_pdf: PNGs could be derived from one PDF rasterization
+            pass. PowerPoint cannot do this, so slides are always exported one
+            by one and a PDF is an additional save of the same open deck.
+    """
+
+    can_save_pdf = True
+    can_rasterize_pdf = False
+
+    def __init__(self, pptx_path, isolated=False):
+        self.pptx_path = pptx_path
+        self.isolated = isolated
+        self.app = None
+        self.presentation = None
+        self.pid = None
+        # Original font -> replacement, applied on every open (also after a restart)
+        self.font_substitutions = {}
+
+    def start(self):
+        """Attach to (or, when isolated, launch) a PowerPoint instance."""
+        client = load_backend()
+        if self.isolated:
+            before = _powerpoint_pids()
+            self.app = client.DispatchEx("PowerPoint.Application")
+            self.pid = _process_id(self.app)
+            if not self.pid and before is not None:
+                # No window handle to ask: the private instance is the process that just appeared
+                started = (_powerpoint_pids() or set()) - before
+                if len(started) == 1:
+                    self.pid = started.pop()
+            if not self.pid:
+                print("Warning: The PowerPoint process id could not be found. Timeouts are "
+                      "not enforced: a hung call cannot be stopped.")
+        else:
+            self.app = client.Dispatch("PowerPoint.Application")
+
+    def open(self):
+        """Open the presentation (WithWindow=False attempts background processing)."""
+        # Note: Some PPT versions force visibility despite this flag.
+        self.presentation = self.app.Presentations.Open(self.pptx_path, WithWindow=False)
+        for original, replacement in self.font_substitutions.items():
+            try:
+                # Changes the open copy only; the file on disk is never saved
+                self.presentation.Fonts.Replace(original, replacement)
+            except Exception as e:
+                print("Warning: Could not replace font '%s' with '%s' (%s)." % (
+                    original, replacement, e))
+        return self.presentation
+
+    @property
+    def slide_count(self):
+        return self.presentation.Slides.Count
+
+    @property
+    def slide_size(self):
+        """Slide size in points as (width, height)."""
+        page_setup = self.presentation.PageSetup
+        return page_setup.SlideWidth, page_setup.SlideHeight
+
+    @property
+    def notes_size(self):
+        """Notes page size in points as (width, height)."""
+        try:
+            master = self.presentation.NotesMaster
+            return master.Width, master.Height
+        except Exception:
+            # PowerPoint's default notes page, 7.5 x 10 inches
+            return 540.0, 720.0
+
+    def export_slide(self, index, path, width, height, filter_name="PNG"):
+        """Export one slide (1-based) to an image file."""
+        self.presentation.Slides(index).Export(path, filter_name, width, height)
+
+    def export_notes_page(self, index, path, width, height, filter_name="PNG"):
+        """Export the notes page of one slide (1-based): the slide above its speaker notes."""
+        self.presentation.Slides(index).NotesPage.Export(path, filter_name, width, height)
+
+    def save_pdf(self, path):
+        """Save the whole open presentation as a PDF."""
+        self.presentation.SaveAs(path, PP_SAVE_AS_PDF)
+
+    def close(self):
+        """Close the presentation, and quit the instance if it is private."""
+        if self.presentation:
+            try:
+                self.presentation.Close()
+            except Exception:
+                pass
+            self.presentation = None
+        # Quitting a shared instance is intentionally omitted to avoid closing user's active windows
+        if self.isolated and self.app:
+            try:
+                self.app.Quit()
+            except Exception:
+                pass
+        self.app = None
+
+    def kill(self):
+        """Terminate a private PowerPoint process. Shared instances are never killed."""
+        if not self.isolated or not self.pid:
+            return False
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+        except OSError:
+            return False
+        return True
+
+    def restart(self):
+        """Replace a killed or hung instance with a fresh one and reopen the deck."""
+        if not self.kill() and self.presentation:
+            try:
+                self.presentation.Close()
+            except Exception:
+                pass
+        self.presentation = None
+        self.app = None
+        self.pid = None
+        self.start()
+        self.open()
+
+
+def _process_id(app):
+    """Return the process id behind a PowerPoint Application object, if it can be found."""
+    try:
+        hwnd = int(app.HWND)
+    except Exception:
+        return None
+    try:
+        import win32process
+        return win32process.GetWindowThreadProcessId(hwnd)[1] or None
+    except Exception:
+        pass
+    # Without win32process, ask user32 directly
+    try:
+        import ctypes
+        pid = ctypes.c_ulong()
+        ctypes.windll.user32.GetWindowThreadProcessId(hwnd, ctypes.byref(pid))
+        return pid.value or None
+    except Exception:
+        return None
+
+
+def _powerpoint_pids():
+    """Process ids of the running POWERPNT.EXE processes, or None if they cannot be listed."""
+    try:
+        listing = subprocess.run(
+            ["tasklist", "/FI", "IMAGENAME eq POWERPNT.EXE", "/FO", "CSV", "/NH"],
+            capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    pids = set()
+    for row in csv.reader(listing.splitlines()):
+        if len(row) > 1 and row[1].isdigit():
+            pids.add(int(row[1]))
+    return pids
+
+
+class Watchdog(object):
+    """
+    Background timer that kills the renderer when an armed call overruns.
+
+    A blocked COM call cannot be interrupted from Python, but once the
+    PowerPoint process is gone the call returns with an RPC error. The caller
+    then checks fired to tell a timeout apart from an ordinary failure.
+
+    Args:
+        on_timeout (callable): Called from the watchdog thread on expiry.
+    """
+
+    def __init__(self, on_timeout):
+        self.on_timeout = on_timeout
+        self.fired = False
+        self.label = None
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def arm(self, seconds, label):
+        """Start the countdown for one call. None or 0 disables it."""
+        self.disarm()
+        self.fired = False
+        self.label = label
+        if not seconds or seconds <= 0:
+            return
+        with self._lock:
+            self._timer = threading.Timer(seconds, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def disarm(self):
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+
+    def _expire(self):
+        with self._lock:
+            self._timer = None
+        self.fired = True
+        print("Watchdog: '%s' timed out, killing renderer." % self.label)
+        if self.on_timeout() is False:
+            print("Warning: The renderer could not be killed, '%s' runs until it returns." %
+                  self.label)
+
+
+class GuardedSession(object):
+    """
+    Runs the renderer calls of one job under a watchdog and a retry policy.
+
+    Busy errors are retried on the same instance with exponential backoff;
+    errors that mean the renderer died restart it first. Timeouts are not
+    retried, since a slide that hung once usually hangs again.
+
+    Args:
+        session (PowerPointSession): The session to drive.
+        policy (RetryPolicy): Retry policy for open and slide calls.
+        open_timeout (float): Seconds allowed for opening the deck, or None.
+        slide_timeout (float): Seconds allowed for one slide, or None.
+        deadline (float): time.monotonic() value ending the whole job, or None.
+    """
+
+    def __init__(self, session, policy, open_timeout=None, slide_timeout=None, deadline=None):
+        self.session = session
+        self.policy = policy
+        self.open_timeout = open_timeout
+        self.slide_timeout = slide_timeout
+        self.deadline = deadline
+        self.watchdog = Watchdog(session.kill)
+        self.retries = {"open": 0, "slide": 0, "pdf": 0}
+        self.restarts = 0
+        self.needs_restart = False
+
+    def expired(self):
+        return bool(self.deadline) and time.monotonic() >= self.deadline
+
+    def open(self):
+        self._call("open", self.session.open, self.open_timeout, "open")
+
+    def restart(self):
+        self.restarts += 1
+        self.needs_restart = False
+        self._call("open", self.session.restart, self.open_timeout, "open")
+
+    def export_slide(self, index, path, width, height, label, filter_name="PNG"):
+        self._call(label, lambda: self.session.export_slide(index, path, width, height, filter_name),
+                   self.slide_timeout, "slide")
+
+    def export_notes_page(self, index, path, width, height, label, filter_name="PNG"):
+        self._call(label, lambda: self.session.export_notes_page(index, path, width, height,
+                                                                 filter_name),
+                   self.slide_timeout, "slide")
+
+    def save_pdf(self, path, timeout=None):
+        self._call("pdf", lambda: self.session.save_pdf(path), timeout, "pdf")
+
+    def stop(self):
+        self.watchdog.disarm()
+
+    def _budget(self, timeout):
+        """Seconds the next call may take, from its own limit and the job deadline."""
+        budgets = []
+        if timeout:
+            budgets.append(timeout)
+        if self.deadline:
+            budgets.append(max(0.001, self.deadline - time.monotonic()))
+        return min(budgets) if budgets else None
+
+    def _call(self, label, call, timeout, counter):
+        attempt = 1
+        while True:
+            self.watchdog.arm(self._budget(timeout), label)
+            try:
+                result = call()
+                # The watchdog may have expired just after the call returned
+                if self.watchdog.fired:
+                    self.needs_restart = True
+                return result
+            except Exception as e:
+                if self.watchdog.fired:
+                    self.needs_restart = True
+                    raise RenderTimeout("'%s' timed out." % label)
+                kind = _retry.classify(e)
+                if kind == _retry.RESTART:
+                    self.needs_restart = True
+                if kind == _retry.FATAL or attempt >= self.policy.max_attempts or self.expired():
+                    raise
+                delay = self.policy.delay(attempt)
+                print("Retrying '%s' in %.1fs (attempt %d of %d): %s" % (
+                    label, delay, attempt + 1, self.policy.max_attempts, e))
+            finally:
+                self.watchdog.disarm()
+            self.retries[counter] += 1
+            time.sleep(delay)
+            if self.needs_restart and call != self.session.restart:
+                self.restart()
+            attempt += 1
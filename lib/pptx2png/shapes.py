@@ -0,0 +1,285 @@
+"""shapes.py"""
+
+import os
+import json
+import zipfile
+import xml.etree.ElementTree as ET
+
+from .ooxml import (qn, read_deck, read_rels, content_children, iter_shapes, paragraphs,
+                    placeholder_type)
+
+SHAPES_NAME = "Slide_%d.shapes.json"
+
+_SHAPE_TREE = "%s/%s" % (qn("p:cSld"), qn("p:spTree"))
+_LEAF_SHAPES = {
+    qn("p:sp"): "shape",
+    qn("p:pic"): "picture",
+    qn("p:graphicFrame"): "frame",
+    qn("p:cxnSp"): "connector",
+}
+
+# Slide-show jumps that carry no slide relationship
+_SHOW_JUMPS = {
+    "nextslide": "next",
+    "previousslide": "previous",
+    "firstslide": "first",
+    "lastslide": "last",
+    "lastslideviewed": "last_viewed",
+    "endshow": "end",
+}
+
+# Placeholder types that inherit from a master placeholder of another type
+_MASTER_TYPES = {"obj": "body", "subTitle": "body", "ctrTitle": "title"}
+
+
+def _frame(shape):
+    """(x, y, cx, cy, rotation) of a shape's own xfrm in EMU, or None if it has none or it is malformed."""
+    if shape.tag == qn("p:graphicFrame"):
+        xfrm = shape.find(qn("p:xfrm"))
+    elif shape.tag == qn("p:grpSp"):
+        xfrm = shape.find("%s/%s" % (qn("p:grpSpPr"), qn("a:xfrm")))
+    else:
+        xfrm = shape.find("%s/%s" % (qn("p:spPr"), qn("a:xfrm")))
+    if xfrm is None:
+        return None
+    off, ext = xfrm.find(qn("a:off")), xfrm.find(qn("a:ext"))
+    if off is None or ext is None:
+        return None
+    try:
+        return (int(off.get("x")), int(off.get("y")), int(ext.get("cx")), int(ext.get("cy")),
+                int(xfrm.get("rot", 0)) / 60000.0)
+    except (TypeError, ValueError):
+        # A missing or non-numeric attribute
+        return None
+
+
+def _placeholder_key(shape):
+    ph = shape.find(".//%s" % qn("p:ph"))
+    if ph is None:
+        return None
+    return ph.get("idx"), ph.get("type", "body")
+
+
+def _placeholder_frames(package, part):
+    """Placeholder frames of a layout or master: {"idx": {...}, "type": {...}}."""
+    frames = {"idx": {}, "type": {}}
+    tree = ET.fromstring(package.read(part))
+    for shape in iter_shapes(tree.find(_SHAPE_TREE)):
+        key = _placeholder_key(shape)
+        frame = _frame(shape)
+        if key is None or frame is None:
+            continue
+        idx, ph_type = key
+        if idx is not None:
+            frames["idx"].setdefault(idx, frame)
+        frames["type"].setdefault(ph_type, frame)
+    return frames
+
+
+class _Inheritance(object):
+    """Resolves the frame of placeholders that take their position from the layout or master."""
+
+    def __init__(self, package, slide_part):
+        self.layout = self.master = None
+        for rel_type, target in read_rels(package, slide_part).values():
+            if rel_type == "slideLayout" and target in package.NameToInfo:
+                self.layout = _placeholder_frames(package, target)
+                for master_type, master in read_rels(package, target).values():
+                    if master_type == "slideMaster" and master in package.NameToInfo:
+                        self.master = _placeholder_frames(package, master)
+
+    def frame(self, key):
+        idx, ph_type = key
+        if self.layout:
+            # The layout matches by index first, as PowerPoint does
+            if idx is not None and idx in self.layout["idx"]:
+                return self.layout["idx"][idx]
+            if ph_type in self.layout["type"]:
+                return self.layout["type"][ph_type]
+        if self.master:
+            return self.master["type"].get(_MASTER_TYPES.get(ph_type, ph_type))
+        return None
+
+
+def _link(element, rels, slide_numbers):
+    """
+    Where an a:hlinkClick leads.
+
+    Returns:
+        dict: {"url": ...}, {"slide": n}, {"action": ...} or None when the
+              click does nothing.
+    """
+    rel = rels.get(element.get(qn("r:id")) or "")
+    action = element.get("action", "")
+    if action.startswith("ppaction://hlinkshowjump"):
+        jump = action.partition("jump=")[2]
+        return {"action": _SHOW_JUMPS.get(jump, jump)}
+    if rel is None:
+        return None
+    rel_type, target = rel
+    if rel_type == "slide":
+        number = slide_numbers.get(target)
+        return {"slide": number} if number else None
+    if rel_type.endswith("#external"):
+        return {"url": target}
+    # Targets inside the package that are not slides, such as other documents
+    return {"action": action or rel_type, "target": target}
+
+
+def _group_transform(group, transform):
+    """
+    Transform of a group's children, from the group's xfrm and its parent's transform.
+
+    Returns:
+        tuple: (sx, sy, tx, ty), transform itself for a group without a child
+               space, or None if the group's xfrm is malformed.
+    """
+    xfrm = group.find("%s/%s" % (qn("p:grpSpPr"), qn("a:xfrm")))
+    if xfrm is None or xfrm.find(qn("a:chExt")) is None:
+        return transform
+    frame = _frame(group)
+    ch_off, ch_ext = xfrm.find(qn("a:chOff")), xfrm.find(qn("a:chExt"))
+    if frame is None or ch_off is None:
+        return None
+    x, y, cx, cy, _ = frame
+    try:
+        ch_x, ch_y = int(ch_off.get("x")), int(ch_off.get("y"))
+        ch_cx, ch_cy = int(ch_ext.get("cx")), int(ch_ext.get("cy"))
+    except (TypeError, ValueError):
+        return None
+    # Children are placed in the group's child space, stretched onto ext
+    gx = float(cx) / max(1, ch_cx)
+    gy = float(cy) / max(1, ch_cy)
+    sx, sy, tx, ty = transform
+    return (sx * gx, sy * gy, tx + sx * (x - gx * ch_x), ty + sy * (y - gy * ch_y))
+
+
+def _walk(element, transform):
+    """
+    Yield (shape, transform) for the visible leaf shapes below element, in drawing order.
+
+    transform maps child coordinates to slide EMU as (sx, sy, tx, ty).
+    """
+    for child in content_children(element):
+        props = child.find(".//%s" % qn("p:cNvPr"))
+        if props is not None and props.get("hidden") in ("1", "true"):
+            continue
+        if child.tag == qn("p:grpSp"):
+            group = _group_transform(child, transform)
+            if group is None:
+                # Children of a group without a usable frame cannot be placed
+                continue
+            for item in _walk(child, group):
+                yield item
+        elif child.tag in _LEAF_SHAPES:
+            yield child, transform
+
+
+def _read_slide(package, part, slide_numbers, px_x, px_y):
+    rels = read_rels(package, part)
+    inheritance = _Inheritance(package, part)
+    tree = ET.fromstring(package.read(part))
+    shapes = []
+    links = []
+    for shape, (sx, sy, tx, ty) in _walk(tree.find(_SHAPE_TREE), (1.0, 1.0, 0.0, 0.0)):
+        frame = _frame(shape)
+        key = _placeholder_key(shape)
+        if frame is None and key is not None:
+            frame = inheritance.frame(key)
+        if frame is None:
+            continue
+        x, y, cx, cy, rotation = frame
+        box = [int(round((tx + sx * x) * px_x)), int(round((ty + sy * y) * px_y)),
+               int(round(sx * cx * px_x)), int(round(sy * cy * px_y))]
+        props = shape.find(".//%s" % qn("p:cNvPr"))
+        entry = {
+            "id": int(props.get("id", 0)) if props is not None else 0,
+            "name": props.get("name", "") if props is not None else "",
+            "kind": _LEAF_SHAPES[shape.tag],
+            "box": box,
+        }
+        if rotation:
+            # The box is the unrotated frame; it turns by this many degrees about its center
+            entry["rotation"] = rotation
+        if key is not None:
+            entry["placeholder"] = placeholder_type(shape)
+        if props is not None and (props.get("descr") or props.get("title")):
+            entry["alt_text"] = props.get("descr") or props.get("title")
+        click = props.find(qn("a:hlinkClick")) if props is not None else None
+        link = _link(click, rels, slide_numbers) if click is not None else None
+        if link:
+            entry["link"] = link
+            links.append(dict(link, shape=entry["id"], box=box))
+        # Links on words of the text: the box is the shape's, since text is laid out by PowerPoint
+        for run in shape.iter(qn("a:r")):
+            run_click = run.find("%s/%s" % (qn("a:rPr"), qn("a:hlinkClick")))
+            run_link = _link(run_click, rels, slide_numbers) if run_click is not None else None
+            if run_link:
+                text = run.find(qn("a:t"))
+                links.append(dict(run_link, shape=entry["id"], box=box,
+                                  text=text.text if text is not None and text.text else ""))
+        if shape.tag == qn("p:sp") and shape.find(qn("p:txBody")) is not None:
+            text = " ".join(paragraphs(shape.find(qn("p:txBody"))))
+            if text:
+                entry["text"] = text
+        shapes.append(entry)
+    return {"shapes": shapes, "links": links}
+
+
+def slide_shapes(pptx_path, indices=None, target_w=None, target_h=None):
+    """
+    Boxes of the shapes and hyperlinks of slides, in pixels of the slide images.
+
+    Read from the package without PowerPoint. Group transforms are applied,
+    and placeholders without their own position take it from the layout or
+    the master. Hidden shapes are left out.
+
+    Args:
+        pptx_path (str): Path to the .pptx file.
+        indices (list): Optional. Slide numbers. Default is all.
+        target_w (int): Optional. Width of the slide images. Default: points at 96 dpi.
+        target_h (int): Optional. Height of the slide images.
+
+    Returns:
+        dict: Slide number -> {"size": [w, h], "shapes": [{"id", "name", "kind",
+              "box": [x, y, w, h], and when present "rotation", "placeholder",
+              "alt_text", "text", "link"}], "links": [{"shape", "box", and
+              "url" | "slide" | "action"}]}, in drawing order.
+    """
+    deck = read_deck(pptx_path)
+    slide_cx, slide_cy = deck.slide_size
+    if not (slide_cx and slide_cy):
+        raise ValueError("'%s' has no slide size." % pptx_path)
+    if not (target_w and target_h):
+        target_w, target_h = int(slide_cx / 9525.0), int(slide_cy / 9525.0)
+    px_x = float(target_w) / slide_cx
+    px_y = float(target_h) / slide_cy
+    slide_numbers = dict((slide.part, slide.index) for slide in deck.slides)
+    wanted = indices if indices is not None else range(1, len(deck.slides) + 1)
+    maps = {}
+    with zipfile.ZipFile(pptx_path) as package:
+        for i in wanted:
+            if 1 <= i <= len(deck.slides):
+                maps[i] = dict(size=[target_w, target_h], **_read_slide(
+                    package, deck.slide(i).part, slide_numbers, px_x, px_y))
+    return maps
+
+
+def write_shape_maps(pptx_path, indices, target_w, target_h, output_dir):
+    """
+    Write Slide_N.shapes.json next to the slide images.
+
+    Each file is written beside its target and renamed, so a viewer never
+    reads a partial file.
+
+    Returns:
+        dict: Slide number -> map, as slide_shapes() returns it.
+    """
+    maps = slide_shapes(pptx_path, indices, target_w, target_h)
+    for i, data in maps.items():
+        path = os.path.join(output_dir, SHAPES_NAME % i)
+        partial = path + ".partial"
+        with open(partial, "w", encoding="utf-8") as f:
+            json.dump(dict(data, slide=i), f, ensure_ascii=False, indent=2)
+        os.replace(partial, path)
+    return maps
@@ -0,0 +1,95 @@
+"""text.py"""
+
+import os
+import json
+import zipfile
+import xml.etree.ElementTree as ET
+
+from .ooxml import qn, read_deck, read_rels, iter_shapes, paragraphs, placeholder_type
+
+TEXT_NAME = "Slide_%d.text.json"
+
+_SHAPE_TREE = "%s/%s" % (qn("p:cSld"), qn("p:spTree"))
+
+# Placeholder types that hold the slide title
+_TITLE_TYPES = ("title", "ctrTitle")
+# Placeholders of a notes page that repeat the slide or page furniture instead of notes
+_NOTES_SKIP_TYPES = ("sldImg", "sldNum", "hdr", "ftr", "dt")
+
+
+def _read_slide(package, part):
+    title = []
+    body = []
+    alt_text = []
+    notes = []
+    tree = ET.fromstring(package.read(part))
+    for shape in iter_shapes(tree.find(_SHAPE_TREE)):
+        props = shape.find(".//%s" % qn("p:cNvPr"))
+        if props is not None and (props.get("descr") or props.get("title")):
+            alt_text.append(props.get("descr") or props.get("title"))
+        if shape.tag == qn("p:sp"):
+            tx_body = shape.find(qn("p:txBody"))
+            if tx_body is None:
+                continue
+            if placeholder_type(shape) in _TITLE_TYPES:
+                title.extend(paragraphs(tx_body))
+            else:
+                body.extend(paragraphs(tx_body))
+        elif shape.tag == qn("p:graphicFrame"):
+            # Tables: one line per cell
+            for cell in shape.iter(qn("a:tc")):
+                body.extend(paragraphs(cell))
+
+    for rel_type, target in read_rels(package, part).values():
+        if rel_type == "notesSlide" and target in package.NameToInfo:
+            notes_tree = ET.fromstring(package.read(target))
+            for shape in iter_shapes(notes_tree.find(_SHAPE_TREE)):
+                tx_body = shape.find(qn("p:txBody"))
+                if tx_body is not None and placeholder_type(shape) not in _NOTES_SKIP_TYPES:
+                    notes.extend(paragraphs(tx_body))
+    return {
+        "title": " ".join(title),
+        "text": body,
+        "notes": "\n".join(notes),
+        "alt_text": alt_text,
+    }
+
+
+def slide_text(pptx_path, indices=None):
+    """
+    Structured text of slides, read from the package without PowerPoint.
+
+    Args:
+        pptx_path (str): Path to the .pptx file.
+        indices (list): Optional. Slide numbers. Default is all.
+
+    Returns:
+        dict: Slide number -> {"title": str, "text": [paragraphs of the other
+              shapes and of table cells, in drawing order], "notes": str,
+              "alt_text": [descriptions of pictures and shapes]}.
+    """
+    deck = read_deck(pptx_path)
+    wanted = indices if indices is not None else range(1, len(deck.slides) + 1)
+    with zipfile.ZipFile(pptx_path) as package:
+        return dict((i, _read_slide(package, deck.slide(i).part)) for i in wanted
+                    if 1 <= i <= len(deck.slides))
+
+
+def write_slide_text(pptx_path, indices, output_dir):
+    """
+    Write Slide_N.text.json next to the slide images.
+
+    Each file is written beside its target and renamed, so an indexer never
+    reads a partial file.
+
+    Returns:
+        dict: Slide number -> text, as slide_text() returns it.
+    """
+    texts = slide_text(pptx_path, indices)
+    for i, data in texts.items():
+        path = os.path.join(output_dir, TEXT_NAME % i)
+        partial = path + ".partial"
+        with open(partial, "w", encoding="utf-8") as f:
+            json.dump(dict(data, slide=i), f, ensure_ascii=False, indent=2)
+        os.replace(partial, path)
+    return texts
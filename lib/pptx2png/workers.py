@@ -0,0 +1,250 @@
+"""workers.py"""
+
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .cost import CostModel, DEFAULT_COST_PATH, balanced_shards
+
+# Modules the fork server imports once, so forked workers start with them loaded
+PRELOAD_MODULES = ["pptx2png.pptx2png", "pptx2png.session", "pptx2png.manifest"]
+
+# Keeps the worker's PowerPoint instance alive between jobs
+_warm_app = None
+
+
+def _init_worker(warm):
+    """Runs once in every worker process, before its first job."""
+    global _warm_app
+    try:
+        import pythoncom
+        pythoncom.CoInitialize()
+    except ImportError:
+        pass
+    from . import pptx2png  # noqa: F401 - import the export path now, not on the first job
+    from .session import load_backend
+    try:
+        client = load_backend()
+        if warm:
+            _warm_app = client.Dispatch("PowerPoint.Application")
+    except Exception as e:
+        print("Worker %d: renderer not preloaded (%s)" % (os.getpid(), e))
+
+
+def _ping():
+    return os.getpid()
+
+
+def _run(options):
+    from .pptx2png import topng
+    return topng(**options)
+
+
+def even_shards(total, count):
+    """
+    Split slides 1..total into at most count contiguous [start, end] ranges.
+
+    Args:
+        total (int): Number of slides.
+        count (int): Number of shards wanted.
+
+    Returns:
+        list: Ranges such as [[1, 4], [5, 8], [9, 10]].
+    """
+    count = max(1, min(count, total))
+    size, extra = divmod(total, count)
+    shards = []
+    start = 1
+    for n in range(count):
+        end = start + size - 1 + (1 if n < extra else 0)
+        shards.append([start, end])
+        start = end + 1
+    return shards
+
+
+def _cost_model(option):
+    """CostModel for WorkerPool.export's cost_model argument, or None."""
+    if not option:
+        return None
+    if isinstance(option, CostModel):
+        return option
+    return CostModel(option if isinstance(option, str) else DEFAULT_COST_PATH)
+
+
+class WorkerPool(object):
+    """
+    Long-lived worker processes that keep the backend loaded between jobs.
+
+    Every worker imports pptx2png and pywin32 once at start-up and, with
+    warm=True, holds a PowerPoint instance open, so a job only pays for
+    opening its deck. On platforms with a fork server the interpreter state
+    is preloaded there and forked; on Windows workers are spawned once and
+    then reused.
+
+    Args:
+        processes (int): Number of workers. Default is the CPU count, at most 4.
+        warm (bool): Keep a PowerPoint instance alive in every worker. Default True.
+        start_method (str): Optional. multiprocessing start method; default is
+                            'forkserver' where available, else 'spawn'.
+    """
+
+    def __init__(self, processes=None, warm=True, start_method=None):
+        self.processes = processes or min(4, multiprocessing.cpu_count())
+        if start_method is None:
+            methods = multiprocessing.get_all_start_methods()
+            start_method = "forkserver" if "forkserver" in methods else "spawn"
+        context = multiprocessing.get_context(start_method)
+        if start_method == "forkserver":
+            context.set_forkserver_preload(PRELOAD_MODULES)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(warm,),
+        )
+
+    def start(self):
+        """Start all workers now, so the first job does not pay for process start-up."""
+        futures = [self._executor.submit(_ping) for _ in range(self.processes)]
+        return sorted(set(f.result() for f in futures))
+
+    def submit(self, pptx, **options):
+        """
+        Run topng() in a worker.
+
+        Args:
+            pptx (str): Path to the .pptx file.
+            **options: Further topng() arguments. progress callbacks are not supported.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the ExportResult.
+        """
+        if options.get("progress"):
+            raise ValueError("progress callbacks cannot be sent to worker processes.")
+        options["pptx"] = os.path.abspath(pptx)
+        if "output_dir" in options:
+            options["output_dir"] = os.path.abspath(options["output_dir"])
+        return self._executor.submit(_run, options)
+
+    def export(self, pptx, shards=None, cost_model=True, **options):
+        """
+        Export one deck in parallel, one shard of slides per worker.
+
+        Shards are balanced by predicted render time, so a worker that gets
+        the image-heavy slides is not left running long after the others.
+        The measured times of every export calibrate the prediction for the
+        next one.
+
+        Args:
+            pptx (str): Path to the .pptx file.
+            shards (int): Optional. Number of shards. Default is the worker count.
+            cost_model: True (default) for the shared calibration file, a path,
+                        a cost.CostModel, or False to split into equal ranges.
+            **options: Further topng() arguments (output_dir, slides, scale, manifest, ...).
+
+        Returns:
+            ExportResult: The merged result of all shards.
+        """
+        from .ooxml import read_deck
+        from .selection import resolve_selection
+        from .pptx2png import ExportResult
+        from .profile import PROFILE_NAME
+
+        output_dir = os.path.abspath(options.get("output_dir", "./output"))
+        # Created here so that the shards do not race to create it
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+        options["output_dir"] = output_dir
+
+        # Shards finish out of order, so the overview is assembled once they are all done
+        contact_sheet = options.pop("contact_sheet", None)
+        animation = options.pop("animation", None)
+        frame_duration = options.pop("frame_duration", None)
+        pdf = options.pop("pdf", None)
+        pdf_mode = options.pop("pdf_mode", "native")
+        profile = options.pop("profile", False)
+        handouts = options.pop("handouts", None)
+
+        # The selection is resolved here and every shard gets an explicit list of slides
+        slides = options.pop("slides", None)
+        slide_range = options.pop("slide_range", None)
+        if slides is None and slide_range:
+            slides = range(slide_range[0], slide_range[1] + 1)
+        selection = resolve_selection(slides, read_deck(pptx), options.pop("skip_hidden", False))
+
+        count = shards or self.processes
+        model = _cost_model(cost_model)
+        if model:
+            costs = model.estimate_deck(pptx, selection)
+            groups = balanced_shards(costs, count)
+            print("Shards: %s" % ", ".join(
+                "%d slides (~%.1f s)" % (len(g), sum(costs[i] for i in g)) for g in groups))
+        else:
+            groups = [selection[start - 1:end] for start, end in even_shards(len(selection), count)]
+
+        futures = []
+        for n, group in enumerate(g for g in groups if g):
+            shard_options = dict(options)
+            if pdf and pdf_mode == "native" and n == 0:
+                # The whole deck is saved once, from the first shard's open presentation
+                shard_options["pdf"] = pdf
+            if profile:
+                # One report per shard; each shard is its own process and its own open
+                base = profile if isinstance(profile, str) else PROFILE_NAME
+                root, ext = os.path.splitext(os.path.join(output_dir, base))
+                shard_options["profile"] = "%s.%d%s" % (root, n + 1, ext)
+            futures.append(self.submit(pptx, slides=group, **shard_options))
+        merged = ExportResult(output_dir)
+        for future in futures:
+            merged.merge(future.result())
+
+        if model and model.path and merged.render_times:
+            try:
+                model.observe_deck(pptx, merged.render_times)
+                model.save()
+            except (OSError, ValueError) as e:
+                print("Warning: Could not update the cost model (%s)." % e)
+
+        if contact_sheet:
+            from .contact import make_contact_sheet, CONTACT_SHEET_NAME
+            done = sorted(merged.saved + merged.skipped)
+            if done:
+                path = contact_sheet if isinstance(contact_sheet, str) else \
+                    os.path.join(output_dir, CONTACT_SHEET_NAME)
+                merged.contact_sheet = make_contact_sheet(
+                    [(i, os.path.join(output_dir, "Slide_%d.png" % i)) for i in done],
+                    os.path.abspath(path))
+        if pdf and pdf_mode == "images" and merged.saved + merged.skipped:
+            from .imaging import images_to_pdf
+            done = sorted(merged.saved + merged.skipped)
+            path = os.path.abspath(pdf) if isinstance(pdf, str) else os.path.join(
+                output_dir, os.path.splitext(os.path.basename(pptx))[0] + ".pdf")
+            images_to_pdf([os.path.join(output_dir, "Slide_%d.png" % i) for i in done], path)
+            merged.pdf = path
+        if handouts and merged.saved + merged.skipped:
+            from .handout import make_handouts
+            done = sorted(merged.saved + merged.skipped)
+            merged.handouts = make_handouts(
+                [os.path.join(output_dir, "Slide_%d.png" % i) for i in done], output_dir, handouts)
+        if animation and merged.saved + merged.skipped:
+            from .animate import make_animation, frame_durations
+            done = sorted(merged.saved + merged.skipped)
+            seconds = frame_durations(frame_duration, done)
+            try:
+                merged.animation = make_animation(
+                    [os.path.join(output_dir, "Slide_%d.png" % i) for i in done],
+                    os.path.abspath(animation), [seconds[i] for i in done])
+            except Exception as e:
+                # The slide images are already exported; only the animation is lost
+                merged.animation_error = str(e) or e.__class__.__name__
+                print("Warning: Animation not written (%s)." % merged.animation_error)
+        return merged
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.shutdown()
@@ -28,5 +28,10 @@ setup(
     install_requires=[
         "pywin32",
     ],
-    python_requires='>=3.5',
+    extras_require={
+        # Contact sheets, animations without ffmpeg, image PDFs, handouts,
+        # downsampling and image comparison
+        "images": ["Pillow"],
+    },
+    python_requires='>=3.7',
 )
\ No newline at end of file
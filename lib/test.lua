@@ -92,7 +92,7 @@ if not os.path.exists(TEST_PPTX):
 # Clean previous run leftovers
 clean_test_root()
 
-print("Starting 15 Test Cases...\n")
+print("Starting 42 Test Cases...\n")
 
 # 1. Info Check
 # ------------------------------------------------
@@ -203,6 +203,1081 @@ run_test_case(15, "Error: Missing Input File",
               # Note: Your library prints "Error: File... not found" but might not RAISE an exception.
               # If it just returns, expect_error should be False, but we verify it didn't crash.
 
+# 16. Manifest
+# Logic: one NDJSON record per exported slide, no staging leftovers in the output dir.
+# ------------------------------------------------
+d16 = get_case_dir("case_16_manifest")
+def case_16():
+    pptx2img.topng(pptx=TEST_PPTX, output_dir=d16, slide_range=[1, 2], manifest=True)
+    records = pptx2img.read_manifest(os.path.join(d16, "manifest.ndjson"))
+    assert sorted(records) == ["Slide_1.png", "Slide_2.png"], records
+    assert all(r["size"] > 0 and r["width"] > 0 for r in records.values())
+    assert not [n for n in os.listdir(d16) if n.startswith(".pptx2png-staging-")]
+run_test_case(16, "Manifest + Staging Cleanup", case_16,
+              expected_count=2, check_dir=d16)
+
+# 17. Resume
+# Logic: after deleting one image, a resumed run re-renders only that slide.
+# ------------------------------------------------
+d17 = get_case_dir("case_17_resume")
+def case_17():
+    pptx2img.topng(pptx=TEST_PPTX, output_dir=d17, scale=1, resume=True)
+    os.remove(os.path.join(d17, "Slide_2.png"))
+    kept = os.path.getmtime(os.path.join(d17, "Slide_1.png"))
+    pptx2img.topng(pptx=TEST_PPTX, output_dir=d17, scale=1, resume=True)
+    assert os.path.getmtime(os.path.join(d17, "Slide_1.png")) == kept
+run_test_case(17, "Resume After Partial Run", case_17,
+              expected_count=TOTAL_SLIDES, check_dir=d17)
+
+# 18. Timeouts (private instance + watchdog)
+# Logic: generous limits must not fail any slide; the result object reports all saved.
+# ------------------------------------------------
+d18 = get_case_dir("case_18_timeouts")
+def case_18():
+    result = pptx2img.topng(pptx=TEST_PPTX, output_dir=d18, scale=1,
+                            open_timeout=120, slide_timeout=60, total_timeout=600)
+    assert result.ok and result.saved == [1, 2, 3, 4], result
+run_test_case(18, "Timeouts + ExportResult", case_18,
+              expected_count=TOTAL_SLIDES, check_dir=d18)
+
+# 19. Slide Selection
+# Logic: arbitrary sets and range strings are exported in one open.
+# ------------------------------------------------
+d19 = get_case_dir("case_19_selection")
+def case_19():
+    result = pptx2img.topng(pptx=TEST_PPTX, output_dir=d19, scale=1, slides="1,3-")
+    assert result.saved == [1, 3, 4], result.saved
+run_test_case(19, "Selection '1,3-'", case_19,
+              expected_count=3, check_dir=d19)
+
+# 20. Scheduler queue: priorities and fair share
+# Logic: interactive jobs run before bulk ones; within a priority, a tenant that
+# queued many jobs does not starve one that queued a single job later, and a
+# tenant with a running job waits behind one without.
+# ------------------------------------------------
+def case_20():
+    from pptx2png.scheduler import FairQueue, Job, PRIORITIES
+    q = FairQueue()
+    q.put(Job(1, "a", PRIORITIES["bulk"], {}))
+    q.put(Job(2, "a", PRIORITIES["interactive"], {}))
+    first = q.get()
+    assert first.job_id == 2, first.job_id
+    q.done(first)
+    assert q.get().job_id == 1
+
+    q = FairQueue()
+    for n in range(5):
+        q.put(Job(10 + n, "bulk-user", PRIORITIES["normal"], {}))
+    q.put(Job(20, "late-user", PRIORITIES["normal"], {}))
+    order = []
+    for _ in range(6):
+        job = q.get()
+        order.append(job.job_id)
+        q.done(job)
+    assert order.index(20) <= 1, order
+    assert [i for i in order if i != 20] == [10, 11, 12, 13, 14], order
+
+    q = FairQueue()
+    q.put(Job(30, "a", 5, {}))
+    q.put(Job(31, "a", 5, {}))
+    running = q.get()
+    q.put(Job(32, "b", 5, {}))
+    assert q.get().job_id == 32
+    assert q.snapshot() == {"queued": {"5": {"a": 1}}, "running": {"a": 1, "b": 1}}, q.snapshot()
+    q.close()
+    assert q.get() is None
+run_test_case(20, "Scheduler FairQueue ordering", case_20)
+
+# 21. Retry of transient COM errors
+# Logic: busy errors are retried on the same instance, dead-server errors restart
+# it first, other errors and timeouts are not retried. A fake session raises
+# errors shaped like pywintypes.com_error, so PowerPoint is not needed.
+# ------------------------------------------------
+def case_21():
+    import threading
+    from pptx2png import retry
+    from pptx2png.session import GuardedSession, RenderTimeout
+
+    class FakeComError(Exception):
+        """(hresult, text, (wcode, source, description, helpfile, helpcontext, scode), argerror)"""
+
+    def com_error(code, scode=None):
+        info = (0, "PowerPoint", "", None, 0, scode) if scode is not None else None
+        return FakeComError(code, "", info, None)
+
+    DISP_E_EXCEPTION = -2147352567
+    assert retry.classify(com_error(retry.RPC_E_CALL_REJECTED)) == retry.RETRY
+    assert retry.classify(com_error(DISP_E_EXCEPTION, retry.RPC_E_SERVERCALL_RETRYLATER)) == retry.RETRY
+    assert retry.classify(com_error(retry.RPC_S_SERVER_UNAVAILABLE)) == retry.RESTART
+    assert retry.classify(com_error(DISP_E_EXCEPTION, -2147024809)) == retry.FATAL
+    assert retry.classify(ValueError("not COM")) == retry.FATAL
+
+    policy = retry.RetryPolicy(max_attempts=10, backoff=1.0, factor=2.0, max_backoff=5.0, jitter=0.2)
+    assert [round(retry.RetryPolicy(backoff=1.0, jitter=0).delay(n), 6) for n in (1, 2, 3)] == [1.0, 2.0, 4.0]
+    for attempt in range(1, 10):
+        base = min(5.0, 2.0 ** (attempt - 1))
+        for _ in range(20):
+            assert base * 0.8 <= policy.delay(attempt) <= base * 1.2
+    assert retry.NO_RETRY.max_attempts == 1
+    assert retry.RetryPolicy(max_attempts=0).max_attempts == 1
+
+    class FakeSession(object):
+        def __init__(self, errors):
+            self.errors = list(errors)
+            self.calls = []
+            self.killed = threading.Event()
+
+        def open(self):
+            self.calls.append("open")
+
+        def restart(self):
+            self.calls.append("restart")
+
+        def kill(self):
+            self.killed.set()
+
+        def export_slide(self, index, path, width, height, filter_name):
+            self.calls.append("export")
+            if self.errors:
+                error = self.errors.pop(0)
+                if error == "hang":
+                    # Blocks like a hung COM call until the watchdog kills the renderer
+                    self.killed.wait(5)
+                    error = com_error(retry.RPC_E_DISCONNECTED)
+                raise error
+
+    fast = retry.RetryPolicy(max_attempts=3, backoff=0, jitter=0)
+    session = FakeSession([com_error(retry.RPC_E_CALL_REJECTED)])
+    guarded = GuardedSession(session, fast)
+    guarded.export_slide(1, "x.png", 10, 10, "slide 1")
+    assert session.calls == ["export", "export"], session.calls
+    assert guarded.retries["slide"] == 1 and guarded.restarts == 0
+
+    session = FakeSession([com_error(retry.RPC_S_CALL_FAILED)])
+    guarded = GuardedSession(session, fast)
+    guarded.export_slide(1, "x.png", 10, 10, "slide 1")
+    assert session.calls == ["export", "restart", "export"], session.calls
+    assert guarded.restarts == 1 and not guarded.needs_restart
+
+    session = FakeSession([com_error(retry.RPC_E_CALL_REJECTED)] * 5)
+    try:
+        GuardedSession(session, fast).export_slide(1, "x.png", 10, 10, "slide 1")
+    except FakeComError:
+        pass
+    else:
+        raise AssertionError("busy error retried beyond max_attempts")
+    assert session.calls == ["export"] * 3, session.calls
+
+    session = FakeSession([com_error(retry.RPC_E_CALL_REJECTED)])
+    try:
+        GuardedSession(session, retry.NO_RETRY).export_slide(1, "x.png", 10, 10, "slide 1")
+    except FakeComError:
+        pass
+    assert session.calls == ["export"], session.calls
+
+    session = FakeSession(["hang"])
+    guarded = GuardedSession(session, fast, slide_timeout=0.2)
+    try:
+        guarded.export_slide(1, "x.png", 10, 10, "slide 1")
+    except RenderTimeout:
+        pass
+    else:
+        raise AssertionError("timeout not reported")
+    assert session.calls == ["export"], "a timed out call is not retried"
+    assert guarded.needs_restart and guarded.retries["slide"] == 0
+run_test_case(21, "Retry: classify, backoff and the guarded call loop", case_21)
+
+# 22. Scheduler priorities from clients
+# Logic: names map to PRIORITIES, numbers are clamped to their range, so a
+# tenant cannot queue ahead of interactive jobs; anything else is rejected.
+# ------------------------------------------------
+def case_22():
+    from pptx2png.scheduler import Scheduler, PRIORITIES
+    scheduler = Scheduler(runner=lambda job: {})
+    options = {"pptx": TEST_PPTX}
+    assert scheduler.submit("a", "bulk", options).priority == PRIORITIES["bulk"]
+    first = scheduler.submit("a", "interactive", options)
+    pushy = scheduler.submit("b", -1000, options)
+    assert pushy.priority == PRIORITIES["interactive"]
+    assert scheduler.submit("b", 10 ** 6, options).priority == PRIORITIES["bulk"]
+    for bad in (True, "urgent", 2.5, None, ["interactive"]):
+        try:
+            scheduler.submit("b", bad, options)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("priority %r accepted" % (bad,))
+    assert scheduler.queue.get() is first
+run_test_case(22, "Scheduler: client priorities are validated and clamped", case_22)
+
+# 23. Lazy import
+# Logic: in a fresh interpreter, reaching topng loads neither COM nor the
+# modules that only serve an option (cache, animation, Pillow helpers, ...).
+# ------------------------------------------------
+def case_23():
+    import subprocess
+    probe = ("import sys, pptx2png; pptx2png.topng; "
+             "print(' '.join(sorted(sys.modules)))")
+    loaded = subprocess.check_output([sys.executable, "-c", probe], universal_newlines=True).split()
+    for name in ("win32com", "pptx2png.cache", "pptx2png.animate", "pptx2png.contact",
+                 "pptx2png.imaging", "pptx2png.profile", "pptx2png.handout", "PIL",
+                 "concurrent.futures", "ctypes"):
+        assert name not in loaded, "%s imported with topng" % name
+run_test_case(23, "Lazy import: topng loads no optional modules", case_23)
+
+# 24. Worker pool shards
+# Logic: contiguous ranges that cover every slide once, sizes differing by at most one.
+# ------------------------------------------------
+def case_24():
+    from pptx2png.workers import even_shards
+    assert [tuple(r) for r in even_shards(10, 3)] == [(1, 4), (5, 7), (8, 10)]
+    assert [tuple(r) for r in even_shards(2, 8)] == [(1, 1), (2, 2)]
+    for total in range(1, 40):
+        for count in range(1, 9):
+            shards = even_shards(total, count)
+            covered = [i for start, end in shards for i in range(start, end + 1)]
+            assert covered == list(range(1, total + 1)), (total, count, shards)
+            sizes = [end - start + 1 for start, end in shards]
+            assert len(shards) == min(count, total) and max(sizes) - min(sizes) <= 1
+run_test_case(24, "WorkerPool even_shards", case_24)
+
+# 25. Slide selection strings
+# Logic: ranges are clamped to the deck, and exclusions alone start from every slide.
+# ------------------------------------------------
+def case_25():
+    from pptx2png.ooxml import read_deck
+    from pptx2png.selection import resolve_selection, format_ranges
+    deck = read_deck(TEST_PPTX)
+    assert resolve_selection("1-1000000000", deck) == [1, 2, 3, 4]
+    assert resolve_selection("!2", deck) == [1, 3, 4]
+    assert resolve_selection("!1-2,!4", deck) == [3]
+    assert resolve_selection("2-,!3", deck) == [2, 4]
+    assert resolve_selection("3,!3", deck) == []
+    assert resolve_selection([4, 1, 9], deck) == [1, 4]
+    assert format_ranges([1, 2, 3, 5]) == "1-3, 5"
+    for bad in ("section:Nope", "2-x", "-"):
+        try:
+            resolve_selection(bad, deck)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("%r accepted" % bad)
+run_test_case(25, "Selection: clamping and exclusions", case_25)
+
+# --- Package fixtures for the tests below (no PowerPoint needed) ---
+
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+
+def make_variant(name, parts):
+    """Copy of test.pptx with some parts replaced: {part: bytes, or a function of the old bytes}."""
+    import zipfile
+    path = os.path.join(TEST_ROOT_DIR, "fixtures", name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with zipfile.ZipFile(TEST_PPTX) as src, zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as out:
+        for part in src.namelist():
+            data = src.read(part)
+            change = parts.get(part)
+            if callable(change):
+                data = change(data)
+            elif change is not None:
+                data = change
+            out.writestr(part, data)
+        for part, data in parts.items():
+            if part not in src.NameToInfo:
+                out.writestr(part, data)
+    return path
+
+def add_rels(*rels):
+    """Edit for a .rels part that appends (id, type, target) relationships."""
+    extra = "".join('<Relationship Id="%s" Type="%s/%s" Target="%s"%s/>' % (
+        rid, REL_NS, kind, target, ' TargetMode="External"' if "://" in target else "")
+        for rid, kind, target in rels)
+    return lambda data: data.replace(b"</Relationships>", extra.encode("utf-8") + b"</Relationships>")
+
+def rels_part(*rels):
+    """A new .rels part holding (id, type, target) relationships."""
+    empty = (b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<Relationships '
+             b'xmlns="http://schemas.openxmlformats.org/package/2006/relationships"></Relationships>')
+    return add_rels(*rels)(empty)
+
+def tiny_png(width, height, shade):
+    """A grey PNG, built without Pillow."""
+    import zlib, struct
+    def chunk(kind, body):
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+    rows = b"".join(b"\x00" + bytes([shade]) * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+def dangling_refs(package, part):
+    """Relationship ids used in a part that its .rels does not define."""
+    import re
+    from pptx2png.ooxml import read_rels
+    ids = set(m.decode() for m in re.findall(rb'\br:(?:id|embed|link)="([^"]+)"', package.read(part)))
+    return ids - set(read_rels(package, part))
+
+# 26. Slide fingerprints
+# Logic: fingerprints do not depend on relationship ids or part names, but do on
+# which image each reference points at; reference cycles hash the same whatever
+# the walk starts from; date fields salt the fingerprint with the day, and
+# time-of-day fields leave the slide without one.
+# ------------------------------------------------
+def case_26():
+    from unittest import mock
+    from pptx2png.ooxml import slide_fingerprints
+    original = slide_fingerprints(TEST_PPTX)
+    assert len(set(original.values())) == 4, "all four slides differ"
+    rename = lambda data: data.replace(b'"rId2"', b'"R7f3a"')
+    renamed = make_variant("renamed_ids.pptx", {"ppt/slides/slide4.xml": rename,
+                                                 "ppt/slides/_rels/slide4.xml.rels": rename})
+    assert slide_fingerprints(renamed)[4] == original[4]
+
+    def two_pictures(name, first, second):
+        pics = b"".join(
+            b'<p:pic><p:nvPicPr><p:cNvPr id="%d" name="p"/><p:cNvPicPr/><p:nvPr/></p:nvPicPr>'
+            b'<p:blipFill><a:blip r:embed="%s"/></p:blipFill><p:spPr/></p:pic>' % (90 + n, rid)
+            for n, rid in enumerate((b"R1a", b"R2b")))
+        return make_variant(name, {
+            "ppt/media/image9.png": tiny_png(4, 4, 0),
+            "ppt/slides/slide1.xml": lambda data: data.replace(b"</p:spTree>", pics + b"</p:spTree>"),
+            "ppt/slides/_rels/slide1.xml.rels": add_rels(("R1a", "image", first),
+                                                         ("R2b", "image", second)),
+        })
+    straight = two_pictures("two_images.pptx", "../media/image1.png", "../media/image9.png")
+    swapped = two_pictures("swapped_images.pptx", "../media/image9.png", "../media/image1.png")
+    assert slide_fingerprints(straight)[1] != slide_fingerprints(swapped)[1]
+
+    def cycle(name, first, second):
+        # Two parts that reference each other; slide 1 enters at the first, slide 2 at the second
+        return make_variant(name, {
+            "ppt/extra/%s.xml" % first: b"<a/>",
+            "ppt/extra/%s.xml" % second: b"<b/>",
+            "ppt/extra/_rels/%s.xml.rels" % first: rels_part(("rId1", "custom", "%s.xml" % second)),
+            "ppt/extra/_rels/%s.xml.rels" % second: rels_part(("rId1", "custom", "%s.xml" % first)),
+            "ppt/slides/_rels/slide1.xml.rels": add_rels(("rId9", "custom", "../extra/%s.xml" % first)),
+            "ppt/slides/_rels/slide2.xml.rels": add_rels(("rId9", "custom", "../extra/%s.xml" % second)),
+        })
+    cyclic = slide_fingerprints(cycle("cycle.pptx", "one", "two"))
+    assert cyclic == slide_fingerprints(cycle("cycle_renamed.pptx", "x1", "x2"))
+    assert slide_fingerprints(os.path.join(TEST_ROOT_DIR, "fixtures", "cycle.pptx"), [2])[2] == cyclic[2]
+
+    def dated(name, field):
+        return make_variant(name, {"ppt/slides/slide1.xml": lambda data: data.replace(
+            b'<a:endParaRPr lang="zh-CN"',
+            b'<a:fld id="{B2C3D4E5-0000-4000-8000-000000000001}" type="%s"><a:t>1/1/2020</a:t>'
+            b'</a:fld><a:endParaRPr lang="zh-CN"' % field)})
+    date_deck = dated("date_field.pptx", b"datetime1")
+    with mock.patch("pptx2png.ooxml.time.strftime", return_value="2020-01-01"):
+        day_one = slide_fingerprints(date_deck)
+    with mock.patch("pptx2png.ooxml.time.strftime", return_value="2020-01-02"):
+        day_two = slide_fingerprints(date_deck)
+    assert day_one[1] != day_two[1] and day_one[2] == day_two[2]
+    assert slide_fingerprints(dated("time_field.pptx", b"datetime10"))[1] is None
+run_test_case(26, "Fingerprints: relationship ids, cycles and date fields", case_26)
+
+# 27. Render cache
+# Logic: keys separate sizes, options and days of date fields; slides without a
+# fingerprint are not cached; eviction drops expired entries, then the least
+# recently used ones until the cache fits its cap.
+# ------------------------------------------------
+def case_27():
+    from unittest import mock
+    from pptx2png.cache import RenderCache, render_key
+    from pptx2png.ooxml import slide_fingerprints
+    key = render_key("abc", 1920, 1080)
+    assert key == render_key("abc", 1920, 1080, options={"downsample": False})
+    assert key != render_key("abc", 1280, 720)
+    assert key != render_key("abc", 1920, 1080, options={"font_substitutions": {"A": "B"}})
+    assert render_key("abc", 1920, 1080, options={"font_substitutions": {"A": "B"}}) != \
+        render_key("abc", 1920, 1080, options={"font_substitutions": {"A": "C"}})
+    try:
+        render_key(None, 1920, 1080)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("slide without a fingerprint cached")
+    dated = make_variant("cache_date_field.pptx", {"ppt/slides/slide1.xml": lambda data: data.replace(
+        b'<a:endParaRPr lang="zh-CN"', b'<a:fld id="{B2C3D4E5-0000-4000-8000-000000000002}" '
+        b'type="datetime2"><a:t>Monday</a:t></a:fld><a:endParaRPr lang="zh-CN"')})
+    keys = []
+    for day in ("2020-01-01", "2020-01-02"):
+        with mock.patch("pptx2png.ooxml.time.strftime", return_value=day):
+            keys.append(render_key(slide_fingerprints(dated, [1])[1], 1920, 1080))
+    assert keys[0] != keys[1]
+
+    root = os.path.join(TEST_ROOT_DIR, "cache")
+    source = os.path.join(TEST_ROOT_DIR, "fixtures", "entry.png")
+    with open(source, "wb") as f:
+        f.write(b"\x00" * 100)
+    cache = RenderCache(root, max_bytes=350)
+    now = time.time()
+    for n, age in ((1, 30), (2, 20), (3, 10)):
+        cache.put("%064d" % n, source)
+        os.utime(cache._path("%064d" % n), (now - age, now - age))
+    out = os.path.join(TEST_ROOT_DIR, "fixtures", "hit.png")
+    assert cache.get("%064d" % 1, out) and cache.hits == 1
+    assert not cache.get("%064d" % 9, out) and cache.misses == 1
+    cache.put("%064d" % 4, source)
+    present = [n for n in (1, 2, 3, 4) if os.path.exists(cache._path("%064d" % n))]
+    assert present == [1, 3, 4], present
+
+    expiring = RenderCache(root, max_bytes=None, ttl=5)
+    assert not expiring.get("%064d" % 3, out), "entry older than ttl served"
+    assert expiring.evict() == 1 and not os.path.exists(cache._path("%064d" % 3))
+run_test_case(27, "Render cache keys + LRU/TTL eviction", case_27)
+
+# 28. Pixel comparison for skip_unchanged
+# Logic: the same pixels match whatever the encoding; a small change matches only
+# within a threshold; a different size never matches.
+# ------------------------------------------------
+def case_28():
+    from PIL import Image
+    from pptx2png.imaging import images_match
+    folder = os.path.join(TEST_ROOT_DIR, "fixtures", "match")
+    os.makedirs(folder, exist_ok=True)
+    def save(name, image, **kwargs):
+        path = os.path.join(folder, name)
+        image.save(path, "PNG", **kwargs)
+        return path
+    base = Image.new("RGB", (320, 180), (200, 210, 220))
+    old = save("old.png", base)
+    assert images_match(save("same.png", base), old)
+    assert images_match(save("reencoded.png", base, compress_level=0), old)
+    dot = base.copy()
+    dot.putpixel((10, 10), (0, 0, 0))
+    changed = save("dot.png", dot)
+    assert not images_match(changed, old)
+    assert images_match(changed, old, 0.002)
+    half = base.copy()
+    half.paste((0, 0, 0), (0, 0, 160, 180))
+    assert not images_match(save("half.png", half), old, 0.002)
+    assert not images_match(save("small.png", base.resize((160, 90))), old, 0.5)
+run_test_case(28, "images_match: encoding, threshold and size", case_28)
+
+# 29. Perceptual-hash index
+# Logic: the band query finds every hash within 7 bits (one flip per band still
+# leaves a band intact), larger distances scan; 64-bit hashes survive SQLite's
+# signed integers; a rescaled copy of an image finds the original.
+# ------------------------------------------------
+def case_29():
+    from PIL import Image
+    from pptx2png.index import SlideIndex
+    index = SlideIndex(os.path.join(TEST_ROOT_DIR, "fixtures", "index.sqlite"))
+    target = 0xF123456789ABCDEF
+    def flip(value, bands):
+        # One bit flipped in each of the given 8-bit bands
+        for band in bands:
+            value ^= 1 << (band * 8 + 3)
+        return value
+    index.add("d0.png", target, "deck.pptx", 1)
+    index.add("d3.png", flip(target, range(3)), "deck.pptx", 2)
+    index.add("d7.png", flip(target, range(7)), "deck.pptx", 3)
+    index.add("d8.png", flip(target, range(8)), "other.pptx", 1)
+    index.add("far.png", target ^ ((1 << 64) - 1), "other.pptx", 2)
+    near = index.find_similar(target, max_distance=7)
+    assert [(os.path.basename(m["file"]), m["distance"]) for m in near] == \
+        [("d0.png", 0), ("d3.png", 3), ("d7.png", 7)], near
+    assert near[0]["hash"] == target and near[0]["slide"] == 1
+    scanned = index.find_similar(target, max_distance=8)
+    assert [m["distance"] for m in scanned] == [0, 3, 7, 8]
+    assert len(index.find_similar(target, max_distance=8, limit=2)) == 2
+    index.remove_deck("other.pptx")
+    assert index.count() == 3
+
+    # Blocks of distinct grey levels, like shapes on a slide
+    blocks = Image.new("L", (9, 8))
+    blocks.putdata([(n * 97) % 251 for n in range(72)])
+    slide = blocks.resize((360, 320), Image.NEAREST).convert("RGB")
+    original = os.path.join(TEST_ROOT_DIR, "fixtures", "blocks.png")
+    slide.save(original)
+    index.add_image(original, "deck.pptx", 4)
+    matches = index.find_similar(slide.resize((180, 160), Image.BILINEAR), max_distance=6)
+    assert any(m["slide"] == 4 for m in matches), matches
+    index.close()
+run_test_case(29, "Perceptual-hash index: band query and scan", case_29)
+
+# 30. Streamed PNG writer of the contact sheet
+# Logic: rows written in bands of any size decode back to the same pixels,
+# across several IDAT chunks; a wrong row count is an error.
+# ------------------------------------------------
+def case_30():
+    import random
+    from PIL import Image
+    from pptx2png.contact import PngStreamWriter
+    width, height = 300, 500
+    rng = random.Random(38)
+    pixels = bytes(rng.randrange(256) for _ in range(width * height * 3))
+    path = os.path.join(TEST_ROOT_DIR, "fixtures", "stream.png")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    writer = PngStreamWriter(path, width, height)
+    row = 0
+    for band in (1, 7, 120, 250, 122):
+        writer.write_rows(pixels[row * width * 3:(row + band) * width * 3])
+        row += band
+    try:
+        writer.write_rows(pixels[:width * 3])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("row beyond the image height accepted")
+    writer.close()
+    with open(path, "rb") as f:
+        assert f.read().count(b"IDAT") > 1, "expected several IDAT chunks"
+    with Image.open(path) as image:
+        assert image.size == (width, height) and image.mode == "RGB"
+        assert image.tobytes() == pixels
+    short = PngStreamWriter(path + ".short.png", width, 2)
+    short.write_rows(pixels[:width * 3])
+    try:
+        short.close()
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("missing rows accepted")
+run_test_case(30, "PngStreamWriter round trip", case_30)
+
+# 31. APNG output
+# Logic: frames are copied without decoding: one IDAT frame, fdAT frames after
+# it, and the frame count is patched into acTL on close.
+# ------------------------------------------------
+def case_31():
+    import struct
+    from pptx2png.animate import ApngEncoder, _png_chunks
+    path = os.path.join(TEST_ROOT_DIR, "fixtures", "frames.png")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    encoder = ApngEncoder(path, loop=0)
+    for shade in (0, 128, 255):
+        encoder.add(tiny_png(8, 6, shade), 1500)
+    encoder.close()
+    with open(path, "rb") as f:
+        chunks = list(_png_chunks(f.read()))
+    kinds = [kind for kind, _ in chunks]
+    assert struct.unpack(">II", dict(chunks)[b"acTL"]) == (3, 0)
+    assert kinds[0] == b"IHDR" and kinds[-1] == b"IEND"
+    assert kinds.count(b"fcTL") == 3 and kinds.count(b"IDAT") == 1 and kinds.count(b"fdAT") == 2
+    assert kinds.index(b"fcTL") < kinds.index(b"IDAT")
+    # Sequence numbers of fcTL and fdAT run 0, 1, 2, ... across both chunk types
+    sequence = [struct.unpack(">I", body[:4])[0] for kind, body in chunks if kind in (b"fcTL", b"fdAT")]
+    assert sequence == list(range(5)), sequence
+    mismatch = ApngEncoder(path + ".bad.png")
+    mismatch.add(tiny_png(8, 6, 0), 100)
+    try:
+        mismatch.add(tiny_png(4, 4, 0), 100)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("frame of another size accepted")
+    finally:
+        mismatch.abort()
+run_test_case(31, "APNG chunk output", case_31)
+
+# 32. PDF of the slide images
+# Logic: one page per image, sized by the resolution; PNG data is copied with
+# its PNG predictor, other images are decoded to RGB.
+# ------------------------------------------------
+def case_32():
+    from PIL import Image, PdfParser
+    from pptx2png.imaging import images_to_pdf
+    folder = os.path.join(TEST_ROOT_DIR, "fixtures", "pdf")
+    os.makedirs(folder, exist_ok=True)
+    pages = []
+    for n, image in enumerate([Image.new("RGB", (320, 180), (200, 30, 30)),
+                               Image.new("L", (180, 320), 90),
+                               Image.new("RGBA", (64, 36), (0, 255, 0, 128))]):
+        pages.append(os.path.join(folder, "page_%d.png" % n))
+        image.save(pages[-1])
+    path = os.path.join(folder, "slides.pdf")
+    images_to_pdf(pages, path, resolution=96.0)
+    pdf = PdfParser.PdfParser(path)
+    try:
+        assert len(pdf.pages) == 3
+        expected = [((240.0, 135.0), b"DeviceRGB", 15), ((135.0, 240.0), b"DeviceGray", 15),
+                    ((48.0, 27.0), b"DeviceRGB", None)]
+        for ref, (size, space, predictor) in zip(pdf.pages, expected):
+            page = pdf.read_indirect(ref)
+            assert tuple(page[b"MediaBox"][2:]) == size, page[b"MediaBox"]
+            image = pdf.read_indirect(page[b"Resources"][b"XObject"][b"Im0"])
+            assert image.dictionary[b"ColorSpace"] == space
+            params = image.dictionary.get(b"DecodeParms")
+            assert (params and params[b"Predictor"]) == predictor
+        decoded = pdf.read_indirect(pdf.read_indirect(pdf.pages[2])[b"Resources"][b"XObject"][b"Im0"])
+        assert decoded.decode() == Image.open(pages[2]).convert("RGB").tobytes()
+    finally:
+        pdf.close()
+    try:
+        images_to_pdf([], path)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("empty PDF written")
+run_test_case(32, "images_to_pdf pages", case_32)
+
+# 33. Instrumentation exporters
+# Logic: spans nest per thread and share a trace id; Prometheus text has
+# cumulative buckets, _sum/_count and escaped counter labels; the OTLP payload
+# follows the ExportTraceServiceRequest JSON shape.
+# ------------------------------------------------
+def case_33():
+    from pptx2png import instrument
+
+    class Recorder(object):
+        def __init__(self):
+            self.spans = []
+        def on_span(self, span):
+            self.spans.append(span)
+        def on_count(self, name, value, labels):
+            pass
+
+    recorder = Recorder()
+    prometheus = instrument.PrometheusExporter()
+    tracer = instrument.Tracer([recorder, prometheus])
+    with tracer.span("topng", deck="a.pptx"):
+        with tracer.span("export", slide=3):
+            pass
+        try:
+            with tracer.span("pdf"):
+                raise OSError("disk full")
+        except OSError:
+            pass
+    tracer.count("slides", status="saved")
+    tracer.count("slides", 2, status="saved")
+    tracer.count("failures", reason='say "hi"')
+    export, pdf, root = recorder.spans
+    assert export.parent_id == root.span_id and export.trace_id == root.trace_id
+    assert root.parent_id is None and len(root.trace_id) == 32 and len(root.span_id) == 16
+    assert pdf.error == "OSError: disk full"
+
+    class Timed(object):
+        name = "open"
+        duration = 0.3
+    prometheus.on_span(Timed())
+    lines = prometheus.render().splitlines()
+    assert "# TYPE pptx2png_span_duration_seconds histogram" in lines
+    assert 'pptx2png_span_duration_seconds_bucket{span="open",le="0.25"} 0' in lines
+    assert 'pptx2png_span_duration_seconds_bucket{span="open",le="0.5"} 1' in lines
+    assert 'pptx2png_span_duration_seconds_bucket{span="open",le="+Inf"} 1' in lines
+    assert 'pptx2png_span_duration_seconds_sum{span="open"} 0.300000' in lines
+    assert 'pptx2png_span_duration_seconds_count{span="export"} 1' in lines
+    assert 'pptx2png_slides_total{status="saved"} 3' in lines
+    assert 'pptx2png_failures_total{reason="say \\"hi\\""} 1' in lines
+    assert lines.count("# TYPE pptx2png_slides_total counter") == 1
+
+    otlp = instrument.OtlpExporter("http://127.0.0.1:9/v1/traces", service_name="test")
+    try:
+        payload = otlp.payload(recorder.spans)
+    finally:
+        otlp.shutdown()
+    resource = payload["resourceSpans"][0]
+    assert resource["resource"]["attributes"] == [{"key": "service.name",
+                                                   "value": {"stringValue": "test"}}]
+    spans = resource["scopeSpans"][0]["spans"]
+    assert [s["name"] for s in spans] == ["export", "pdf", "topng"]
+    assert spans[0]["parentSpanId"] == root.span_id and "parentSpanId" not in spans[2]
+    assert spans[0]["attributes"] == [{"key": "slide", "value": {"intValue": "3"}}]
+    assert spans[1]["status"] == {"code": 2, "message": "OSError: disk full"}
+    assert spans[2]["status"] == {"code": 1}
+    assert int(spans[2]["endTimeUnixNano"]) >= int(spans[2]["startTimeUnixNano"])
+run_test_case(33, "Instrumentation: spans, Prometheus text, OTLP payload", case_33)
+
+# 34. Profile report
+# Logic: span times add up per phase and per slide, the unaccounted rest is
+# "other", slides are ranked by export time next to their complexity.
+# ------------------------------------------------
+def case_34():
+    import json
+    from pptx2png.pptx2png import ExportResult
+    from pptx2png.profile import ProfileCollector, build_report, json_ready, format_report
+    out = get_case_dir("case_34_profile")
+    os.makedirs(out, exist_ok=True)
+    with open(os.path.join(out, "Slide_3.png"), "wb") as f:
+        f.write(b"\x00" * 4096)
+    collector = ProfileCollector()
+    collector.spans = [("open", 1.0, None, None),
+                       ("export", 0.5, 1, None), ("write", 0.1, 1, None),
+                       ("export", 2.0, 3, None), ("postprocess", 0.2, 3, None),
+                       ("export", 0.3, 4, "timeout"),
+                       ("topng", 5.0, None, None)]
+    result = ExportResult(out)
+    result.saved = [1, 3]
+    result.failed = {4: "timeout"}
+    report = build_report(collector, TEST_PPTX, result)
+    phases = report["phases"]
+    assert abs(phases["export"]["total"] - 2.8) < 1e-9 and phases["export"]["count"] == 3
+    assert phases["export"]["max"] == 2.0
+    assert abs(phases["other"]["total"] - 0.9) < 1e-9
+    slides = report["slides"]
+    assert report["slowest"] == [3, 1, 4]
+    assert abs(slides[3]["total"] - 2.2) < 1e-9 and slides[3]["output_bytes"] == 4096
+    assert slides[1]["output_bytes"] is None
+    assert slides[4]["status"] == "failed" and slides[4]["error"] == "timeout"
+    assert slides[3]["complexity"]["pictures"] == 1 and slides[1]["complexity"]["text_chars"] > 0
+    assert report["deck"]["slides"] == 4 and report["deck"]["wall_time"] == 5.0
+    assert sorted(json.loads(json.dumps(json_ready(report)))["slides"]) == ["1", "3", "4"]
+    text = format_report(report)
+    assert "Slowest slides:" in text and text.index("\n      3 ") < text.index("\n      1 ")
+run_test_case(34, "Profile report from spans", case_34)
+
+# 35. Slide complexity, cost model and shard balancing
+# Logic: complexity counts what the slides hold; fitting samples made from known
+# weights recovers them; the heaviest slides are spread over the shards first.
+# ------------------------------------------------
+def case_35():
+    import random
+    from pptx2png.ooxml import slide_complexity
+    from pptx2png.cost import CostModel, FEATURES, DEFAULT_WEIGHTS, MIN_SAMPLES, balanced_shards
+    info = slide_complexity(TEST_PPTX)
+    assert info["deck"]["slides"] == 4
+    slides = info["slides"]
+    assert slides[1]["pictures"] == 0 and slides[3]["pictures"] == 1 and slides[4]["pictures"] == 1
+    assert slides[4]["image_bytes"] > 0 and slides[1]["text_chars"] > 0
+
+    true = dict(DEFAULT_WEIGHTS)
+    true["base"] = 0.5
+    true["pictures"] = 0.8
+    model = CostModel(path=None)
+    rng = random.Random(7)
+    for _ in range(400):
+        stats = dict((key, rng.randint(0, 20) * unit) for key, unit in FEATURES)
+        seconds = true["base"] + sum(true[key] * stats[key] / unit for key, unit in FEATURES)
+        model.observe(stats, seconds)
+    assert model.fit()
+    assert abs(model.weights["pictures"] - 0.8) < 0.05, model.weights
+    assert abs(model.weights["base"] - 0.5) < 0.1, model.weights
+    assert not CostModel(path=None).fit(), "fit needs at least %d samples" % MIN_SAMPLES
+    estimates = model.estimate_deck(TEST_PPTX)
+    assert sorted(estimates) == [1, 2, 3, 4] and estimates[3] > estimates[2]
+
+    shards = balanced_shards({1: 10.0, 2: 1.0, 3: 1.0, 4: 9.0, 5: 1.0}, 2)
+    assert len(shards) == 2 and sorted(sum(shards, [])) == [1, 2, 3, 4, 5]
+    # The two heavy slides land on different shards
+    assert (1 in shards[0]) != (4 in shards[0]), shards
+    assert len(balanced_shards({1: 1.0}, 4)) == 1
+run_test_case(35, "Complexity + cost model fit + balanced shards", case_35)
+
+# 36. Pre-flight image limits and downsampling
+# Logic: each picture's pixel limit is its displayed size at the render size
+# (enlarged by a crop), tiled fills and images used outside rendered parts are
+# left alone, and _downsample only re-encodes images that shrink enough.
+# ------------------------------------------------
+def case_36():
+    import io, zipfile
+    from PIL import Image
+    from pptx2png.preflight import image_limits, _downsample, HEADROOM
+    slide_size = (12192000, 6858000)
+    with zipfile.ZipFile(TEST_PPTX) as package:
+        limits = image_limits(package, slide_size, 1920, 1080)
+        data = package.read("ppt/media/image1.png")
+    width, height = limits["ppt/media/image1.png"]
+    assert abs(width - 5082988 * 1920.0 / 12192000) < 0.01, limits
+    assert abs(height - 5082988 * 1080.0 / 6858000) < 0.01, limits
+
+    # Cropping away the left half shows the image at twice its width
+    crop = lambda data: data.replace(b"<a:stretch>", b'<a:srcRect l="50000"/><a:stretch>')
+    cropped = make_variant("cropped.pptx", {"ppt/slides/slide4.xml": crop})
+    with zipfile.ZipFile(cropped) as package:
+        assert abs(image_limits(package, slide_size, 1920, 1080)["ppt/media/image1.png"][0]
+                   - 2 * width) < 0.01
+    tile = lambda data: data.replace(b"<a:stretch><a:fillRect/></a:stretch>", b"<a:tile/>")
+    tiled = make_variant("tiled.pptx", {"ppt/slides/slide3.xml": tile})
+    with zipfile.ZipFile(tiled) as package:
+        assert "ppt/media/image1.png" not in image_limits(package, slide_size, 1920, 1080)
+
+    with Image.open(io.BytesIO(data)) as img:
+        original_size = img.size
+    small = _downsample(data, (width, height))
+    assert small is not None and len(small) < len(data)
+    with Image.open(io.BytesIO(small)) as img:
+        assert img.format == "PNG"
+        assert abs(img.size[0] - round(width * HEADROOM)) <= 1, (img.size, original_size)
+    # Already small enough: kept as it is
+    assert _downsample(small, (width, height)) is None
+    assert _downsample(data, original_size) is None
+run_test_case(36, "Pre-flight image limits + downsampling", case_36)
+
+# 37. Package rewriting: removing slides
+# Logic: the other slides keep their content, nothing points at the removed
+# slide, and the copy is the same when zipfile lacks the internals that the
+# raw member copy writes through.
+# ------------------------------------------------
+def case_37():
+    import zipfile
+    from unittest import mock
+    from pptx2png.ooxml import PRESENTATION_PART, read_deck, slide_fingerprints
+    from pptx2png.rewrite import PackageEdit, remove_slides
+    before = slide_fingerprints(TEST_PPTX)
+    with zipfile.ZipFile(TEST_PPTX) as package:
+        image_compression = package.getinfo("ppt/media/image1.png").compress_type
+    os.makedirs(os.path.join(TEST_ROOT_DIR, "fixtures"), exist_ok=True)
+    for raw in (True, False):
+        out = os.path.join(TEST_ROOT_DIR, "fixtures", "removed_%s.pptx" % raw)
+        with mock.patch("pptx2png.rewrite._can_copy_raw", return_value=raw):
+            stats = remove_slides(PackageEdit(TEST_PPTX), [2]).apply(out)
+        assert stats["copied"] > 0 and stats["dropped"] > 0, stats
+        assert len(read_deck(out).slides) == 3
+        after = slide_fingerprints(out)
+        assert (after[1], after[2], after[3]) == (before[1], before[3], before[4])
+        with zipfile.ZipFile(out) as package:
+            assert package.testzip() is None
+            assert not dangling_refs(package, PRESENTATION_PART)
+            assert b"slide2.xml" not in package.read("[Content_Types].xml")
+            assert "ppt/slides/slide2.xml" not in package.NameToInfo
+            assert package.getinfo("ppt/media/image1.png").compress_type == image_compression
+run_test_case(37, "rewrite.remove_slides (raw and fallback copy)", case_37)
+
+# 38. Package rewriting: stripping media and flattening OLE objects
+# Logic: a video becomes its poster picture and an OLE object wrapped in
+# mc:AlternateContent becomes its preview picture; the payloads and their
+# relationships go, and the rewritten slide is still well-formed XML with
+# only the namespace declarations the picture needs.
+# ------------------------------------------------
+def case_38():
+    import zipfile
+    import xml.etree.ElementTree as ET
+    from pptx2png.rewrite import PackageEdit, strip_media, flatten_ole
+    deck = make_variant("video.pptx", {
+        "ppt/media/media1.mp4": b"\x00" * 50000,
+        "ppt/slides/slide4.xml": lambda data: data.replace(
+            b"<p:nvPr/></p:nvPicPr>", b'<p:nvPr><a:videoFile r:link="rId9"/></p:nvPr></p:nvPicPr>'),
+        "ppt/slides/_rels/slide4.xml.rels": add_rels(("rId9", "video", "../media/media1.mp4")),
+    })
+    out = os.path.join(TEST_ROOT_DIR, "fixtures", "video_stripped.pptx")
+    edit = strip_media(PackageEdit(deck))
+    edit.apply(out)
+    assert edit.stats["media_removed"] == 1 and edit.stats["bytes_removed"] == 50000, edit.stats
+    with zipfile.ZipFile(out) as package:
+        assert "ppt/media/media1.mp4" not in package.NameToInfo
+        xml = package.read("ppt/slides/slide4.xml")
+        assert b"videoFile" not in xml and b"<p:pic>" in xml
+        assert not dangling_refs(package, "ppt/slides/slide4.xml")
+
+    def frame(preview):
+        pic = (b'<p:pic><p:nvPicPr><p:cNvPr id="0" name=""/><p:cNvPicPr/><p:nvPr/></p:nvPicPr>'
+               b'<p:blipFill><a:blip r:embed="rId81"><a:extLst><a:ext uri="{28A0092B}">'
+               b'<a14:useLocalDpi val="0"/></a:ext></a:extLst></a:blip>'
+               b'<a:stretch><a:fillRect/></a:stretch></p:blipFill><p:spPr/></p:pic>') if preview else b""
+        return (b'<p:graphicFrame><p:nvGraphicFramePr><p:cNvPr id="77" name="Object 1"/>'
+                b'<p:cNvGraphicFramePr/><p:nvPr/></p:nvGraphicFramePr><p:xfrm><a:off x="100" y="100"/>'
+                b'<a:ext cx="3000000" cy="2000000"/></p:xfrm><a:graphic><a:graphicData '
+                b'uri="http://schemas.openxmlformats.org/presentationml/2006/ole"><p:oleObj '
+                b'name="Worksheet" r:id="rId80" progId="Excel.Sheet.12"><p:embed/>' + pic +
+                b'</p:oleObj></a:graphicData></a:graphic></p:graphicFrame>')
+    # The slide root already declares a, r and p; a14 is bound differently in Choice and Fallback
+    wrapped = (b'<mc:AlternateContent xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006"'
+               b' xmlns:r="' + REL_NS.encode() + b'">'
+               b'<mc:Choice xmlns:v="urn:schemas-microsoft-com:vml" xmlns:a14="urn:example:other"'
+               b' Requires="v">' + frame(False) + b'</mc:Choice>'
+               b'<mc:Fallback xmlns:a14="http://schemas.microsoft.com/office/drawing/2010/main">' + frame(True) +
+               b'</mc:Fallback></mc:AlternateContent>')
+    deck = make_variant("ole.pptx", {
+        "ppt/embeddings/oleObject1.bin": b"\x00" * 30000,
+        "ppt/slides/slide2.xml": lambda data: data.replace(b"</p:spTree>", wrapped + b"</p:spTree>"),
+        "ppt/slides/_rels/slide2.xml.rels": add_rels(
+            ("rId80", "oleObject", "../embeddings/oleObject1.bin"),
+            ("rId81", "image", "../media/image1.png")),
+    })
+    out = os.path.join(TEST_ROOT_DIR, "fixtures", "ole_flat.pptx")
+    edit = flatten_ole(PackageEdit(deck))
+    edit.apply(out)
+    assert edit.stats["ole_removed"] == 1, edit.stats
+    with zipfile.ZipFile(out) as package:
+        xml = package.read("ppt/slides/slide2.xml")
+        assert b"oleObj" not in xml and b"AlternateContent" not in xml
+        assert xml.count(b'r:embed="rId81"') == 1
+        assert "ppt/embeddings/oleObject1.bin" not in package.NameToInfo
+        assert not dangling_refs(package, "ppt/slides/slide2.xml")
+    root = ET.fromstring(xml)
+    pics = root.findall(".//{http://schemas.openxmlformats.org/presentationml/2006/main}pic")
+    assert len(pics) == 1
+    start = xml[xml.index(b"<p:pic"):xml.index(b"><p:nvPicPr>")]
+    assert start == b'<p:pic xmlns:a14="http://schemas.microsoft.com/office/drawing/2010/main"', start
+run_test_case(38, "rewrite.strip_media + flatten_ole (mc:AlternateContent)", case_38)
+
+# 39. Fonts: name table parser, deck fonts, substitution maps
+# Logic: a substitution applies only when its replacement is installed or
+# embedded; otherwise the font keeps its own status, here missing.
+# ------------------------------------------------
+def case_39():
+    import json, struct
+    from pptx2png.fonts import font_families, deck_fonts, load_substitutions, resolve_fonts, FontIndex
+    names = [(3, 1, 0x409, 1, "Test Sans".encode("utf-16-be")),
+             (1, 0, 0, 16, b"Test Family"),
+             (3, 1, 0x409, 4, "Test Sans Bold".encode("utf-16-be"))]
+    storage = b"".join(raw for *_, raw in names)
+    records, offset = b"", 0
+    for platform, encoding, language, name_id, raw in names:
+        records += struct.pack(">6H", platform, encoding, language, name_id, len(raw), offset)
+        offset += len(raw)
+    table = struct.pack(">HHH", 0, len(names), 6 + len(records)) + records + storage
+    font = struct.pack(">IHHHH", 0x00010000, 1, 16, 0, 0) + \
+        struct.pack(">4sIII", b"name", 0, 12 + 16, len(table)) + table
+    folder = os.path.join(TEST_ROOT_DIR, "fixtures", "fonts")
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, "test.ttf")
+    with open(path, "wb") as f:
+        f.write(font)
+    assert font_families(path) == {"Test Sans", "Test Family"}, font_families(path)
+
+    index = FontIndex(path=None, dirs=[folder]).refresh()
+    assert index.has("test sans") and not index.has("Arial Nope")
+    used = deck_fonts(TEST_PPTX)["used"]
+    assert used, "test.pptx names fonts"
+    face = used[0]
+    assert resolve_fonts(TEST_PPTX, {face: "Test Sans"}, index=index)[face] == ("substituted", "Test Sans")
+    status, _ = resolve_fonts(TEST_PPTX, {face: "Absent Font"}, index=index)[face]
+    assert status == resolve_fonts(TEST_PPTX, {}, index=index)[face][0]
+    assert status == ("embedded" if face in deck_fonts(TEST_PPTX)["embedded"] else "missing"), status
+    bad = os.path.join(folder, "bad.json")
+    with open(bad, "w") as f:
+        json.dump(["not", "a", "map"], f)
+    try:
+        load_substitutions(bad)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("list accepted as a substitution map")
+run_test_case(39, "Font name table + substitutions", case_39)
+
+# 40. Handout pages
+# Logic: slides fill 6-slide pages row by row and 3-slide pages down the left
+# column with note lines beside them; the last page is left partly empty.
+# ------------------------------------------------
+def case_40():
+    from PIL import Image
+    from pptx2png.handout import make_handouts, _cells, PAGE_SIZE, PAPER, RULE, GAP, MARGIN
+    folder = get_case_dir("handouts")
+    os.makedirs(folder, exist_ok=True)
+    colors = [(40 * n, 200 - 20 * n, 100) for n in range(7)]
+    images = []
+    for n, color in enumerate(colors, 1):
+        path = os.path.join(folder, "Slide_%d.png" % n)
+        Image.new("RGB", (320, 180), color).save(path)
+        images.append(path)
+
+    def center(page, cell):
+        x, y, w, h = cell
+        return page.getpixel((x + w // 2, y + h // 2))
+
+    six = os.path.join(folder, "six")
+    os.makedirs(six)
+    pages = make_handouts(images, six, per_page=6)
+    assert [os.path.basename(p) for p in pages] == ["Handout_1.png", "Handout_2.png"]
+    assert sorted(os.listdir(six)) == ["Handout_1.png", "Handout_2.png"], "no partial pages left"
+    cells = _cells(6, PAGE_SIZE)
+    # Row by row: slide 2 is top right, slide 3 below slide 1
+    assert cells[1][1] == cells[0][1] and cells[2][0] == cells[0][0] and cells[2][1] > cells[0][1]
+    with Image.open(pages[0]) as page:
+        assert page.size == PAGE_SIZE
+        assert [center(page, cell) for cell in cells] == colors[:6]
+    with Image.open(pages[1]) as page:
+        assert center(page, cells[0]) == colors[6] and center(page, cells[1]) == PAPER
+
+    three = os.path.join(folder, "three")
+    os.makedirs(three)
+    pages = make_handouts(images, three, per_page=3)
+    assert len(pages) == 3
+    cells = _cells(3, PAGE_SIZE)
+    assert len(set(x for x, _, _, _ in cells)) == 1, "one column"
+    with Image.open(pages[0]) as page:
+        assert [center(page, cell) for cell in cells] == colors[:3]
+        x, y, w, h = cells[0]
+        # Note lines to the right of each slide
+        assert page.getpixel((x + w + GAP + 10, y + h // 7)) == RULE
+        assert page.getpixel((PAGE_SIZE[0] - MARGIN - 1, y + h // 7)) == RULE
+    try:
+        make_handouts(images, three, per_page=4)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("4 slides per page accepted")
+run_test_case(40, "Handout pages: page count and layout", case_40)
+
+# 41. Text side channel
+# Logic: the title, the other text, alt text and speaker notes of each slide
+# are read from the package; notes placeholders that repeat the slide image
+# or page furniture are left out, and the JSON files are written per slide.
+# ------------------------------------------------
+def case_41():
+    import json
+    from pptx2png.text import slide_text, write_slide_text
+    texts = slide_text(TEST_PPTX)
+    assert sorted(texts) == [1, 2, 3, 4]
+    assert texts[1]["text"] == ["TEST PAGE 1:", "pptx2img"], texts[1]
+    assert "PPTX" in texts[3]["text"] and texts[4]["text"] == []
+    assert sorted(slide_text(TEST_PPTX, [4, 9])) == [4]
+
+    def shape(kind, text):
+        return ('<p:sp><p:nvSpPr><p:cNvPr id="%d" name=""/><p:cNvSpPr/><p:nvPr><p:ph type="%s"/>'
+                '</p:nvPr></p:nvSpPr><p:spPr/><p:txBody><a:bodyPr/><a:p><a:r><a:t>%s</a:t></a:r>'
+                '</a:p></p:txBody></p:sp>' % (len(kind), kind, text))
+    notes = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<p:notes '
+             'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+             'xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main"><p:cSld><p:spTree>'
+             '<p:nvGrpSpPr><p:cNvPr id="1" name=""/><p:cNvGrpSpPr/><p:nvPr/></p:nvGrpSpPr><p:grpSpPr/>'
+             + shape("sldImg", "") + shape("body", "Say hello") + shape("sldNum", "4") +
+             '</p:spTree></p:cSld></p:notes>').encode("utf-8")
+    deck = make_variant("notes.pptx", {
+        "ppt/notesSlides/notesSlide1.xml": notes,
+        "ppt/slides/_rels/slide4.xml.rels": add_rels(("rId7", "notesSlide", "../notesSlides/notesSlide1.xml")),
+        "ppt/slides/slide4.xml": lambda data: data.replace(b'name="\xe5\x9b\xbe\xe7\x89\x87 4"',
+                                                           b'name="Logo" descr="The logo"'),
+    })
+    texts = slide_text(deck, [4])
+    assert texts[4]["notes"] == "Say hello" and texts[4]["alt_text"] == ["The logo"], texts[4]
+
+    out = get_case_dir("case_41_text")
+    os.makedirs(out, exist_ok=True)
+    write_slide_text(TEST_PPTX, [2], out)
+    assert os.listdir(out) == ["Slide_2.text.json"]
+    with open(os.path.join(out, "Slide_2.text.json"), encoding="utf-8") as f:
+        data = json.load(f)
+    assert data["slide"] == 2 and data["text"][0] == "TEST PAGE 2:" and data["notes"] == ""
+run_test_case(41, "Text extraction (title, text, notes, alt text)", case_41)
+
+# 42. Shape map
+# Logic: boxes are in pixels of the requested output size, group transforms
+# included; hyperlinks resolve to URLs and slide numbers; shapes and groups
+# whose frame cannot be read are left out instead of failing the slide.
+# ------------------------------------------------
+def case_42():
+    from pptx2png.shapes import slide_shapes
+    maps = slide_shapes(TEST_PPTX, [1, 4], 1920, 1080)
+    box = maps[1]["shapes"][0]["box"]
+    # The text box of slide 1 sits at x=2416629, y=3004457 EMU on a 12192000 x 6858000 slide
+    assert box[:2] == [381, 473], box
+    assert maps[4]["shapes"][0]["kind"] == "picture" and maps[1]["links"] == []
+    half = slide_shapes(TEST_PPTX, [1], 960, 540)[1]["shapes"][0]["box"]
+    assert abs(half[0] * 2 - box[0]) <= 1 and abs(half[2] * 2 - box[2]) <= 1
+
+    linked = make_variant("links.pptx", {
+        "ppt/slides/slide1.xml": lambda data: data.replace(
+            b'<a:extLst><a:ext uri="{FF2B5EF4', b'<a:hlinkClick r:id="rId8"/><a:extLst><a:ext uri="{FF2B5EF4', 1
+        ).replace(
+            b'<a:rPr lang="en-US" altLang="zh-CN" dirty="0"/><a:t>pptx2img',
+            b'<a:rPr lang="en-US" altLang="zh-CN" dirty="0"><a:hlinkClick r:id="rId7"/></a:rPr><a:t>pptx2img'),
+        "ppt/slides/_rels/slide1.xml.rels": add_rels(("rId7", "hyperlink", "https://example.com/"),
+                                                     ("rId8", "slide", "slide3.xml")),
+    })
+    links = slide_shapes(linked, [1], 1920, 1080)[1]["links"]
+    assert links == [{"slide": 3, "shape": 4, "box": box},
+                     {"url": "https://example.com/", "shape": 4, "box": box, "text": "pptx2img"}], links
+
+    def grouped(xfrm):
+        """Edit that puts the first shape of a slide in a group with this xfrm."""
+        start = (b'<p:grpSp><p:nvGrpSpPr><p:cNvPr id="9" name=""/><p:cNvGrpSpPr/><p:nvPr/></p:nvGrpSpPr>'
+                 b'<p:grpSpPr><a:xfrm>' + xfrm + b'</a:xfrm></p:grpSpPr><p:sp>')
+        return lambda data: data.replace(b"<p:sp>", start, 1).replace(b"</p:sp>", b"</p:sp></p:grpSp>", 1)
+    doubled = make_variant("group.pptx", {"ppt/slides/slide1.xml": grouped(
+        b'<a:off x="0" y="0"/><a:ext cx="200" cy="200"/><a:chOff x="0" y="0"/><a:chExt cx="100" cy="100"/>')})
+    big = slide_shapes(doubled, [1], 1920, 1080)[1]["shapes"][0]["box"]
+    assert all(abs(b - 2 * a) <= 1 for a, b in zip(box, big)), (box, big)
+    broken = make_variant("bad_xfrm.pptx", {
+        "ppt/slides/slide1.xml": grouped(b'<a:off x="0"/><a:ext cx="200" cy="200"/><a:chExt cx="100" cy="100"/>'),
+        "ppt/slides/slide4.xml": lambda data: data.replace(b'<a:off x="3554506" y="944015"/>', b'<a:off y="x"/>'),
+    })
+    maps = slide_shapes(broken, [1, 4], 1920, 1080)
+    assert maps[1]["shapes"] == [] and maps[4]["shapes"] == [], maps
+run_test_case(42, "Shape and hyperlink map", case_42)
+
 # Cleanup
 # clean_test_root() # Optional: Keep output for inspection
 print("\n------------------------------------------------")